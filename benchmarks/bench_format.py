@@ -0,0 +1,66 @@
+"""
+Compares formatting a list of 10,000 items using :meth:`FieldSet.format` with the uncompiled approach of calling
+``field.output(key, item)`` for every field of every item.
+
+Usage::
+
+    python benchmarks/bench_format.py
+"""
+from __future__ import print_function
+from collections import OrderedDict
+import os
+import sys
+import timeit
+
+# run from a checkout without installing the package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from flask_potion import fields
+from flask_potion.schema import FieldSet
+
+N_ITEMS = 10000
+REPEAT = 5
+
+
+class Item(object):
+    def __init__(self, i):
+        self.id = i
+        self.name = 'Item {}'.format(i)
+        self.description = 'An item'
+        self.rank = i % 10
+        self.score = i / 3.0
+        self.active = i % 2 == 0
+        self.tags = ['a', 'b', 'c']
+
+
+def uncompiled_format(fs, item):
+    return OrderedDict((key, field.output(key, item)) for key, field in fs.fields.items() if 'r' in field.io)
+
+
+def main():
+    fs = FieldSet({
+        "id": fields.Integer(io='r'),
+        "name": fields.String(),
+        "description": fields.String(nullable=True),
+        "rank": fields.Integer(),
+        "score": fields.Number(),
+        "active": fields.Boolean(),
+        "tags": fields.Array(fields.String()),
+        "extra": fields.Raw({}, nullable=True),
+    })
+
+    for name, items in (('objects', [Item(i) for i in range(N_ITEMS)]),
+                        ('dicts', [dict(vars(Item(i))) for i in range(N_ITEMS)])):
+        assert [fs.format(item) for item in items] == [uncompiled_format(fs, item) for item in items]
+
+        uncompiled = min(timeit.repeat(lambda: [uncompiled_format(fs, item) for item in items],
+                                       number=1, repeat=REPEAT))
+        compiled = min(timeit.repeat(lambda: [fs.format(item) for item in items],
+                                     number=1, repeat=REPEAT))
+
+        print('{} x {}: uncompiled {:.1f} ms, compiled {:.1f} ms ({:.1f}x)'.format(
+            N_ITEMS, name, uncompiled * 1000, compiled * 1000, uncompiled / compiled))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,19 @@ from collections import OrderedDict
 import inspect
 import operator
 from functools import partial
-from flask import current_app, make_response, json, Response, request
+from flask import current_app, make_response, json, Response, request, g
 from six import wraps
-from werkzeug.exceptions import HTTPException
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import HTTPException, BadRequest
+from werkzeug.test import EnvironBuilder
+from werkzeug.utils import cached_property
 from werkzeug.wrappers import BaseResponse
+from .codec import JSONCodec
 from .exceptions import PotionException
-from .routes import RouteSet, to_camel_case
-from .utils import unpack
+from .routes import RouteSet, to_camel_case, HTTP_METHODS
+from .schema import FieldSet
+from . import fields
+from .utils import unpack, ItemUrlMatcher
 from .resource import Resource, ModelResource
 
 __all__ = (
@@ -23,21 +29,23 @@ __all__ = (
     'schema',
     'signals',
     'contrib',
-    'natural_keys'
+    'natural_keys',
+    'codec'
 )
 
 
-def _make_response(data, code, headers=None):
+def _make_response(data, code, headers=None, codec=None):
     settings = {}
     if current_app.debug:
         settings.setdefault('indent', 4)
         settings.setdefault('sort_keys', True)
 
-    data = json.dumps(data, **settings)
+    codec = codec or JSONCodec()
+    data = codec.dumps(data, **settings)
 
     resp = make_response(data, code)
     resp.headers.extend(headers or {})
-    resp.headers['Content-Type'] = 'application/json'
+    resp.headers['Content-Type'] = codec.mimetype
     return resp
 
 
@@ -53,9 +61,14 @@ class Api(object):
     :param str title: an optional title for the schema
     :param str description: an optional description for the schema
     :param Manager default_manager: an optional manager to use as default. If SQLAlchemy is installed, will use :class:`contrib.alchemy.SQLAlchemyManager`
+    :param codec: an optional :class:`codec.JSONCodec` class or instance used to encode responses and decode
+        request bodies. Defaults to the ``POTION_JSON_CODEC`` configuration value, or :class:`codec.JSONCodec`
+    :param bool batch: whether to add a ``POST {prefix}/batch`` route for sending many requests at once;
+        see :meth:`batch`
     """
 
-    def __init__(self, app=None, decorators=None, prefix=None, title=None, description=None, default_manager=None):
+    def __init__(self, app=None, decorators=None, prefix=None, title=None, description=None, default_manager=None,
+                 codec=None, batch=False):
         self.app = app
         self.blueprint = None
         self.prefix = prefix or ''
@@ -65,6 +78,9 @@ class Api(object):
         self.endpoints = set()
         self.resources = {}
         self.views = []
+        self.codec = codec
+        self.batch_enabled = batch
+        self._schema_cache = {}
 
         self.default_manager = None
         if default_manager is None:
@@ -90,6 +106,7 @@ class Api(object):
 
     def _deferred_blueprint_init(self, setup_state):
         self.prefix = ''.join((setup_state.url_prefix or '', self.prefix))
+        self._schema_cache.clear()
 
         for resource in self.resources.values():
             resource.route_prefix = ''.join((self.prefix, '/', resource.meta.name))
@@ -102,22 +119,56 @@ class Api(object):
         """
         app.config.setdefault('POTION_MAX_PER_PAGE', 100)
         app.config.setdefault('POTION_DEFAULT_PER_PAGE', 20)
+        app.config.setdefault('POTION_MAX_EMBED_DEPTH', 2)
         app.config.setdefault('POTION_DECORATE_SCHEMA_ENDPOINTS', True)
+        app.config.setdefault('POTION_JSON_CODEC', None)
+
+        if self.codec is None:
+            self.codec = app.config['POTION_JSON_CODEC'] or JSONCodec
+
+        if isinstance(self.codec, type):
+            self.codec = self.codec()
 
         self._register_view(app,
                             rule=''.join((self.prefix, '/schema')),
-                            view_func=self._schema_view,
+                            view_func=self._cached_schema(self._schema_view, 'schema'),
                             endpoint='schema',
                             methods=['GET'],
                             relation='describedBy')
 
+        if self.batch_enabled:
+            self._register_view(app,
+                                rule=''.join((self.prefix, '/batch')),
+                                view_func=self._batch_view,
+                                endpoint='batch',
+                                methods=['POST'],
+                                relation='batch')
+
         for route, resource, view_func, endpoint, methods, relation in self.views:
             rule = route.rule_factory(resource)
             self._register_view(app, rule, view_func, endpoint, methods, relation)
 
+        for resource in self.resources.values():
+            self._init_item_url_matcher(app, resource)
+
         app.handle_exception = partial(self._exception_handler, app.handle_exception)
         app.handle_user_exception = partial(self._exception_handler, app.handle_user_exception)
 
+    def _init_item_url_matcher(self, app, resource):
+        id_converter = resource.meta.get('id_converter')
+
+        if 'self' not in resource.routes or id_converter not in app.url_map.converters:
+            resource.item_url_matcher = None
+            return
+
+        prefix = resource.route_prefix + '/'
+        reserved = [rule.rule for rule in app.url_map.iter_rules()
+                    if not rule.arguments and rule.rule.startswith(prefix)]
+
+        resource.item_url_matcher = ItemUrlMatcher(resource.route_prefix,
+                                                   app.url_map.converters[id_converter](app.url_map),
+                                                   reserved)
+
     def _register_view(self, app, rule, view_func, endpoint, methods, relation):
         decorate_view_func = relation != 'describedBy' or app.config['POTION_DECORATE_SCHEMA_ENDPOINTS']
 
@@ -146,20 +197,68 @@ class Api(object):
             return _make_response({
                 'status': e.code,
                 'message': e.description
-            }, e.code)
+            }, e.code, codec=self.codec)
 
         return original_handler(e)
 
     def output(self, view):
         @wraps(view)
         def wrapper(*args, **kwargs):
+            g._potion_codec = self.codec
             resp = view(*args, **kwargs)
 
             if isinstance(resp, BaseResponse):
                 return resp
 
             data, code, headers = unpack(resp)
-            return _make_response(data, code, headers)
+            return _make_response(data, code, headers, codec=self.codec)
+
+        return wrapper
+
+    def _conditional(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            resp = view(*args, **kwargs)
+
+            if not isinstance(resp, BaseResponse):
+                data, code, headers = unpack(resp)
+                resp = _make_response(data, code, headers, codec=self.codec)
+
+            if resp.status_code == 200 and not resp.is_streamed:
+                if 'ETag' not in resp.headers:
+                    resp.add_etag()
+                resp.make_conditional(request)
+            return resp
+
+        return wrapper
+
+    def _cached_schema(self, view, key):
+        """
+        Schemas only change when routes are added, so they are serialized once and then served from memory
+        with an ETag until :meth:`add_route` clears the cache.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache_key = (current_app._get_current_object(), key)
+
+            try:
+                data, headers = self._schema_cache[cache_key]
+            except KeyError:
+                resp = view(*args, **kwargs)
+
+                if not isinstance(resp, BaseResponse):
+                    data, code, headers = unpack(resp)
+                    resp = _make_response(data, code, headers, codec=self.codec)
+
+                if resp.status_code != 200:
+                    return resp
+
+                resp.add_etag()
+                data, headers = resp.get_data(), Headers(resp.headers)
+                self._schema_cache[cache_key] = data, headers
+
+            resp = current_app.response_class(data, 200, headers)
+            return resp.make_conditional(request)
 
         return wrapper
 
@@ -180,6 +279,123 @@ class Api(object):
 
         return OrderedDict(schema), 200, {'Content-Type': 'application/schema+json'}
 
+    def _batch_view(self):
+        data = self._batch_schema.parse_request(request)
+        return self.batch(data['operations'], atomic=data['atomic'], stop_on_error=data['stop_on_error'])
+
+    @cached_property
+    def _batch_schema(self):
+        return FieldSet({
+            "operations": fields.Array(fields.Raw({
+                "type": "object",
+                "properties": {
+                    "method": {"type": "string", "enum": list(HTTP_METHODS)},
+                    "path": {"type": "string", "pattern": "^/"},
+                    "body": {}
+                },
+                "required": ["method", "path"],
+                "additionalProperties": False
+            })),
+            "atomic": fields.Boolean(default=False),
+            "stop_on_error": fields.Boolean(default=False)
+        }, required_fields=["operations"])
+
+    def _dispatch(self, method, path, body=None):
+        batch_endpoint = 'batch'
+        if self.blueprint:
+            batch_endpoint = '{}.batch'.format(self.blueprint.name)
+
+        builder = EnvironBuilder(path=path,
+                                 base_url=request.url_root,
+                                 method=method,
+                                 headers=[(key, value) for key, value in request.headers
+                                          if key not in ('Content-Type', 'Content-Length')],
+                                 data=self.codec.dumps(body) if body is not None else None,
+                                 content_type=self.codec.mimetype if body is not None else None)
+
+        with current_app.request_context(builder.get_environ()):
+            if request.url_rule is not None and request.url_rule.endpoint == batch_endpoint:
+                resp = current_app.make_response(current_app.handle_user_exception(
+                    BadRequest('Batch requests cannot be nested.')))
+            else:
+                # runs the before_request and after_request functions of the application, as a request would
+                resp = current_app.full_dispatch_request()
+            data = resp.get_data()
+
+        if data and resp.mimetype in (self.codec.mimetype, 'application/schema+json'):
+            data = self.codec.loads(data)
+        elif data:
+            data = data.decode('utf-8')
+        else:
+            data = None
+
+        headers = {key: value for key, value in resp.headers if key not in ('Content-Type', 'Content-Length')}
+        return OrderedDict([('status', resp.status_code), ('headers', headers), ('body', data)])
+
+    def batch(self, operations, atomic=False, stop_on_error=False):
+        """
+        Dispatches a list of operations to the views of the application within the current request and returns
+        their responses. This is the implementation of the ``POST {prefix}/batch`` route, which accepts a JSON object
+        in the format::
+
+            {
+                "operations": [
+                    {"method": "POST", "path": "/book", "body": {"title": "Foo"}},
+                    {"method": "GET", "path": "/book?where={\"title\": \"Foo\"}"}
+                ],
+                "atomic": false,
+                "stop_on_error": false
+            }
+
+        The response is a list of ``{"status": .., "headers": {..}, "body": ..}`` objects, one per completed
+        operation. Every operation is sent with the headers of the batch request and passes through the
+        ``before_request`` and ``after_request`` functions of the application, like any other request.
+
+        :param list operations: list of dictionaries with ``method``, ``path`` and optional ``body``
+        :param bool atomic: run all operations in a single transaction on the managers of this API, using
+            :meth:`manager.Manager.begin` and :meth:`manager.Manager.commit`. The transaction is rolled back and
+            processing stops at the first operation with an error status; every result then has
+            ``"rolled_back": true``. Atomic batches are rejected with ``400 Bad Request`` unless every manager
+            supports transactions.
+        :param bool stop_on_error: stop processing at the first operation with an error status
+        """
+        managers = []
+        if atomic:
+            managers = [resource.manager for resource in self.resources.values()
+                        if getattr(resource, 'manager', None) is not None]
+
+            unsupported = sorted(manager.resource.meta.name for manager in managers if not manager.TRANSACTIONS)
+            if unsupported:
+                raise BadRequest('Atomic batches are not supported by the managers of: {}'.format(
+                    ', '.join(unsupported)))
+
+        for manager in managers:
+            manager.begin()
+
+        results = []
+        try:
+            for operation in operations:
+                result = self._dispatch(operation['method'], operation['path'], operation.get('body'))
+                results.append(result)
+
+                if result['status'] >= 400:
+                    if atomic:
+                        for manager in managers:
+                            manager.rollback()
+                        for result in results:
+                            result['rolled_back'] = True
+                        return results
+                    if stop_on_error:
+                        break
+        except Exception:
+            for manager in managers:
+                manager.rollback()
+            raise
+
+        for manager in managers:
+            manager.commit()
+        return results
+
     def add_route(self, route, resource, endpoint=None, decorator=None):
         endpoint = endpoint or '_'.join((resource.meta.name, route.relation))
         methods = [route.method]
@@ -187,9 +403,16 @@ class Api(object):
 
         view_func = route.view_factory(endpoint, resource)
 
+        if route.relation == 'describedBy':
+            view_func = self._cached_schema(view_func, endpoint)
+        elif route.method == 'GET' and resource.meta.get('etag'):
+            view_func = self._conditional(view_func)
+
         if decorator:
             view_func = decorator(view_func)
 
+        self._schema_cache.clear()
+
         if self.app and not self.blueprint:
             self._register_view(self.app, rule, view_func, endpoint, methods, route.relation)
         else:
@@ -236,3 +459,6 @@ class Api(object):
                 self.add_route(route, resource)
 
         self.resources[resource.meta.name] = resource
+
+        if self.app and not self.blueprint:
+            self._init_item_url_matcher(self.app, resource)
@@ -0,0 +1,489 @@
+import hashlib
+import inspect
+import time
+import uuid
+
+from flask import request, has_request_context, _request_ctx_stack
+
+from . import signals
+from .fields import ToOne
+from .instances import Pagination
+from .routes import Relation
+from .utils import get_value, LRUCache
+
+
+class Cache(object):
+    """
+    The interface of the stores used by :class:`ManagerCache`, which is implemented by :class:`LocalCache`.
+
+    External stores, such as Memcached or Redis, can be used by implementing these methods in an adapter. Values are
+    copies of items made by :meth:`manager.Manager._to_cache` and tuples of such copies, so an external store needs to
+    serialize them, for instance using :mod:`pickle`.
+    """
+
+    def get(self, key):
+        """
+        :param str key:
+        :return: the value stored under ``key``, or ``None`` if there is none or it has expired
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value, timeout=None):
+        """
+        :param str key:
+        :param value:
+        :param int timeout: number of seconds after which the value expires, or ``None`` if it does not expire
+        """
+        raise NotImplementedError()
+
+    def delete(self, key):
+        """
+        :param str key:
+        """
+        raise NotImplementedError()
+
+
+class LocalCache(Cache):
+    """
+    A per-process cache that discards the least recently used entries first.
+
+    :param int maxsize: maximum number of entries
+    """
+
+    def __init__(self, maxsize=1000):
+        self._entries = LRUCache(maxsize)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires = entry
+        if expires is not None and expires <= time.time():
+            self._entries.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        self._entries.set(key, (value, None if timeout is None else time.time() + timeout))
+
+    def delete(self, key):
+        self._entries.delete(key)
+
+    def info(self):
+        """
+        :return: a :class:`utils.CacheInfo` tuple of hits, misses, maximum size and current size
+        """
+        return self._entries.info()
+
+
+def _relation_target(resource, attribute):
+    for key, field in resource.schema.fields.items():
+        if (field.attribute or key) == attribute:
+            return getattr(getattr(field, 'container', field), 'target', None)
+
+    for name, relation in inspect.getmembers(resource, lambda m: isinstance(m, Relation)):
+        if relation.attribute == attribute:
+            return relation.target
+    return None
+
+
+class ManagerCache(object):
+    """
+    A read-through cache for the items and pages of items read by a manager, which is set up when ``Meta.cache`` is
+    enabled.
+
+    Items are cached by id, and pages by their pagination, filter, sort and field parameters. Managers that filter
+    items by permission keep separate entries for each :meth:`manager.Manager._permission_key`. The cache is only read
+    in ``GET`` and ``HEAD`` requests, so that items are always changed in their current state, and not while a
+    transaction is open, such as in an atomic batch, so that changes that are rolled back are never cached.
+
+    Entries hold copies of the items made by :meth:`manager.Manager._to_cache` rather than the items themselves, and pages
+    are rebuilt as :class:`instances.Pagination` objects from their items, total and whether there is a next page.
+
+    Entries are invalidated through signals: an item when it is updated or deleted or when its relations change, and
+    every page whenever any item is created, updated, deleted or related. Items referenced through a
+    :class:`fields.ToOne` field by an item of any resource of the same API are invalidated when that item changes,
+    since they may include it through a back-reference. Updates and deletions that do not send signals invalidate all
+    entries of the resource.
+
+    :param manager: a :class:`manager.Manager` instance
+    :param Cache store: where entries are stored
+    :param int timeout: number of seconds after which entries expire, or ``None``
+    """
+
+    def __init__(self, manager, store, timeout=None):
+        self.manager = manager
+        self.store = store
+        self.timeout = timeout
+
+        self._prefix = 'potion/{}/'.format(manager.resource.meta.name)
+        self._references = {}
+
+        # signals of other resources are received too, as their items may reference items of this resource
+        for signal in (signals.before_update, signals.after_update, signals.before_delete, signals.after_delete):
+            signal.connect(self._on_change)
+
+        signals.after_create.connect(self._on_create)
+
+        for signal in (signals.before_add_to_relation,
+                       signals.after_add_to_relation,
+                       signals.before_remove_from_relation,
+                       signals.after_remove_from_relation):
+            signal.connect(self._on_relation_change)
+
+    def _active(self):
+        return has_request_context() and request.method in ('GET', 'HEAD') and not self.manager._in_transaction()
+
+    def _generation(self, name):
+        key = self._prefix + name
+        generation = self.store.get(key)
+
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.store.set(key, generation)
+        return generation
+
+    def _scope(self):
+        permission_key = self.manager._permission_key()
+        if permission_key is None:
+            return 'all'
+        return hashlib.sha1(repr(permission_key).encode('utf-8')).hexdigest()
+
+    def _item_key(self, id):
+        # an item is cached for each permission scope, which are invalidated together through the item generation
+        return '{}items/{}/{!r}/{}/{}'.format(self._prefix,
+                                              self._generation('items'),
+                                              id,
+                                              self._generation('item/{!r}'.format(id)),
+                                              self._scope())
+
+    def _page_key(self, page, per_page, where, sort, options):
+        params = (self._scope(),
+                  page,
+                  per_page,
+                  self.manager._where_key(where),
+                  tuple((attribute, reverse) for field, attribute, reverse in sort or ()),
+                  sorted(options.items()))
+
+        return '{}pages/{}/{}/{}'.format(self._prefix,
+                                         self._generation('items'),
+                                         self._generation('pages'),
+                                         hashlib.sha1(repr(params).encode('utf-8')).hexdigest())
+
+    def invalidate_item(self, id):
+        """
+        Invalidates a cached item and every cached page.
+        """
+        self.store.delete('{}item/{!r}'.format(self._prefix, id))
+        self.invalidate_pages()
+
+    def invalidate_pages(self):
+        self.store.set(self._prefix + 'pages', uuid.uuid4().hex)
+
+    def invalidate(self):
+        """
+        Invalidates every cached item and page.
+        """
+        self.store.set(self._prefix + 'items', uuid.uuid4().hex)
+
+    def _id(self, item):
+        return get_value(self.manager.id_attribute, item, None)
+
+    def _referencing_attributes(self, resource):
+        try:
+            return self._references[resource]
+        except KeyError:
+            pass
+
+        attributes = self._references[resource] = [
+            field.attribute or key for key, field in resource.schema.fields.items()
+            if isinstance(field, ToOne) and field.target is self.manager.resource]
+        return attributes
+
+    def _is_related(self, resource):
+        return getattr(resource, 'api', None) is not None and resource.api is self.manager.resource.api
+
+    def _invalidate_referenced(self, sender, item):
+        if not self._is_related(sender):
+            return
+
+        for attribute in self._referencing_attributes(sender):
+            foreign_key = sender.manager.foreign_key_attribute(attribute, self.manager.resource)
+
+            if foreign_key is not None:
+                id = get_value(foreign_key, item, None)
+            else:
+                target = get_value(attribute, item, None)
+                id = None if target is None else self._id(target)
+
+            if id is not None:
+                self.invalidate_item(id)
+
+    def _on_create(self, sender, item, **kwargs):
+        if sender is self.manager.resource:
+            self.invalidate_pages()
+        self._invalidate_referenced(sender, item)
+
+    def _on_change(self, sender, item, **kwargs):
+        if sender is self.manager.resource:
+            self.invalidate_item(self._id(item))
+        self._invalidate_referenced(sender, item)
+
+    def _on_relation_change(self, sender, item, attribute, child, **kwargs):
+        if sender is self.manager.resource:
+            self.invalidate_item(self._id(item))
+
+        # the relation may be reflected in a back-reference of the child
+        if self._is_related(sender) and _relation_target(sender, attribute) is self.manager.resource:
+            self.invalidate_item(self._id(child))
+
+    def read(self, read):
+        """
+        Wraps :meth:`manager.Manager.read`. Items are always read and cached whole, even when only some of their
+        attributes are requested.
+        """
+        def cached_read(id, attributes=None, embed=None):
+            kwargs = {'embed': embed} if embed else {}
+
+            if not self._active():
+                if attributes is not None:
+                    kwargs['attributes'] = attributes
+                return read(id, **kwargs)
+
+            key = self._item_key(id)
+            item = self.store.get(key)
+
+            if item is not None:
+                return self.manager._from_cache(item)
+
+            item = read(id, **kwargs)
+            self.store.set(key, self.manager._to_cache(item), self.timeout)
+            return item
+        return cached_read
+
+    def paginated_instances(self, paginated_instances):
+        """
+        Wraps :meth:`manager.Manager.paginated_instances`.
+        """
+        def cached_paginated_instances(page, per_page, where=None, sort=None, **kwargs):
+            if not self._active():
+                return paginated_instances(page, per_page, where, sort, **kwargs)
+
+            # cached pages keep their items, so they are not read while streamed
+            kwargs.pop('stream', None)
+            key = self._page_key(page, per_page, where, sort, kwargs)
+            entry = self.store.get(key)
+
+            if entry is not None:
+                items, total, has_next = entry
+                return Pagination([self.manager._from_cache(item) for item in items], page, per_page, total,
+                                  has_next=has_next)
+
+            pagination = paginated_instances(page, per_page, where, sort, **kwargs)
+            items = [self.manager._to_cache(item) for item in pagination.items]
+            self.store.set(key, (items, pagination.total, pagination.has_next), self.timeout)
+            return pagination
+        return cached_paginated_instances
+
+    def invalidating(self, method):
+        """
+        Wraps a manager method that changes items without sending signals, such as
+        :meth:`manager.Manager.update_where`, so that it invalidates every entry.
+        """
+        def invalidating_method(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.invalidate()
+        return invalidating_method
+
+
+class IdentityMap(object):
+    """
+    Memoizes the items read by managers within a request, so that an item referenced several times in a request --
+    by the route, by a :class:`natural_keys.Key` and by the view -- is only read once. Items are kept by
+    ``(resource, id)`` and natural keys by ``(key, value)``.
+
+    An identity map is kept on each request context and discarded with it. Items are forgotten when they are updated,
+    deleted or related through their manager, and every item of a resource is forgotten when items are changed in bulk
+    using :meth:`manager.Manager.update_where` or :meth:`manager.Manager.delete_where`.
+    """
+
+    def __init__(self):
+        self._items = {}
+        self._keys = {}
+
+    @staticmethod
+    def current(create=True):
+        """
+        :param bool create: whether to create an identity map if the current request does not have one yet
+        :return: the identity map of the current request, or ``None`` outside of a request
+        """
+        ctx = _request_ctx_stack.top
+        if ctx is None:
+            return None
+
+        identity_map = getattr(ctx, 'potion_identity_map', None)
+        if identity_map is None and create:
+            identity_map = ctx.potion_identity_map = IdentityMap()
+        return identity_map
+
+    def get(self, resource, id, attributes=None):
+        """
+        :param attributes: the attributes that must have been read, or ``None`` if the whole item is needed
+        :return: the item, or ``None`` if it has not been read with at least ``attributes``
+        """
+        try:
+            item, read_attributes = self._items[(resource, id)]
+        except (KeyError, TypeError):
+            return None
+
+        if read_attributes is None or (attributes is not None and set(attributes) <= read_attributes):
+            return item
+        return None
+
+    def add(self, resource, id, item, attributes=None):
+        try:
+            key = (resource, id)
+            if attributes is not None and key in self._items:
+                return
+            self._items[key] = (item, None if attributes is None else frozenset(attributes))
+        except TypeError:
+            pass
+
+    def get_key(self, key, value):
+        """
+        :return: a ``(resource, id)`` tuple for an item read using a natural key, or ``None``
+        """
+        try:
+            return self._keys.get((key, _hashable(value)))
+        except TypeError:
+            return None
+
+    def add_key(self, key, value, resource, id):
+        try:
+            self._keys[(key, _hashable(value))] = (resource, id)
+        except TypeError:
+            pass
+
+    def discard(self, resource, id):
+        try:
+            self._items.pop((resource, id), None)
+        except TypeError:
+            return
+
+        for key, identity in list(self._keys.items()):
+            if identity == (resource, id):
+                del self._keys[key]
+
+    def clear(self, resource):
+        for identity in [identity for identity in self._items if identity[0] is resource]:
+            del self._items[identity]
+
+        for key, identity in list(self._keys.items()):
+            if identity[0] is resource:
+                del self._keys[key]
+
+    @staticmethod
+    def read(manager, read):
+        """
+        Wraps :meth:`manager.Manager.read`.
+        """
+        resource = manager.resource
+
+        def identity_mapped_read(id, attributes=None, embed=None):
+            kwargs = {'embed': embed} if embed else {}
+            if attributes is not None:
+                kwargs['attributes'] = attributes
+
+            identity_map = IdentityMap.current()
+            if identity_map is None:
+                return read(id, **kwargs)
+
+            item = identity_map.get(resource, id, attributes)
+            if item is None:
+                item = read(id, **kwargs)
+                identity_map.add(resource, id, item, attributes)
+            return item
+        return identity_mapped_read
+
+    @staticmethod
+    def read_many(manager, read_many):
+        """
+        Wraps :meth:`manager.Manager.read_many`, so that only items not in the identity map are read.
+        """
+        resource = manager.resource
+
+        def identity_mapped_read_many(ids):
+            identity_map = IdentityMap.current()
+            if identity_map is None:
+                return read_many(ids)
+
+            items = [identity_map.get(resource, id) for id in ids]
+            missing = [id for id, item in zip(ids, items) if item is None]
+
+            if missing:
+                read_items = dict(zip(missing, read_many(missing)))
+                for id, item in read_items.items():
+                    identity_map.add(resource, id, item)
+                items = [read_items[id] if item is None else item for id, item in zip(ids, items)]
+            return items
+        return identity_mapped_read_many
+
+    @staticmethod
+    def forgetting(manager, method):
+        """
+        Wraps a manager method that changes an item, such as :meth:`manager.Manager.update`, so that it forgets the
+        item even if the manager does not send signals.
+        """
+        resource = manager.resource
+
+        def forgetting_method(item, *args, **kwargs):
+            try:
+                return method(item, *args, **kwargs)
+            finally:
+                identity_map = IdentityMap.current(create=False)
+                if identity_map is not None:
+                    identity_map.discard(resource, get_value(manager.id_attribute, item, None))
+        return forgetting_method
+
+    @staticmethod
+    def clearing(resource, method):
+        """
+        Wraps a manager method that changes items without sending signals, such as
+        :meth:`manager.Manager.update_where`, so that it forgets every item of the resource.
+        """
+        def clearing_method(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                identity_map = IdentityMap.current(create=False)
+                if identity_map is not None:
+                    identity_map.clear(resource)
+        return clearing_method
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def _forget_item(sender, item, **kwargs):
+    identity_map = IdentityMap.current(create=False)
+    manager = getattr(sender, 'manager', None)
+
+    if identity_map is not None and manager is not None:
+        identity_map.discard(sender, get_value(manager.id_attribute, item, None))
+
+
+for _signal in (signals.before_update,
+                signals.after_update,
+                signals.before_delete,
+                signals.after_delete,
+                signals.before_add_to_relation,
+                signals.after_add_to_relation,
+                signals.before_remove_from_relation,
+                signals.after_remove_from_relation):
+    _signal.connect(_forget_item)
@@ -0,0 +1,169 @@
+from __future__ import absolute_import
+import base64
+import decimal
+import json as _json
+
+from flask import json, current_app, g, request, has_app_context
+
+try:
+    from json.encoder import c_make_encoder
+except ImportError:
+    c_make_encoder = None
+
+
+class JSONCodec(object):
+    """
+    The default codec used by :class:`Api` to serialize responses and parse request bodies. Delegates to
+    :mod:`flask.json`, so it respects the application's ``json_encoder``, ``json_decoder``, ``JSON_AS_ASCII``
+    and ``JSON_SORT_KEYS`` settings.
+
+    Custom codecs must implement :meth:`dumps` and :meth:`loads` and are passed to :class:`Api` either as the
+    ``codec`` argument or through the ``POTION_JSON_CODEC`` configuration key.
+    """
+    mimetype = 'application/json'
+
+    def dumps(self, data, **settings):
+        """
+        :param data: a JSON-serializable Python object
+        :param settings: keyword arguments such as ``indent`` and ``sort_keys``
+        :return: a JSON-formatted string
+        """
+        return json.dumps(data, **settings)
+
+    def loads(self, s, **kwargs):
+        """
+        :param s: a JSON-formatted string or bytes
+        :param kwargs: keyword arguments such as ``object_pairs_hook``
+        :raises ValueError: if ``s`` is not valid JSON
+        """
+        return json.loads(s, **kwargs)
+
+    def get_json(self, request, silent=False):
+        """
+        Decodes the body of a request. Returns ``None`` if the request mimetype is not JSON.
+
+        :param request: Flask request object
+        :param bool silent: when ``True``, returns ``None`` instead of raising an error on invalid JSON
+        """
+        return request.get_json(silent=silent)
+
+
+class FastJSONCodec(JSONCodec):
+    """
+    A faster drop-in replacement for :class:`JSONCodec`.
+
+    The codec builds one C-accelerated encoder per application configuration and reuses it for every response,
+    skipping the per-call encoder instantiation and circular reference checks of :func:`flask.json.dumps`.
+    Output is byte-for-byte identical to :class:`JSONCodec` for every value :class:`JSONCodec` can serialize.
+
+    In addition, values the application's ``json_encoder`` cannot serialize are encoded if they are
+    :class:`decimal.Decimal`, as numbers (or as strings where a number would lose precision), or :class:`bytes`, as
+    base64-encoded strings.
+    """
+
+    def __init__(self):
+        self._encoders = {}
+        self._decoder = _json.JSONDecoder()
+
+    @staticmethod
+    def _encoder_class(app):
+        bp = app.blueprints.get(request.blueprint) if request else None
+        return bp.json_encoder if bp and bp.json_encoder else app.json_encoder
+
+    @staticmethod
+    def _default(encoder):
+        fallback = encoder.default
+
+        def default(o):
+            try:
+                return fallback(o)
+            except TypeError:
+                if isinstance(o, decimal.Decimal):
+                    number = float(o)
+                    # decimals that a float cannot represent exactly are encoded as strings
+                    if decimal.Decimal(repr(number)) == o:
+                        return number
+                    return str(o)
+                if isinstance(o, bytes):
+                    return base64.b64encode(o).decode('ascii')
+                raise
+        return default
+
+    def _encoder(self, app, sort_keys):
+        encoder_class = self._encoder_class(app)
+        ensure_ascii = app.config['JSON_AS_ASCII']
+        key = (encoder_class, ensure_ascii, sort_keys)
+
+        try:
+            return self._encoders[key]
+        except KeyError:
+            pass
+
+        encoder = encoder_class(ensure_ascii=ensure_ascii, sort_keys=sort_keys, check_circular=False)
+        encoder.default = default = self._default(encoder)
+
+        if c_make_encoder is not None:
+            if ensure_ascii:
+                encode_string = _json.encoder.encode_basestring_ascii
+            else:
+                encode_string = _json.encoder.encode_basestring
+
+            iterencode = c_make_encoder(None, default, encode_string, None,
+                                        encoder.key_separator, encoder.item_separator,
+                                        sort_keys, encoder.skipkeys, encoder.allow_nan)
+        else:
+            iterencode = None
+
+        if iterencode is None:
+            encode = encoder.encode
+        else:
+            def encode(data):
+                return ''.join(iterencode(data, 0))
+
+        self._encoders[key] = encode
+        return encode
+
+    def dumps(self, data, **settings):
+        app = current_app._get_current_object()
+        sort_keys = settings.pop('sort_keys', app.config['JSON_SORT_KEYS'])
+
+        # the C encoder does not support indentation, which is only used in debug mode.
+        if settings:
+            encoder = self._encoder_class(app)(sort_keys=sort_keys,
+                                               ensure_ascii=app.config['JSON_AS_ASCII'],
+                                               **settings)
+            encoder.default = self._default(encoder)
+            return encoder.encode(data)
+
+        return self._encoder(app, sort_keys)(data)
+
+    def loads(self, s, **kwargs):
+        if isinstance(s, bytes):
+            s = s.decode('utf-8')
+        if kwargs:
+            return _json.loads(s, **kwargs)
+        return self._decoder.decode(s)
+
+    def get_json(self, request, silent=False):
+        if not request.is_json:
+            return None
+
+        try:
+            return self.loads(request.get_data(cache=True))
+        except ValueError as e:
+            if silent:
+                return None
+            return request.on_json_loading_failed(e)
+
+
+def current_codec():
+    """
+    Returns the codec of the :class:`Api` handling the current request, or a :class:`JSONCodec` outside of
+    Potion views.
+    """
+    if has_app_context():
+        return g.get('_potion_codec', None) or _default_codec
+    return _default_codec
+
+
+_default_codec = JSONCodec()
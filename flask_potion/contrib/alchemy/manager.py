@@ -1,22 +1,42 @@
+import json
+
+import six
 from flask import current_app
 from flask_sqlalchemy import Pagination as SAPagination, get_state
-from sqlalchemy import String, or_, and_
+from werkzeug.utils import cached_property
+from sqlalchemy import String, or_, and_, false, inspect
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import class_mapper, aliased
-from sqlalchemy.orm.attributes import ScalarObjectAttributeImpl
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import class_mapper, aliased, load_only, joinedload, selectinload, make_transient_to_detached, \
+    ColumnProperty, RelationshipProperty
+from sqlalchemy.orm.attributes import ScalarObjectAttributeImpl, set_committed_value
+from sqlalchemy.orm.interfaces import MANYTOONE
 from sqlalchemy.orm.collections import InstrumentedList
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.sql.expression import Executable, ClauseElement
 
 from flask_potion import fields
 from flask_potion.contrib.alchemy.filters import FILTER_NAMES, FILTERS_BY_TYPE, SQLAlchemyBaseFilter
-from flask_potion.exceptions import ItemNotFound, DuplicateKey, BackendConflict
-from flask_potion.instances import Pagination
+from flask_potion.exceptions import ItemNotFound, DuplicateKey, BackendConflict, PageNotFound
+from flask_potion.instances import Pagination, KeysetPagination
 from flask_potion.manager import RelationalManager
 from flask_potion.signals import before_add_to_relation, after_add_to_relation, before_remove_from_relation, \
     after_remove_from_relation, before_create, after_create, before_update, after_update, before_delete, after_delete
 from flask_potion.utils import get_value
 
+TRANSACTION_DEPTH_KEY = 'potion_transaction_depth'
+
+
+class _Explain(Executable, ClauseElement):
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
 
 class SQLAlchemyManager(RelationalManager):
     """
@@ -24,15 +44,20 @@ class SQLAlchemyManager(RelationalManager):
 
     Expects that ``Meta.model`` contains a SQLALchemy declarative model.
 
+    References in the resource schema are loaded with the pages of items they belong to: ``ToMany`` collections using
+    ``selectinload`` and ``ToOne`` references using ``joinedload``, unless the reference can be formatted from a
+    foreign key column or is left out by ``?fields=``. Options in ``Meta.query_options`` are applied after these.
     """
     FILTER_NAMES = FILTER_NAMES
     FILTERS_BY_TYPE = FILTERS_BY_TYPE
     PAGINATION_TYPES = (Pagination, SAPagination)
+    TRANSACTIONS = True
 
     def _init_model(self, resource, model, meta):
         mapper = class_mapper(model)
 
         self.model = model
+        self._foreign_key_attributes = {}
 
         if meta.id_attribute:
             self.id_column = getattr(model, resource.meta.id_attribute)
@@ -146,12 +171,114 @@ class SQLAlchemyManager(RelationalManager):
     def _get_session():
         return get_state(current_app).db.session
 
+    @staticmethod
+    def _snapshot(item, relationships=True):
+        state = inspect(item)
+        values = {prop.key: state.dict[prop.key] for prop in state.mapper.column_attrs if prop.key in state.dict}
+        related = {}
+
+        if relationships:
+            for prop in state.mapper.relationships:
+                if prop.key in state.dict:
+                    value = state.dict[prop.key]
+                    if prop.uselist:
+                        related[prop.key] = [SQLAlchemyManager._snapshot(v, False) for v in value]
+                    else:
+                        related[prop.key] = None if value is None else SQLAlchemyManager._snapshot(value, False)
+
+        return state.mapper.class_, values, related
+
+    @staticmethod
+    def _from_snapshot(snapshot):
+        model, values, related = snapshot
+        item = class_mapper(model).class_manager.new_instance()
+
+        for key, value in values.items():
+            set_committed_value(item, key, value)
+        for key, value in related.items():
+            if isinstance(value, list):
+                value = [SQLAlchemyManager._from_snapshot(v) for v in value]
+            elif value is not None:
+                value = SQLAlchemyManager._from_snapshot(value)
+            set_committed_value(item, key, value)
+
+        make_transient_to_detached(item)
+        return item
+
+    def _to_cache(self, item):
+        # the references that will be formatted are loaded first, since they are copied along with the item, so that
+        # the cached item is not bound to the session it was read in, which may be rolled back
+        for attribute, option in self._schema_query_options:
+            getattr(item, attribute)
+        return self._snapshot(item)
+
+    def _from_cache(self, snapshot):
+        # attach a copy of the cached item to the current session without querying it again
+        return self._get_session().merge(self._from_snapshot(snapshot), load=False)
+
     @staticmethod
     def _is_change(a, b):
         return (a is None) != (b is None) or a != b
 
+    def foreign_key_attribute(self, attribute, target_resource):
+        try:
+            return self._foreign_key_attributes[attribute]
+        except KeyError:
+            pass
+
+        mapper = class_mapper(self.model)
+        prop = mapper.attrs.get(attribute)
+        foreign_key = None
+
+        if isinstance(prop, RelationshipProperty) and prop.direction is MANYTOONE \
+                and len(prop.local_remote_pairs) == 1 \
+                and isinstance(target_resource.manager, SQLAlchemyManager) \
+                and prop.mapper.class_ is target_resource.manager.model:
+            local, remote = prop.local_remote_pairs[0]
+            if prop.mapper.get_property_by_column(remote).key == target_resource.manager.id_attribute:
+                foreign_key = mapper.get_property_by_column(local).key
+
+        self._foreign_key_attributes[attribute] = foreign_key
+        return foreign_key
+
+    @cached_property
+    def _schema_query_options(self):
+        # resolved on first use, since the targets of references may be added to the API after this resource
+        mapper = class_mapper(self.model)
+        options = []
+
+        for key, field in self.resource.schema.readable_fields.items():
+            attribute = field.attribute or key
+            prop = mapper.attrs.get(attribute)
+
+            # leave relationships with an explicit loading strategy alone
+            if not isinstance(prop, RelationshipProperty) or prop.lazy != 'select':
+                continue
+
+            if isinstance(field, fields.ToMany):
+                options.append((attribute, selectinload(getattr(self.model, attribute))))
+            elif isinstance(field, fields.ToOne) and self.foreign_key_attribute(attribute, field.target) is None:
+                options.append((attribute, joinedload(getattr(self.model, attribute))))
+
+        return options
+
+    def _query_schema_options(self, query, attributes=None):
+        """
+        Adds the options that load the references of a page of items that will be formatted, except those of
+        relationships not in ``attributes``.
+        """
+        options = [option for attribute, option in self._schema_query_options
+                   if attributes is None or attribute in attributes]
+
+        if not options:
+            return query
+
+        # options in Meta.query_options take precedence
+        return query.options(*options).options(*self.resource.meta.get('query_options', ()))
+
     def _query(self):
         query = self.model.query
+
         try:
             query_options = self.resource.meta.query_options
         except KeyError:
@@ -188,13 +315,60 @@ class SQLAlchemyManager(RelationalManager):
             return expressions[0]
         return and_(*expressions)
 
+    def _nullable(self, attribute):
+        try:
+            return any(column.nullable for column in getattr(self.model, attribute).property.columns)
+        except AttributeError:
+            return True
+
+    def _expression_for_seek(self, keys, values):
+        # keys that can be null sort null values first, as ordered by _query_order_by() with nulls_first=True
+        def equal(column, value):
+            return column.is_(None) if value is None else column == value
+
+        def follows(column, value, reverse):
+            if value is None:
+                return false() if reverse else column.isnot(None)
+            if reverse:
+                return or_(column < value, column.is_(None))
+            return column > value
+
+        expressions = []
+        for i, (field, attribute, reverse) in enumerate(keys):
+            column = getattr(self.model, attribute)
+            equal_keys = [equal(getattr(self.model, a), v) for (f, a, r), v in zip(keys[:i], values[:i])]
+            expressions.append(and_(*(equal_keys + [follows(column, values[i], reverse)])))
+
+        # the redundant bound on the first key lets the database use an index on it
+        attribute, reverse = keys[0][1], keys[0][2]
+        if values[0] is None or self._nullable(attribute):
+            return or_(*expressions)
+
+        column = getattr(self.model, attribute)
+        first = column <= values[0] if reverse else column >= values[0]
+        return and_(first, or_(*expressions))
+
     def _query_filter_by_id(self, query, id):
         try:
             return query.filter(self.id_column == id).one()
         except NoResultFound:
             raise ItemNotFound(self.resource, id=id)
 
-    def _query_order_by(self, query, sort=None):
+    def read_attributes(self, id, attributes):
+        query = self._query()
+
+        if query is None:
+            raise ItemNotFound(self.resource, id=id)
+
+        columns = [getattr(self.model, attribute) for attribute in attributes]
+        query = query.filter(self.id_column == id).enable_eagerloads(False).with_entities(*columns)
+
+        try:
+            return tuple(query.one())
+        except NoResultFound:
+            raise ItemNotFound(self.resource, id=id)
+
+    def _query_order_by(self, query, sort=None, nulls_first=False):
         order_clauses = []
 
         if not sort:
@@ -203,6 +377,11 @@ class SQLAlchemyManager(RelationalManager):
         for field, attribute, reverse in sort:
             column = getattr(self.model, attribute)
 
+            # databases differ in where they sort null values; "IS NOT NULL" sorts them first on every database
+            if nulls_first and self._nullable(attribute):
+                not_null = column.isnot(None)
+                order_clauses.append(not_null.desc() if reverse else not_null.asc())
+
             if isinstance(field, fields.ToOne):
                 target_alias = aliased(field.target.meta.model)
                 query = query.outerjoin(target_alias, column).reset_joinpoint()
@@ -217,6 +396,132 @@ class SQLAlchemyManager(RelationalManager):
 
         return query.order_by(*order_clauses)
 
+    def keyset_instances(self, per_page, where=None, sort=None, after=None, before=None, attributes=None,
+                         embed=None):
+        keys = self._keyset(sort)
+        backwards = before is not None
+        cursor = before if backwards else after
+
+        if backwards:
+            order = tuple((field, attribute, not reverse) for field, attribute, reverse in keys)
+        else:
+            order = keys
+
+        query = self._query_where(where)
+
+        if query is None:
+            return KeysetPagination([], keys, per_page, has_next=False, has_prev=False)
+
+        if cursor:
+            query = query.filter(self._expression_for_seek(order, cursor))
+
+        if attributes is not None:
+            query = self._query_load_only(query, attributes)
+        if embed:
+            query = self._query_embed(query, embed)
+
+        query = self._query_schema_options(query, attributes)
+        items = self._query_order_by(query, order, nulls_first=True).limit(per_page + 1).all()
+        return KeysetPagination.from_items(items, keys, per_page, cursor, backwards)
+
+    def paginated_instances(self, page, per_page, where=None, sort=None, count='exact', attributes=None, embed=None,
+                            stream=False):
+        query = self._query_where(where)
+
+        if query is None:
+            return Pagination([], page, per_page, 0)
+
+        items_query = self._query_order_by(query, sort)
+        if attributes is not None:
+            items_query = self._query_load_only(items_query, attributes)
+        if embed:
+            items_query = self._query_embed(items_query, embed)
+
+        items_query = self._query_schema_options(items_query, attributes)
+
+        if stream:
+            # rows are fetched in batches, each with the references they load, while the page is sent
+            page_query = items_query.limit(per_page).offset((page - 1) * per_page).yield_per(self.STREAM_BATCH_SIZE)
+            count_query = query.enable_eagerloads(False).order_by(None)
+            return self._query_pagination(page, per_page, where, count,
+                                          lambda: page_query,
+                                          lambda offset: count_query.with_entities(self.id_column)
+                                                                    .offset(offset).first() is not None,
+                                          count_query.count,
+                                          lambda: self._estimate_count(count_query))
+
+        items = items_query.limit(per_page + 1).offset((page - 1) * per_page).all()
+
+        if not items and page > 1:
+            raise PageNotFound()
+
+        if count == 'off':
+            return Pagination(items[:per_page], page, per_page, None, has_next=len(items) > per_page)
+
+        if page == 1 and len(items) <= per_page:
+            total = len(items)
+        else:
+            # neither the sort order, nor the joins it needs, nor eager loads affect the number of items
+            count_query = query.enable_eagerloads(False).order_by(None)
+            total = self._total(where, count, count_query.count, lambda: self._estimate_count(count_query))
+
+        return Pagination(items[:per_page], page, per_page, total, has_next=len(items) > per_page)
+
+    def _estimate_count(self, query):
+        """
+        Returns the number of rows the PostgreSQL query planner expects the query to return. Counts exactly with
+        other databases.
+        """
+        session = query.session
+        if session.get_bind(mapper=class_mapper(self.model)).dialect.name != 'postgresql':
+            return query.count()
+
+        plan = session.execute(_Explain(query.statement)).scalar()
+        if isinstance(plan, six.string_types):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def _query_load_only(self, query, attributes):
+        mapper = class_mapper(self.model)
+        columns = [self.id_attribute]
+
+        for attribute in attributes:
+            prop = mapper.attrs.get(attribute)
+
+            if isinstance(prop, ColumnProperty):
+                columns.append(attribute)
+            elif isinstance(prop, RelationshipProperty):
+                # relationships are loaded later, from their local columns
+                columns.extend(mapper.get_property_by_column(column).key for column in prop.local_columns)
+            else:
+                # properties and hybrid attributes might read any column
+                return query
+
+        return query.options(load_only(*columns))
+
+    def _query_embed(self, query, paths):
+        for path in paths:
+            model, option = self.model, None
+
+            for attribute in path.split('.'):
+                prop = class_mapper(model).attrs.get(attribute)
+
+                # dynamic relationships are queries and cannot be loaded in advance
+                if not isinstance(prop, RelationshipProperty) or prop.lazy == 'dynamic':
+                    break
+
+                # a join would repeat each item for every item in a collection
+                relationship = getattr(model, attribute)
+                if option is None:
+                    option = selectinload(relationship) if prop.uselist else joinedload(relationship)
+                else:
+                    option = option.selectinload(relationship) if prop.uselist else option.joinedload(relationship)
+                model = prop.mapper.class_
+
+            if option is not None:
+                query = query.options(option)
+        return query
+
     def _query_get_paginated_items(self, query, page, per_page):
         return query.paginate(page=page, per_page=per_page)
 
@@ -232,6 +537,17 @@ class SQLAlchemyManager(RelationalManager):
         except NoResultFound:
             raise IndexError()
 
+    @staticmethod
+    def _raise_conflict(e):
+        # XXX need some better way to detect postgres engine.
+        if hasattr(e.orig, 'pgcode'):
+            if e.orig.pgcode == '23505':  # duplicate key
+                raise DuplicateKey(detail=e.orig.diag.message_detail)
+
+        if current_app.debug:
+            raise BackendConflict(debug_info=dict(exception_message=str(e), statement=e.statement, params=e.params))
+        raise BackendConflict()
+
     def create(self, properties, commit=True):
         # noinspection properties
         item = self.model()
@@ -248,18 +564,36 @@ class SQLAlchemyManager(RelationalManager):
             self.commit_or_flush(commit)
         except IntegrityError as e:
             session.rollback()
-
-            if hasattr(e.orig, 'pgcode'):
-                if e.orig.pgcode == "23505":  # duplicate key
-                    raise DuplicateKey(detail=e.orig.diag.message_detail)
-
-            if current_app.debug:
-                raise BackendConflict(debug_info=dict(exception_message=str(e), statement=e.statement, params=e.params))
-            raise BackendConflict()
+            self._raise_conflict(e)
 
         after_create.send(self.resource, item=item)
         return item
 
+    def create_many(self, items):
+        session = self._get_session()
+        created = []
+
+        for properties in items:
+            item = self.model()
+
+            for key, value in properties.items():
+                setattr(item, key, value)
+
+            before_create.send(self.resource, item=item)
+            created.append(item)
+
+        # a single flush lets the unit of work batch the INSERT statements using executemany() where possible
+        try:
+            session.add_all(created)
+            self.commit_or_flush(True)
+        except IntegrityError as e:
+            session.rollback()
+            self._raise_conflict(e)
+
+        for item in created:
+            after_create.send(self.resource, item=item)
+        return created
+
     def update(self, item, changes, commit=True):
         session = self._get_session()
 
@@ -277,15 +611,7 @@ class SQLAlchemyManager(RelationalManager):
             self.commit_or_flush(commit)
         except IntegrityError as e:
             session.rollback()
-
-            # XXX need some better way to detect postgres engine.
-            if hasattr(e.orig, 'pgcode'):
-                if e.orig.pgcode == '23505':  # duplicate key
-                    raise DuplicateKey(detail=e.orig.diag.message_detail)
-
-            if current_app.debug:
-                raise BackendConflict(debug_info=dict(exception_message=str(e), statement=e.statement, params=e.params))
-            raise BackendConflict()
+            self._raise_conflict(e)
 
         after_update.send(self.resource, item=item, changes=actual_changes)
         return item
@@ -307,6 +633,55 @@ class SQLAlchemyManager(RelationalManager):
 
         after_delete.send(self.resource, item=item)
 
+    def update_where(self, where, changes, signals=False):
+        columns = class_mapper(self.model).column_attrs
+
+        # relationships cannot be assigned in an UPDATE statement
+        if signals or not all(key in columns for key in changes):
+            return super(SQLAlchemyManager, self).update_where(where, changes, signals)
+
+        query = self._query_where(where)
+
+        if query is None:
+            return 0
+
+        session = self._get_session()
+
+        try:
+            session.flush()
+            count = query.enable_eagerloads(False).update(changes, synchronize_session=False)
+            session.expire_all()
+            self.commit_or_flush(True)
+        except IntegrityError as e:
+            session.rollback()
+            self._raise_conflict(e)
+
+        return count
+
+    def delete_where(self, where, signals=False):
+        # cascades and association tables are only maintained by the ORM
+        if signals or any(relationship.secondary is not None or relationship.cascade.delete
+                          for relationship in class_mapper(self.model).relationships):
+            return super(SQLAlchemyManager, self).delete_where(where, signals)
+
+        query = self._query_where(where)
+
+        if query is None:
+            return 0
+
+        session = self._get_session()
+
+        try:
+            session.flush()
+            count = query.enable_eagerloads(False).delete(synchronize_session=False)
+            session.expire_all()
+            self.commit_or_flush(True)
+        except IntegrityError as e:
+            session.rollback()
+            self._raise_conflict(e)
+
+        return count
+
     def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
         query = getattr(item, attribute)
 
@@ -333,13 +708,32 @@ class SQLAlchemyManager(RelationalManager):
         except ValueError:
             pass  # if the relation does not exist, do nothing
 
+    def begin(self):
+        session = self._get_session()
+        session.info[TRANSACTION_DEPTH_KEY] = session.info.get(TRANSACTION_DEPTH_KEY, 0) + 1
+
     def commit(self):
         session = self._get_session()
-        session.commit()
+        depth = session.info.get(TRANSACTION_DEPTH_KEY, 0)
+
+        if depth > 1:
+            session.info[TRANSACTION_DEPTH_KEY] = depth - 1
+            session.flush()
+        else:
+            session.info.pop(TRANSACTION_DEPTH_KEY, None)
+            session.commit()
+
+    def rollback(self):
+        session = self._get_session()
+        session.info.pop(TRANSACTION_DEPTH_KEY, None)
+        session.rollback()
+
+    def _in_transaction(self):
+        return bool(self._get_session().info.get(TRANSACTION_DEPTH_KEY))
 
     def commit_or_flush(self, commit):
         session = self._get_session()
-        if commit:
+        if commit and not session.info.get(TRANSACTION_DEPTH_KEY):
             session.commit()
         else:
             session.flush()
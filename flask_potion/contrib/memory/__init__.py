@@ -1,5 +1,6 @@
-from .manager import MemoryManager
+from .manager import MemoryManager, ConcurrentMemoryManager
 
 __all__ = (
     'MemoryManager',
+    'ConcurrentMemoryManager',
 )
\ No newline at end of file
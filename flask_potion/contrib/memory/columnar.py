@@ -0,0 +1,509 @@
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+import numpy as np
+import six
+
+from flask_potion.exceptions import ItemNotFound
+from flask_potion.fields import Boolean, Integer, Number, String
+from flask_potion.filters import EqualFilter, NotEqualFilter, InFilter, LessThanFilter, LessThanEqualFilter, \
+    GreaterThanFilter, GreaterThanEqualFilter, compile_conditions
+from flask_potion.instances import Pagination
+from flask_potion.utils import get_value
+from .manager import MemoryManager
+
+
+def _resized(array, capacity, fill):
+    resized = np.full(capacity, fill, dtype=array.dtype)
+    resized[:len(array)] = array[:capacity]
+    return resized
+
+
+class Column(object):
+    """
+    Stores the values of one attribute of the items of a :class:`ColumnarMemoryManager`, one row per item.
+
+    :param int capacity: initial number of rows
+    """
+
+    def __init__(self, capacity):
+        raise NotImplementedError()
+
+    def resize(self, capacity):
+        raise NotImplementedError()
+
+    def take(self, rows):
+        """
+        Moves the values of the given rows, in order, to the first rows and clears the rows after them.
+
+        :param rows: an ascending array of rows
+        """
+        raise NotImplementedError()
+
+    def convert(self, value):
+        """
+        Converts a value to the form stored by :meth:`set`, so that every value of an item is checked before any of
+        them is stored.
+
+        :raises OverflowError: if the value does not fit the column
+        """
+        return value
+
+    def get(self, row):
+        raise NotImplementedError()
+
+    def set(self, row, value):
+        """
+        :param value: a value returned by :meth:`convert`
+        """
+        raise NotImplementedError()
+
+    def mask(self, filter, value, rows):
+        """
+        :param filter: a :class:`filters.BaseFilter`
+        :param value: the value filtered by
+        :param rows: an array of rows
+        :return: a boolean array with an entry for each of the rows, or ``None`` if the column cannot evaluate the
+            filter
+        """
+        predicate = filter.predicate(value)
+        return np.fromiter((bool(predicate(self.get(row))) for row in rows), bool, len(rows))
+
+    def sort_keys(self, rows):
+        """
+        :return: a list of integer or float arrays to sort the rows by, most significant first, or ``None`` if the
+            column cannot be sorted
+        """
+        return None
+
+
+class ArrayColumn(Column):
+    """
+    A typed column with a mask of ``null`` values.
+    """
+    dtype = None
+
+    def __init__(self, capacity):
+        self.values = np.zeros(capacity, dtype=self.dtype)
+        self.nulls = np.ones(capacity, dtype=bool)
+
+    def resize(self, capacity):
+        self.values = _resized(self.values, capacity, 0)
+        self.nulls = _resized(self.nulls, capacity, True)
+
+    def take(self, rows):
+        size = len(rows)
+        self.values[:size], self.values[size:] = self.values[rows], 0
+        self.nulls[:size], self.nulls[size:] = self.nulls[rows], True
+
+    def convert(self, value):
+        if value is None:
+            return None
+        return self.dtype(value)
+
+    def get(self, row):
+        if self.nulls[row]:
+            return None
+        return self.values[row].item()
+
+    def set(self, row, value):
+        if value is None:
+            self.values[row] = 0
+            self.nulls[row] = True
+        else:
+            self.values[row] = value
+            self.nulls[row] = False
+
+    def mask(self, filter, value, rows):
+        values, nulls = self.values[rows], self.nulls[rows]
+
+        if isinstance(filter, EqualFilter):
+            if value is None:
+                return nulls
+            return (values == value) & ~nulls
+
+        if isinstance(filter, NotEqualFilter):
+            if value is None:
+                return ~nulls
+            return (values != value) | nulls
+
+        if isinstance(filter, InFilter):
+            mask = np.isin(values, [v for v in value if v is not None]) & ~nulls
+            if None in value:
+                mask |= nulls
+            return mask
+
+        if value is None:
+            return None
+
+        for filter_class, op in ((LessThanFilter, np.less),
+                                 (LessThanEqualFilter, np.less_equal),
+                                 (GreaterThanFilter, np.greater),
+                                 (GreaterThanEqualFilter, np.greater_equal)):
+            if isinstance(filter, filter_class):
+                return op(values, value) & ~nulls
+        return None
+
+    def sort_keys(self, rows):
+        # null values sort first
+        return [(~self.nulls[rows]).astype(np.int8), self.values[rows]]
+
+
+class NumberColumn(ArrayColumn):
+    """
+    A column of floats, which remembers the rows that were set to integers so that they are read back as integers.
+    Integers that a float cannot represent exactly are rejected.
+    """
+    dtype = np.float64
+
+    def __init__(self, capacity):
+        super(NumberColumn, self).__init__(capacity)
+        self.integers = np.zeros(capacity, dtype=bool)
+
+    def resize(self, capacity):
+        super(NumberColumn, self).resize(capacity)
+        self.integers = _resized(self.integers, capacity, False)
+
+    def take(self, rows):
+        super(NumberColumn, self).take(rows)
+        size = len(rows)
+        self.integers[:size], self.integers[size:] = self.integers[rows], False
+
+    def convert(self, value):
+        number = super(NumberColumn, self).convert(value)
+
+        if isinstance(value, six.integer_types) and not isinstance(value, bool):
+            if int(number) != value:
+                raise OverflowError('{} cannot be stored as a float without loss'.format(value))
+            return value
+        return number
+
+    def get(self, row):
+        value = super(NumberColumn, self).get(row)
+        if value is not None and self.integers[row]:
+            return int(value)
+        return value
+
+    def set(self, row, value):
+        super(NumberColumn, self).set(row, value)
+        self.integers[row] = isinstance(value, six.integer_types)
+
+
+class IntegerColumn(ArrayColumn):
+    dtype = np.int64
+
+
+class BooleanColumn(ArrayColumn):
+    dtype = np.bool_
+
+    def sort_keys(self, rows):
+        return [(~self.nulls[rows]).astype(np.int8), self.values[rows].astype(np.int8)]
+
+
+class StringColumn(Column):
+    """
+    A dictionary-encoded column of strings. Conditions other than equality and ``in`` are evaluated once for each
+    distinct value.
+
+    Values that are no longer stored keep their codes until they outnumber the rows, when the column is re-encoded.
+    """
+
+    def __init__(self, capacity):
+        self.codes = np.full(capacity, -1, dtype=np.int32)
+        self.categories = []
+        self._codes = {}
+
+    def resize(self, capacity):
+        self.codes = _resized(self.codes, capacity, -1)
+
+    def take(self, rows):
+        size = len(rows)
+        self.codes[:size], self.codes[size:] = self.codes[rows], -1
+        self._recode()
+
+    def _recode(self):
+        used = np.unique(self.codes[self.codes >= 0])
+
+        # one entry for each category, and a last entry for null values, which keep the code -1
+        codes = np.full(len(self.categories) + 1, -1, dtype=np.int32)
+        codes[used] = np.arange(len(used))
+
+        self.codes = codes[self.codes]
+        self.categories = [self.categories[code] for code in used]
+        self._codes = {category: code for code, category in enumerate(self.categories)}
+
+    def _code(self, value):
+        try:
+            return self._codes[value]
+        except KeyError:
+            code = self._codes[value] = len(self.categories)
+            self.categories.append(value)
+            return code
+
+    def get(self, row):
+        code = self.codes[row]
+        if code < 0:
+            return None
+        return self.categories[code]
+
+    def set(self, row, value):
+        self.codes[row] = -1 if value is None else self._code(value)
+
+        if len(self.categories) > 2 * len(self.codes):
+            self._recode()
+
+    def _by_code(self, values, null, dtype):
+        # one entry for each category, and a last entry for null values, which have the code -1
+        by_code = np.empty(len(self.categories) + 1, dtype=dtype)
+        by_code[:-1] = values
+        by_code[-1] = null
+        return by_code
+
+    def mask(self, filter, value, rows):
+        codes = self.codes[rows]
+
+        if isinstance(filter, (EqualFilter, NotEqualFilter)):
+            code = -1 if value is None else self._codes.get(value, -2)
+            if isinstance(filter, EqualFilter):
+                return codes == code
+            return codes != code
+
+        if isinstance(filter, InFilter):
+            return np.isin(codes, [self._codes[v] if v is not None else -1 for v in value
+                                   if v is None or v in self._codes])
+
+        predicate = filter.predicate(value)
+        try:
+            matches = [bool(predicate(category)) for category in self.categories]
+        except (TypeError, AttributeError):
+            return None
+        return self._by_code(matches, False, bool)[codes]
+
+    def sort_keys(self, rows):
+        order = sorted(range(len(self.categories)), key=self.categories.__getitem__)
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(len(order))
+        return [self._by_code(ranks, -1, np.int64)[self.codes[rows]]]
+
+
+class ObjectColumn(Column):
+    """
+    A column of arbitrary values, which are filtered and sorted in Python.
+    """
+
+    def __init__(self, capacity):
+        self.values = np.empty(capacity, dtype=object)
+
+    def resize(self, capacity):
+        self.values = _resized(self.values, capacity, None)
+
+    def take(self, rows):
+        size = len(rows)
+        self.values[:size], self.values[size:] = self.values[rows], None
+
+    def get(self, row):
+        return self.values[row]
+
+    def set(self, row, value):
+        self.values[row] = value
+
+
+class _Items(Mapping):
+    # a read-only view of the items of a ColumnarMemoryManager by id
+
+    def __init__(self, manager):
+        self._manager = manager
+
+    def __getitem__(self, id):
+        return self._manager._item(self._manager._rows[id])
+
+    def __iter__(self):
+        return iter(self._manager._rows)
+
+    def __len__(self):
+        return len(self._manager._rows)
+
+
+class ColumnarMemoryManager(MemoryManager):
+    """
+    A :class:`MemoryManager` that keeps each writable field of a resource in a typed NumPy column, which takes a
+    fraction of the memory of a dictionary per item. Booleans, integers and numbers are kept in arrays with a mask of
+    ``null`` values, and strings are dictionary-encoded.
+
+    Values that do not fit their column, such as integers beyond 64 bits, raise :class:`OverflowError` and leave the
+    items unchanged.
+
+    Conditions and sorting are evaluated on whole columns, and items are only built for the rows that are returned. In
+    columns of these types, ``null`` values never match range and string conditions and sort first. Other columns
+    are filtered and sorted in Python.
+
+    The rows of deleted items are reclaimed once they make up half of all rows, by moving the remaining items to the
+    first rows in order.
+
+    Requires NumPy. ``Meta.indexes`` is not used by this manager.
+    """
+    COLUMN_TYPES = (
+        (Boolean, BooleanColumn),
+        (Integer, IntegerColumn),
+        (Number, NumberColumn),
+        (String, StringColumn),
+    )
+
+    INITIAL_CAPACITY = 1024
+
+    def _init_storage(self):
+        self.indexes = {}
+        self.items = _Items(self)
+
+        self._size = 0
+        self._capacity = self.INITIAL_CAPACITY
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._rows = {}
+        self._extras = {}
+        self._columns = {self.id_attribute: self._column_for_field(self.id_field, self._capacity)}
+
+        for key, field in self.resource.schema.fields.items():
+            attribute = field.attribute or key
+            if ('c' in field.io or 'u' in field.io) and attribute not in self._columns:
+                self._columns[attribute] = self._column_for_field(field, self._capacity)
+
+    def _column_for_field(self, field, capacity):
+        for field_class, column_class in self.COLUMN_TYPES:
+            if isinstance(field, field_class):
+                return column_class(capacity)
+        return ObjectColumn(capacity)
+
+    def _item(self, row):
+        item = {attribute: column.get(row) for attribute, column in self._columns.items()}
+        item.update(self._extras.get(row, ()))
+        return item
+
+    def _load(self, snapshot):
+        for item_id, item in snapshot.items():
+            self._put(item_id, item)
+
+    def _put(self, item_id, item):
+        # values are converted before the row is changed, so an item that does not fit is not stored in part
+        values = {attribute: column.convert(item.get(attribute)) for attribute, column in self._columns.items()}
+        extras = {attribute: value for attribute, value in item.items() if attribute not in self._columns}
+
+        try:
+            row = self._rows[item_id]
+        except KeyError:
+            row = self._rows[item_id] = self._size
+            self._size += 1
+
+            if self._size > self._capacity:
+                self._capacity *= 2
+                self._alive = _resized(self._alive, self._capacity, False)
+                for column in self._columns.values():
+                    column.resize(self._capacity)
+
+            self._alive[row] = True
+
+        for attribute, value in values.items():
+            self._columns[attribute].set(row, value)
+
+        if extras:
+            self._extras[row] = extras
+        else:
+            self._extras.pop(row, None)
+
+    def _where_rows(self, where):
+        rows = np.flatnonzero(self._alive[:self._size])
+        remaining = []
+
+        for condition in sorted(where or (), key=lambda condition: condition.filter.selectivity):
+            column = self._columns.get(condition.attribute)
+            mask = None if column is None else column.mask(condition.filter, condition.value, rows)
+
+            if mask is None:
+                remaining.append(condition)
+            else:
+                rows = rows[mask]
+
+        if remaining:
+            matches = compile_conditions(remaining)
+            rows = rows[np.fromiter((bool(matches(self._item(row))) for row in rows), bool, len(rows))]
+        return rows
+
+    def _sort_rows(self, rows, sort):
+        keys = []
+        for field, attribute, reverse in reversed(sort):
+            column = self._columns.get(attribute)
+            column_keys = None if column is None else column.sort_keys(rows)
+
+            if column_keys is None:
+                return self._sort_rows_by_value(rows, sort)
+
+            # np.lexsort sorts by the last key first
+            for key in reversed(column_keys):
+                keys.append(-key if reverse else key)
+
+        return rows[np.lexsort(keys)]
+
+    def _value(self, attribute, row):
+        column = self._columns.get(attribute)
+        if column is not None:
+            return column.get(row)
+        return get_value(attribute, self._extras.get(row, {}), None)
+
+    def _sort_rows_by_value(self, rows, sort):
+        rows = list(rows)
+        for field, attribute, reverse in reversed(sort):
+            rows = sorted(rows, key=lambda row: self._value(attribute, row), reverse=reverse)
+        return np.array(rows, dtype=np.intp)
+
+    def _query_rows(self, where=None, sort=None):
+        rows = self._where_rows(where)
+        if sort:
+            rows = self._sort_rows(rows, sort)
+        return rows
+
+    def paginated_instances(self, page, per_page, where=None, sort=None, count='exact', attributes=None, embed=None,
+                            stream=False):
+        rows = self._query_rows(where, sort)
+        start = per_page * (page - 1)
+        items = [self._item(row) for row in rows[start:start + per_page]]
+
+        if count == 'off':
+            return Pagination(items, page, per_page, None, has_next=len(rows) > start + per_page)
+        return Pagination(items, page, per_page, len(rows))
+
+    def instances(self, where=None, sort=None):
+        return (self._item(row) for row in self._query_rows(where, sort))
+
+    def read(self, id, attributes=None, embed=None):
+        try:
+            row = self._rows[id]
+        except (KeyError, TypeError):
+            raise ItemNotFound(self.resource, id=id)
+        return self._item(row)
+
+    def _remove(self, item_id):
+        row = self._rows.pop(item_id)
+        self._alive[row] = False
+        self._extras.pop(row, None)
+
+        for column in self._columns.values():
+            column.set(row, None)
+
+        if len(self._rows) < self._size // 2:
+            self._compact()
+
+    def _compact(self):
+        rows = np.flatnonzero(self._alive[:self._size])
+        size = len(rows)
+
+        for column in self._columns.values():
+            column.take(rows)
+
+        moved = np.empty(self._size, dtype=np.intp)
+        moved[rows] = np.arange(size)
+
+        self._rows = {item_id: int(moved[row]) for item_id, row in self._rows.items()}
+        self._extras = {int(moved[row]): extras for row, extras in self._extras.items()}
+        self._alive[:size], self._alive[size:] = True, False
+        self._size = size
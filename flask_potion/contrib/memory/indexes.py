@@ -0,0 +1,266 @@
+from bisect import bisect_left, bisect_right
+from copy import copy
+
+import six
+
+from flask_potion.filters import EqualFilter, InFilter, LessThanFilter, LessThanEqualFilter, GreaterThanFilter, \
+    GreaterThanEqualFilter, StartsWithFilter, DateBetweenFilter
+
+
+class Index(object):
+    """
+    An index of the items of a :class:`MemoryManager` by the value of one of their attributes, which is used to look up
+    the items that may match a condition without scanning every item. Items whose value cannot be indexed are
+    returned by every lookup, so that conditions are always checked against them.
+
+    :param str attribute:
+    """
+    sortable = False
+
+    def __init__(self, attribute):
+        self.attribute = attribute
+        self._unindexed = set()
+
+    def add(self, id, value):
+        raise NotImplementedError()
+
+    def remove(self, id, value):
+        raise NotImplementedError()
+
+    def build(self, entries):
+        """
+        Replaces all entries of the index, which costs less than adding them one at a time with :meth:`add`.
+
+        :param entries: an iterable of ``(id, value)`` tuples
+        """
+        raise NotImplementedError()
+
+    def copy(self):
+        """
+        :return: an index with the same entries, which can be changed without changing this index
+        """
+        index = copy(self)
+        index._unindexed = set(self._unindexed)
+        return index
+
+    def estimate(self, condition):
+        """
+        :return: the number of items :meth:`lookup` would return, or ``None`` if the index cannot look up the condition
+        """
+        raise NotImplementedError()
+
+    def lookup(self, condition):
+        """
+        :return: the ids of the items that may match the condition
+        """
+        raise NotImplementedError()
+
+    def ordered_ids(self, reverse=False):
+        """
+        :return: an iterator over the ids of all items in the order of their values
+        """
+        raise NotImplementedError()
+
+
+class HashIndex(Index):
+    """
+    An index for equality and ``in`` conditions.
+    """
+
+    def __init__(self, attribute):
+        super(HashIndex, self).__init__(attribute)
+        self._ids = {}
+
+    def add(self, id, value):
+        try:
+            self._ids.setdefault(value, set()).add(id)
+        except TypeError:
+            self._unindexed.add(id)
+
+    def remove(self, id, value):
+        try:
+            ids = self._ids[value]
+        except (KeyError, TypeError):
+            self._unindexed.discard(id)
+            return
+
+        ids.discard(id)
+        if not ids:
+            del self._ids[value]
+
+    def build(self, entries):
+        self._ids = {}
+        self._unindexed = set()
+        for id, value in entries:
+            self.add(id, value)
+
+    def copy(self):
+        index = super(HashIndex, self).copy()
+        index._ids = {value: set(ids) for value, ids in self._ids.items()}
+        return index
+
+    def _values(self, condition):
+        if isinstance(condition.filter, EqualFilter):
+            values = (condition.value,)
+        elif isinstance(condition.filter, InFilter):
+            values = condition.value
+        else:
+            return None
+
+        try:
+            return [value for value in values if value in self._ids]
+        except TypeError:
+            return None
+
+    def estimate(self, condition):
+        values = self._values(condition)
+        if values is None:
+            return None
+        return sum(len(self._ids[value]) for value in values) + len(self._unindexed)
+
+    def lookup(self, condition):
+        ids = set(self._unindexed)
+        for value in self._values(condition):
+            ids.update(self._ids[value])
+        return ids
+
+
+def _prefix_end(prefix):
+    # the smallest string greater than every string starting with the prefix
+    last = ord(prefix[-1])
+    if last == 0x10ffff:
+        return None
+    return prefix[:-1] + six.unichr(last + 1)
+
+
+class OrderedIndex(Index):
+    """
+    An index for equality, ``in``, range, ``between`` and ``startswith`` conditions, which can also be used to read
+    items sorted by the attribute. Items with equal values are kept in the order of their ids.
+    """
+
+    def __init__(self, attribute):
+        super(OrderedIndex, self).__init__(attribute)
+        self._values = []
+        self._ids = []
+
+    @property
+    def sortable(self):
+        return not self._unindexed
+
+    def _position(self, id, value):
+        lo = bisect_left(self._values, value)
+        hi = bisect_right(self._values, value, lo)
+        try:
+            return bisect_left(self._ids, id, lo, hi)
+        except TypeError:
+            return hi
+
+    def add(self, id, value):
+        if value is None:
+            self._unindexed.add(id)
+            return
+
+        try:
+            i = self._position(id, value)
+        except TypeError:
+            self._unindexed.add(id)
+            return
+
+        self._values.insert(i, value)
+        self._ids.insert(i, id)
+
+    def remove(self, id, value):
+        if id in self._unindexed:
+            self._unindexed.discard(id)
+            return
+
+        lo = bisect_left(self._values, value)
+        hi = bisect_right(self._values, value, lo)
+        i = self._ids.index(id, lo, hi)
+        del self._values[i]
+        del self._ids[i]
+
+    def build(self, entries):
+        self._unindexed = set()
+        indexed = []
+        for id, value in entries:
+            if value is None:
+                self._unindexed.add(id)
+            else:
+                indexed.append((value, id))
+
+        try:
+            indexed.sort()
+        except TypeError:
+            # values that cannot be compared with each other are sorted out by add()
+            self._values, self._ids = [], []
+            for value, id in indexed:
+                self.add(id, value)
+            return
+
+        self._values = [value for value, id in indexed]
+        self._ids = [id for value, id in indexed]
+
+    def copy(self):
+        index = super(OrderedIndex, self).copy()
+        index._values = list(self._values)
+        index._ids = list(self._ids)
+        return index
+
+    def _ranges(self, condition):
+        values = self._values
+        filter, value = condition.filter, condition.value
+
+        if isinstance(filter, EqualFilter):
+            return [(bisect_left(values, value), bisect_right(values, value))]
+        if isinstance(filter, InFilter):
+            return [(bisect_left(values, v), bisect_right(values, v)) for v in set(value)]
+        if isinstance(filter, LessThanFilter):
+            return [(0, bisect_left(values, value))]
+        if isinstance(filter, LessThanEqualFilter):
+            return [(0, bisect_right(values, value))]
+        if isinstance(filter, GreaterThanFilter):
+            return [(bisect_right(values, value), len(values))]
+        if isinstance(filter, GreaterThanEqualFilter):
+            return [(bisect_left(values, value), len(values))]
+        if isinstance(filter, DateBetweenFilter):
+            before, after = value
+            return [(bisect_left(values, before), bisect_right(values, after))]
+        if isinstance(filter, StartsWithFilter) and isinstance(value, six.string_types):
+            end = _prefix_end(value)
+            if end is None:
+                return None
+            return [(bisect_left(values, value), bisect_left(values, end))]
+        return None
+
+    def estimate(self, condition):
+        try:
+            ranges = self._ranges(condition)
+        except TypeError:
+            return None
+
+        if ranges is None:
+            return None
+        return sum(max(0, hi - lo) for lo, hi in ranges) + len(self._unindexed)
+
+    def lookup(self, condition):
+        ids = set(self._unindexed)
+        for lo, hi in self._ranges(condition):
+            ids.update(self._ids[lo:hi])
+        return ids
+
+    def ordered_ids(self, reverse=False):
+        if not reverse:
+            return iter(self._ids)
+        return self._reversed_ids()
+
+    def _reversed_ids(self):
+        # items with equal values remain in the order of their ids, as with sorted(reverse=True)
+        values, ids = self._values, self._ids
+        hi = len(values)
+        while hi > 0:
+            lo = bisect_left(values, values[hi - 1], 0, hi)
+            for id in ids[lo:hi]:
+                yield id
+            hi = lo
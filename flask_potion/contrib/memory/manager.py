@@ -1,9 +1,17 @@
+import os
+import threading
+
+import six
+
 from flask_potion.exceptions import ItemNotFound
-from flask_potion.instances import Pagination
+from flask_potion.filters import compile_conditions
+from flask_potion.instances import Pagination, IterablePagination
 from flask_potion.manager import Manager
 from flask_potion.signals import before_add_to_relation, after_add_to_relation, before_remove_from_relation, \
     after_remove_from_relation
 from flask_potion.utils import get_value
+from .indexes import HashIndex, OrderedIndex
+from .persistence import AppendLog, Snapshot, SnapshotItems
 
 
 class MemoryManager(Manager):
@@ -13,13 +21,83 @@ class MemoryManager(Manager):
     .. warning::
 
         This manager is intended for debugging & testing only and should not be used in production.
+
+    Attributes listed in ``Meta.indexes`` are indexed to answer queries without scanning every item, either with a
+    ``'hash'`` index for equality and ``in`` conditions or an ``'ordered'`` index that also supports range,
+    ``between`` and ``startswith`` conditions and sorting.
+
+    When ``Meta.persist`` is a directory, every change is appended to a write-ahead log in that directory before it is
+    applied. Once the log holds :attr:`SNAPSHOT_INTERVAL` changes, all items are written to a compact snapshot and the
+    log is cleared. On startup, the snapshot is memory-mapped, its items are read as they are accessed, and the log is
+    replayed. A directory can only be used by one manager at a time, in a single process.
     """
+    INDEX_TYPES = {
+        'hash': HashIndex,
+        'ordered': OrderedIndex
+    }
+
+    # an ordered index is used for sorting unless an index for a condition selects fewer than 1/n of all items
+    SORT_INDEX_RATIO = 10
+
+    # number of changes in the log after which a new snapshot is written
+    SNAPSHOT_INTERVAL = 10000
+
+    # whether each change is synced to disk before it is applied
+    LOG_FSYNC = True
+
+    # number of changes applied at once from which the indexes are rebuilt rather than updated one item at a time
+    INDEX_BUILD_SIZE = 1000
 
     def __init__(self, resource, model):
         super(MemoryManager, self).__init__(resource, model)
         self.id_sequence = 0
-        self.items = {}
         self.session = []
+        self.log = None
+        self._init_storage()
+
+        persist = resource.meta.get('persist')
+        if persist:
+            self._open(persist)
+
+    def _init_storage(self):
+        self.items = {}
+        self.indexes = {
+            attribute: self.INDEX_TYPES[index_type](attribute)
+            for attribute, index_type in (self.resource.meta.get('indexes') or {}).items()
+        }
+
+    def _open(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        name = self.resource.meta.name
+        self._snapshot_path = os.path.join(directory, '{}.snapshot'.format(name))
+        self.log = AppendLog(os.path.join(directory, '{}.log'.format(name)), fsync=self.LOG_FSYNC)
+
+        if os.path.exists(self._snapshot_path):
+            snapshot = Snapshot(self._snapshot_path)
+            self.id_sequence = snapshot.id_sequence
+            self._load(snapshot)
+
+        entries = self.log.open()
+        for item_id, item in entries:
+            if isinstance(item_id, six.integer_types):
+                self.id_sequence = max(self.id_sequence, item_id)
+        self._apply(entries)
+
+    def _load(self, snapshot):
+        if self.indexes:
+            self.items = dict(snapshot.items())
+            self._build_indexes()
+        else:
+            self.items = SnapshotItems(snapshot)
+
+    def snapshot(self):
+        """
+        Writes all items to a new snapshot and clears the log.
+        """
+        Snapshot.write(self._snapshot_path, self.id_sequence, self.items)
+        self.log.clear()
 
     def _new_item_id(self):
         self.id_sequence += 1
@@ -27,9 +105,8 @@ class MemoryManager(Manager):
 
     @staticmethod
     def _filter_items(items, conditions):
-        for item in items:
-            if all(condition(item) for condition in conditions):
-                yield item
+        matches = compile_conditions(conditions)
+        return (item for item in items if matches(item))
 
     @staticmethod
     def _sort_items(items, sort):
@@ -37,8 +114,112 @@ class MemoryManager(Manager):
             items = sorted(items, key=lambda item: get_value(key, item, None), reverse=reverse)
         return items
 
-    def _paginate(self, items, page, per_page):
-        return Pagination.from_list(list(items), page, per_page)
+    def _index(self, item):
+        id = item[self.id_attribute]
+        for attribute, index in self.indexes.items():
+            index.add(id, get_value(attribute, item, None))
+
+    def _unindex(self, item):
+        id = item[self.id_attribute]
+        for attribute, index in self.indexes.items():
+            index.remove(id, get_value(attribute, item, None))
+
+    def _build_indexes(self):
+        for attribute, index in self.indexes.items():
+            index.build((item[self.id_attribute], get_value(attribute, item, None)) for item in self.items.values())
+
+    def _put(self, item_id, item):
+        if self.indexes:
+            if item_id in self.items:
+                self._unindex(self.items[item_id])
+            self._index(item)
+        self.items[item_id] = item
+
+    def _remove(self, item_id):
+        if self.indexes:
+            self._unindex(self.items[item_id])
+        del self.items[item_id]
+
+    def _apply(self, entries):
+        if self.indexes and len(entries) >= self.INDEX_BUILD_SIZE:
+            for item_id, item in entries:
+                if item is not None:
+                    self.items[item_id] = item
+                else:
+                    self.items.pop(item_id, None)
+            self._build_indexes()
+            return
+
+        for item_id, item in entries:
+            if item is not None:
+                self._put(item_id, item)
+            elif item_id in self.items:
+                self._remove(item_id)
+
+    def _write(self, entries):
+        """
+        Applies a list of ``(id, item)`` tuples, where ``item`` is ``None`` for deleted items, after writing them to the
+        log. The entries are removed from the log again if they cannot be applied.
+        """
+        if self.log is None:
+            self._apply(entries)
+            return
+
+        position = self.log.write(entries)
+        try:
+            self._apply(entries)
+        except Exception:
+            self.log.truncate(position)
+            raise
+
+        if self.log.size >= self.SNAPSHOT_INTERVAL:
+            self.snapshot()
+
+    def _state(self):
+        """
+        :return: a tuple of the items and indexes read by a query
+        """
+        return self.items, self.indexes
+
+    @staticmethod
+    def _ordered(items, ids):
+        # items are stored in the order of their ids, which are assigned in sequence
+        try:
+            return sorted(ids)
+        except TypeError:
+            return [id for id in items if id in ids]
+
+    def _plan(self, where=None, sort=None):
+        """
+        Picks the index that reads the fewest items for a query.
+
+        :return: a tuple of the items that may match ``where`` and whether they are already in sort order
+        """
+        items, indexes = self._state()
+
+        best = None
+        for condition in where or ():
+            index = indexes.get(condition.attribute)
+            estimate = None if index is None else index.estimate(condition)
+
+            if estimate is not None and (best is None or estimate < best[0]):
+                best = (estimate, index, condition)
+
+        if sort and len(sort) == 1:
+            field, attribute, reverse = sort[0]
+            index = indexes.get(attribute)
+
+            if index is not None and index.sortable and \
+                    (best is None or best[0] * self.SORT_INDEX_RATIO > len(items)):
+                return (items[id] for id in index.ordered_ids(reverse)), True
+
+        if best is not None:
+            estimate, index, condition = best
+            return [items[id] for id in self._ordered(items, index.lookup(condition))], False
+        return items.values(), False
+
+    def _paginate(self, items, page, per_page, sort=None, count=True):
+        return IterablePagination(items, page, per_page, sort=sort, count=count)
 
     def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
         collection = item.get(attribute, set())
@@ -58,6 +239,7 @@ class MemoryManager(Manager):
         item[attribute] = collection = item.get(attribute, set())
         item_id = target_item[target_resource.manager.id_attribute]
         collection.add(item_id)
+        self._write([(item[self.id_attribute], item)])
         after_add_to_relation.send(self.resource, item=item, attribute=attribute, child=target_item)
 
 
@@ -66,24 +248,31 @@ class MemoryManager(Manager):
         item[attribute] = collection = item.get(attribute, set())
         item_id = target_item[target_resource.manager.id_attribute]
         collection.remove(item_id)
+        self._write([(item[self.id_attribute], item)])
         after_remove_from_relation.send(self.resource, item=item, attribute=attribute, child=target_item)
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
-        return self._paginate(self.instances(where=where, sort=sort), page, per_page)
+    def paginated_instances(self, page, per_page, where=None, sort=None, count='exact', attributes=None, embed=None,
+                            stream=False):
+        items, is_sorted = self._plan(where, sort)
+
+        if where is not None:
+            items = self._filter_items(items, where)
+
+        return self._paginate(items, page, per_page, sort=None if is_sorted else sort, count=count != 'off')
 
     def instances(self, where=None, sort=None):
-        items = self.items.values()
+        items, is_sorted = self._plan(where, sort)
 
         if where is not None:
             items = self._filter_items(items, where)
-        if sort is not None:
+        if sort is not None and not is_sorted:
             items = self._sort_items(items, sort)
 
         return items
 
     def first(self, where=None, sort=None):
         try:
-            return next(self.instances(where, sort))
+            return next(iter(self.instances(where, sort)))
         except StopIteration:
             raise ItemNotFound(self.resource, where=where)
 
@@ -93,39 +282,128 @@ class MemoryManager(Manager):
         item.update(properties)
 
         if commit:
-            self.items[item_id] = item
+            self._write([(item_id, item)])
         else:
-            self.session[item_id] = item
+            self.session.append((item_id, item))
 
         return item
 
-    def read(self, id):
+    def read(self, id, attributes=None, embed=None):
         try:
-            item = self.items[id]
+            item = self._state()[0][id]
         except KeyError:
             raise ItemNotFound(self.resource, id=id)
 
         return item
 
+    def read_attributes(self, id, attributes):
+        # reads the stored item, rather than through the cache and identity map that wrap read()
+        item = type(self).read(self, id)
+        return tuple(get_value(attribute, item, None) for attribute in attributes)
+
     def update(self, item, changes, commit=True):
         item_id = item[self.id_attribute]
         item = dict(item)
         item.update(changes)
 
         if commit:
-            self.items[item_id] = item
+            self._write([(item_id, item)])
         else:
             self.session.append((item_id, item))
 
         return item
 
     def delete(self, item):
-        item_id = item[self.id_attribute]
-        del self.items[item_id]
+        self._write([(item[self.id_attribute], None)])
 
     def commit(self):
-        for item_id, item in self.session:
-            self.items[item_id] = item
+        self._write(self.session)
+        self.session = []
 
     def begin(self):
-        self.session = []
\ No newline at end of file
+        self.session = []
+
+    def rollback(self):
+        self.session = []
+
+
+class ConcurrentMemoryManager(MemoryManager):
+    """
+    A :class:`MemoryManager` that can be shared by the threads of a server. Queries read an immutable version of the
+    items and indexes without locking. Changes are applied one at a time under a lock to a copy of the latest version,
+    which is then published in a single assignment.
+
+    Every change copies the items and indexes, so this manager suits resources that are read far more often than they
+    are changed; :meth:`commit` applies the changes of a session to a single copy. Sessions are kept per thread.
+    """
+
+    def __init__(self, resource, model):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        super(ConcurrentMemoryManager, self).__init__(resource, model)
+        self._version = (self.items, self.indexes)
+
+    @property
+    def session(self):
+        try:
+            return self._local.session
+        except AttributeError:
+            session = self._local.session = []
+            return session
+
+    @session.setter
+    def session(self, session):
+        self._local.session = session
+
+    def _state(self):
+        return self._version
+
+    def _new_item_id(self):
+        with self._lock:
+            return super(ConcurrentMemoryManager, self)._new_item_id()
+
+    def _write(self, entries):
+        with self._lock:
+            items, indexes = self._version
+            self.items = items.copy()
+            self.indexes = {attribute: index.copy() for attribute, index in indexes.items()}
+
+            try:
+                super(ConcurrentMemoryManager, self)._write(entries)
+                self._version = (self.items, self.indexes)
+            finally:
+                self.items, self.indexes = self._version
+
+    def snapshot(self):
+        with self._lock:
+            super(ConcurrentMemoryManager, self).snapshot()
+
+    def _latest(self, item):
+        # changes are made to the latest version of an item, which may be newer than the version that was read
+        return self._version[0].get(item[self.id_attribute], item)
+
+    def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
+        items = []
+        for id in item.get(attribute, ()):
+            try:
+                items.append(target_resource.manager.read(id))
+            except ItemNotFound:
+                pass
+
+        return Pagination.from_list(items, page, per_page)
+
+    def relation_add(self, item, attribute, target_resource, target_item):
+        with self._lock:
+            item = dict(self._latest(item))
+            item[attribute] = set(item.get(attribute, ()))
+            super(ConcurrentMemoryManager, self).relation_add(item, attribute, target_resource, target_item)
+
+    def relation_remove(self, item, attribute, target_resource, target_item):
+        with self._lock:
+            item = dict(self._latest(item))
+            item[attribute] = set(item.get(attribute, ()))
+            super(ConcurrentMemoryManager, self).relation_remove(item, attribute, target_resource, target_item)
+
+    def update(self, item, changes, commit=True):
+        with self._lock:
+            return super(ConcurrentMemoryManager, self).update(self._latest(item), changes, commit)
@@ -0,0 +1,248 @@
+import mmap
+import os
+import struct
+from zlib import crc32
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+from six.moves import cPickle as pickle
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_SNAPSHOT_MAGIC = b'POTION\x00\x01'
+_SNAPSHOT_HEADER = struct.Struct('<8sQ')
+_LOG_RECORD_HEADER = struct.Struct('<II')
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _dumps(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _fsync(file):
+    file.flush()
+    os.fsync(file.fileno())
+
+
+class Snapshot(object):
+    """
+    A read-only, memory-mapped snapshot of the items of a :class:`MemoryManager`.
+
+    The file starts with a header pointing to an index of the ids of the items and the offsets of their records. Each
+    record is a separately pickled item, which is only read when it is accessed.
+
+    :param str path:
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, index_offset = _SNAPSHOT_HEADER.unpack_from(self._mmap, 0)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError('{} is not a snapshot'.format(path))
+
+        self.id_sequence, self.ids, self._offsets = pickle.loads(self._mmap[index_offset:])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def record(self, i):
+        """
+        :return: the pickled item with the index ``i``
+        """
+        return self._mmap[self._offsets[i]:self._offsets[i + 1]]
+
+    def read(self, i):
+        return pickle.loads(self.record(i))
+
+    def items(self):
+        for i, id in enumerate(self.ids):
+            yield id, self.read(i)
+
+    @staticmethod
+    def write(path, id_sequence, items):
+        """
+        Writes a snapshot to a temporary file, which then replaces the file at ``path``.
+
+        :param id_sequence: the last id assigned by the manager
+        :param items: a mapping of items by id
+        """
+        if isinstance(items, SnapshotItems):
+            records = items.records()
+        else:
+            records = ((id, _dumps(item)) for id, item in items.items())
+
+        ids, offsets = [], []
+        temporary_path = '{}.tmp'.format(path)
+
+        with open(temporary_path, 'wb') as file:
+            file.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, 0))
+            offset = _SNAPSHOT_HEADER.size
+            for id, record in records:
+                ids.append(id)
+                offsets.append(offset)
+                file.write(record)
+                offset += len(record)
+
+            offsets.append(offset)
+            file.write(_dumps((id_sequence, ids, offsets)))
+            file.seek(0)
+            file.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, offset))
+            _fsync(file)
+
+        _replace(temporary_path, path)
+
+
+class SnapshotItems(MutableMapping):
+    """
+    The items of a :class:`MemoryManager` by id, which are read from a :class:`Snapshot` when they are first accessed.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+        # items that have not been read yet are stored as the index of their record in the snapshot
+        self._items = dict(zip(snapshot.ids, range(len(snapshot))))
+
+    def __getitem__(self, id):
+        item = self._items[id]
+        if type(item) is int:
+            item = self._items[id] = self._snapshot.read(item)
+        return item
+
+    def __setitem__(self, id, item):
+        self._items[id] = item
+
+    def __delitem__(self, id):
+        del self._items[id]
+
+    def __contains__(self, id):
+        return id in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def copy(self):
+        items = SnapshotItems.__new__(SnapshotItems)
+        items._snapshot = self._snapshot
+        items._items = self._items.copy()
+        return items
+
+    def records(self):
+        """
+        :return: an iterator of ``(id, pickled item)`` tuples, which copies the records of items that have not been read
+        """
+        for id, item in self._items.items():
+            if type(item) is int:
+                yield id, self._snapshot.record(item)
+            else:
+                yield id, _dumps(item)
+
+
+class AppendLog(object):
+    """
+    A write-ahead log of the items stored in and deleted from a :class:`MemoryManager` since its last snapshot.
+
+    Each record is prefixed with its length and checksum; a record that was not written in full is discarded when the
+    log is replayed.
+
+    The log is locked while it is open, where the platform supports :func:`fcntl.flock`, since it can only be written
+    by one process at a time.
+
+    :param str path:
+    :param bool fsync: whether each write is synced to disk before it returns
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.size = 0
+        self._offset = 0
+        self._file = None
+
+    def open(self):
+        """
+        Reads the log, truncates any incomplete record at its end and opens it for writing.
+
+        :return: a list of ``(id, item)`` tuples, where ``item`` is ``None`` for deleted items
+        :raises RuntimeError: if the log is open in another process
+        """
+        self._file = open(self.path, 'ab')
+
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                self._file.close()
+                raise RuntimeError('{} is in use by another process'.format(self.path))
+
+        with open(self.path, 'rb') as file:
+            data = file.read()
+
+        entries = []
+        offset = 0
+        while offset + _LOG_RECORD_HEADER.size <= len(data):
+            length, checksum = _LOG_RECORD_HEADER.unpack_from(data, offset)
+            start = offset + _LOG_RECORD_HEADER.size
+            record = data[start:start + length]
+
+            if len(record) < length or crc32(record) & 0xffffffff != checksum:
+                break
+
+            entries.append(pickle.loads(record))
+            offset = start + length
+
+        self._truncate(offset, len(entries))
+        return entries
+
+    def write(self, entries):
+        """
+        :param entries: a list of ``(id, item)`` tuples, where ``item`` is ``None`` for deleted items
+        :return: the position of the log before the entries, which :meth:`truncate` returns to
+        """
+        position = self._offset, self.size
+
+        for entry in entries:
+            record = _dumps(entry)
+            self._file.write(_LOG_RECORD_HEADER.pack(len(record), crc32(record) & 0xffffffff))
+            self._file.write(record)
+            self._offset += _LOG_RECORD_HEADER.size + len(record)
+            self.size += 1
+
+        if self.fsync:
+            _fsync(self._file)
+        else:
+            self._file.flush()
+        return position
+
+    def truncate(self, position):
+        """
+        Discards the records written since ``position``, such as changes that could not be applied.
+
+        :param position: a position returned by :meth:`write`
+        """
+        offset, size = position
+        self._truncate(offset, size)
+        _fsync(self._file)
+
+    def _truncate(self, offset, size):
+        self._file.flush()
+        self._file.truncate(offset)
+        self._offset = offset
+        self.size = size
+
+    def clear(self):
+        self.truncate((0, 0))
+
+    def close(self):
+        self._file.close()
@@ -5,13 +5,14 @@ from bson.errors import InvalidId
 
 from flask import current_app
 from mongoengine.errors import OperationError, ValidationError
+from mongoengine.queryset.visitor import Q
 import mongoengine.fields as mongo_fields
 from flask_mongoengine import Pagination as MEPagination
 
 from flask_potion.contrib.mongoengine.filters import FILTER_NAMES, FILTERS_BY_TYPE
 from flask_potion.utils import get_value
-from flask_potion.exceptions import ItemNotFound, BackendConflict
-from flask_potion.instances import Pagination
+from flask_potion.exceptions import ItemNotFound, BackendConflict, PageNotFound
+from flask_potion.instances import Pagination, KeysetPagination
 from flask_potion.manager import Manager
 from flask_potion.signals import before_create, before_update, after_update, before_delete, after_delete, after_create, \
     before_add_to_relation, after_remove_from_relation, before_remove_from_relation, after_add_to_relation
@@ -211,8 +212,54 @@ class MongoEngineManager(Manager):
             item.save()
             after_remove_from_relation.send(self.resource, item=item, attribute=attribute, child=target_item)
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
-        return self.instances(where=where, sort=sort).paginate(page=page, per_page=per_page)
+    def _query_load_only(self, query, attributes):
+        if any(attribute not in self.model._fields for attribute in attributes):
+            return query
+        return query.only(*attributes)
+
+    @staticmethod
+    def _fetch(query, embed=None):
+        if not embed:
+            return list(query)
+
+        # dereferences the references of all items with one query per collection
+        return query.select_related(max_depth=max(len(path.split('.')) for path in embed))
+
+    def paginated_instances(self, page, per_page, where=None, sort=None, count='exact', attributes=None, embed=None,
+                            stream=False):
+        query = self.instances(where=where, sort=sort)
+        if attributes is not None:
+            query = self._query_load_only(query, attributes)
+
+        # embedded references are dereferenced for a whole page at once, so such pages are read up front
+        if stream and not embed:
+            page_query = query.skip((page - 1) * per_page).limit(per_page).no_cache().batch_size(self.STREAM_BATCH_SIZE)
+            return self._query_pagination(page, per_page, where, count,
+                                          page_query.clone,
+                                          lambda offset: self.instances(where=where).skip(offset).limit(1)
+                                                             .count(with_limit_and_skip=True) > 0,
+                                          lambda: self.instances(where=where).count(),
+                                          None if where else self.model._get_collection().estimated_document_count)
+
+        if count == 'exact' and not embed:
+            return query.paginate(page=page, per_page=per_page)
+
+        items = self._fetch(query.skip((page - 1) * per_page).limit(per_page + 1), embed)
+
+        if not items and page > 1:
+            raise PageNotFound()
+
+        if count == 'off':
+            return Pagination(items[:per_page], page, per_page, None, has_next=len(items) > per_page)
+
+        if page == 1 and len(items) <= per_page:
+            total = len(items)
+        else:
+            # the collection metadata only give an estimate for the whole collection
+            estimated = None if where else self.model._get_collection().estimated_document_count
+            total = self._total(where, count, lambda: self.instances(where=where).count(), estimated)
+
+        return Pagination(items[:per_page], page, per_page, total, has_next=len(items) > per_page)
 
     def instances(self, where=None, sort=None):
         query = self.model.objects
@@ -226,6 +273,51 @@ class MongoEngineManager(Manager):
 
         return query
 
+    @staticmethod
+    def _seek_expression(keys, values):
+        # MongoDB sorts null and missing values before all others, so they come first in ascending order and last in
+        # descending order, and range conditions never match them
+        expression = None
+
+        for i, (field, attribute, reverse) in enumerate(keys):
+            value = values[i]
+
+            if value is None:
+                # no value follows a null value in descending order
+                if reverse:
+                    continue
+                condition = Q(**{'{}__ne'.format(attribute): None})
+            elif reverse:
+                condition = Q(**{'{}__lt'.format(attribute): value}) | Q(**{attribute: None})
+            else:
+                condition = Q(**{'{}__gt'.format(attribute): value})
+
+            for (f, a, r), v in zip(keys[:i], values[:i]):
+                condition &= Q(**{a: v})
+            expression = condition if expression is None else expression | condition
+
+        return expression
+
+    def keyset_instances(self, per_page, where=None, sort=None, after=None, before=None, attributes=None,
+                         embed=None):
+        keys = self._keyset(sort)
+        backwards = before is not None
+        cursor = before if backwards else after
+
+        if backwards:
+            order = tuple((field, attribute, not reverse) for field, attribute, reverse in keys)
+        else:
+            order = keys
+
+        query = self.instances(where, order)
+        if cursor:
+            query = query.filter(self._seek_expression(order, cursor))
+        if attributes is not None:
+            query = self._query_load_only(query, attributes)
+
+        items = self._fetch(query.limit(per_page + 1), embed)
+        return KeysetPagination.from_items(items, keys, per_page, cursor, backwards)
+
     def first(self, where=None, sort=None):
         res = self.instances(where, sort).first()
         if res is None:
@@ -251,9 +343,42 @@ class MongoEngineManager(Manager):
         after_create.send(self.resource, item=item)
         return item
 
-    def read(self, id):
+    def create_many(self, items):
+        created = []
+
+        for properties in items:
+            item = self.model()
+
+            for key, value in properties.items():
+                setattr(item, key, value)
+
+            before_create.send(self.resource, item=item)
+            created.append(item)
+
+        if created:
+            try:
+                ids = self.model.objects.insert(created, load_bulk=False)
+            except OperationError as e:
+                if current_app.debug:
+                    raise BackendConflict(debug_info=dict(statement=e.args))
+                raise BackendConflict()
+
+            for item, id in zip(created, ids):
+                item.pk = id
+
+        for item in created:
+            after_create.send(self.resource, item=item)
+        return created
+
+    def read(self, id, attributes=None, embed=None):
+        query = self.model.objects(**{self.id_attribute: id})
+        if attributes is not None:
+            query = self._query_load_only(query, attributes)
+
         try:
-            return self.model.objects(**{self.id_attribute: id}).first()
+            if embed:
+                return next(iter(self._fetch(query.limit(1), embed)), None)
+            return query.first()
         except (InvalidId, ValidationError):
             raise ItemNotFound(self.resource, id=id)
 
@@ -281,3 +406,19 @@ class MongoEngineManager(Manager):
         before_delete.send(self.resource, item=item)
         item.delete()
         after_delete.send(self.resource, item=item)
+
+    def update_where(self, where, changes, signals=False):
+        if signals:
+            return super(MongoEngineManager, self).update_where(where, changes, signals)
+
+        try:
+            return self.instances(where).update(**{'set__{}'.format(key): value for key, value in changes.items()})
+        except OperationError as e:
+            if current_app.debug:
+                raise BackendConflict(debug_info=dict(statement=e.args))
+            raise BackendConflict()
+
+    def delete_where(self, where, signals=False):
+        if signals:
+            return super(MongoEngineManager, self).delete_where(where, signals)
+        return self.instances(where).delete()
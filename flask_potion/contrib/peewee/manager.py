@@ -1,4 +1,6 @@
 from __future__ import absolute_import
+from functools import reduce
+import operator
 from flask import current_app
 import peewee as pw
 
@@ -8,7 +10,7 @@ except ImportError:
     postgres_ext = False
 
 from flask_potion import fields, signals
-from flask_potion.instances import Pagination
+from flask_potion.instances import Pagination, KeysetPagination
 from flask_potion.contrib.peewee.filters import FILTER_NAMES, FILTERS_BY_TYPE, PeeweeBaseFilter
 from flask_potion.exceptions import ItemNotFound, BackendConflict
 from flask_potion.manager import Manager
@@ -125,10 +127,15 @@ class PeeweeManager(Manager):
     def _query(self):
         return self.model.select()
 
-    def _order_by(self, sort):
+    def _order_by(self, sort, nulls_first=False):
         for field, attribute, reverse in sort:
             column = getattr(self.model, attribute)
 
+            # databases differ in where they sort null values; "IS NOT NULL" sorts them first on every database
+            if nulls_first and column.null:
+                not_null = column.is_null(False)
+                yield not_null.desc() if reverse else not_null.asc()
+
             if reverse:
                 yield column.desc()
             else:
@@ -172,10 +179,75 @@ class PeeweeManager(Manager):
         signals.after_remove_from_relation.send(
             self.resource, item=item, attribute=attribute, child=target_item)
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
-        query = self.instances(where, sort)
-        # TODO see if this can be better done in one query
-        return Pagination(query.paginate(page, per_page), page, per_page, query.count())
+    def _query_load_only(self, query, attributes):
+        fields = self.model._meta.fields
+
+        if any(attribute not in fields for attribute in attributes):
+            return query
+
+        return query.select(self.id_column, *[fields[attribute] for attribute in attributes
+                                              if fields[attribute] is not self.id_column])
+
+    def _query_embed(self, query, paths):
+        joined = []
+
+        for path in paths:
+            model = self.model
+            query = query.switch(self.model)
+
+            for attribute in path.split('.'):
+                field = model._meta.fields.get(attribute)
+
+                # self-references would need an alias
+                if not isinstance(field, pw.ForeignKeyField) or field.rel_model is self.model:
+                    break
+
+                model = field.rel_model
+                if model in joined:
+                    query = query.switch(model)
+                else:
+                    query = query.join(model, pw.JOIN_LEFT_OUTER, on=field)
+                    joined.append(model)
+
+        if not joined:
+            return query
+
+        # peewee attaches the referenced items to each item when the joined models are selected
+        return query.switch(self.model).select(self.model, *joined)
+
+    def _query_options(self, query, attributes=None, embed=None):
+        # embedding selects whole models, so it takes precedence over a projection
+        if embed:
+            return self._query_embed(query, embed)
+        if attributes is not None:
+            return self._query_load_only(query, attributes)
+        return query
+
+    def paginated_instances(self, page, per_page, where=None, sort=None, count='exact', attributes=None, embed=None,
+                            stream=False):
+        query = self._query_options(self.instances(where, sort), attributes, embed)
+
+        if stream:
+            # iterator() reads the rows from the cursor without keeping them in the query
+            page_query = query.limit(per_page).offset((page - 1) * per_page)
+            return self._query_pagination(page, per_page, where, count,
+                                          page_query.iterator,
+                                          lambda offset: self.instances(where)
+                                                             .select(self.model._meta.primary_key)
+                                                             .offset(offset).limit(1).scalar() is not None,
+                                          lambda: self.instances(where).count())
+
+        items = list(query.limit(per_page + 1).offset((page - 1) * per_page))
+
+        if count == 'off':
+            return Pagination(items[:per_page], page, per_page, None, has_next=len(items) > per_page)
+
+        if page == 1 and len(items) <= per_page:
+            total = len(items)
+        else:
+            total = self._total(where, count, lambda: self.instances(where).count())
+
+        return Pagination(items[:per_page], page, per_page, total, has_next=len(items) > per_page)
 
     def instances(self, where=None, sort=None):
         query = self._query()
@@ -187,6 +259,51 @@ class PeeweeManager(Manager):
 
         return query
 
+    def _seek_expression(self, keys, values):
+        # keys that can be null sort null values first, as ordered by _order_by() with nulls_first=True
+        def equal(column, value):
+            return column.is_null() if value is None else column == value
+
+        def follows(column, value, reverse):
+            if value is None:
+                return None if reverse else column.is_null(False)
+            if reverse:
+                return (column < value) | column.is_null()
+            return column > value
+
+        expressions = []
+
+        for i, (field, attribute, reverse) in enumerate(keys):
+            condition = follows(getattr(self.model, attribute), values[i], reverse)
+
+            # no value follows a null value in descending order
+            if condition is not None:
+                equal_keys = [equal(getattr(self.model, a), v) for (f, a, r), v in zip(keys[:i], values[:i])]
+                expressions.append(reduce(operator.and_, equal_keys + [condition]))
+
+        return reduce(operator.or_, expressions)
+
+    def keyset_instances(self, per_page, where=None, sort=None, after=None, before=None, attributes=None,
+                         embed=None):
+        keys = self._keyset(sort)
+        backwards = before is not None
+        cursor = before if backwards else after
+
+        if backwards:
+            order = tuple((field, attribute, not reverse) for field, attribute, reverse in keys)
+        else:
+            order = keys
+
+        query = self._query()
+        if where:
+            query = PeeweeBaseFilter.apply(query, where)
+        if cursor:
+            query = query.where(self._seek_expression(order, cursor))
+        query = self._query_options(query, attributes, embed)
+
+        items = list(query.order_by(*self._order_by(order, nulls_first=True)).limit(per_page + 1))
+        return KeysetPagination.from_items(items, keys, per_page, cursor, backwards)
+
     def first(self, where=None, sort=None):
         try:
             return self.instances(where, sort).first()
@@ -212,9 +329,36 @@ class PeeweeManager(Manager):
         signals.after_create.send(self.resource, item=item)
         return item
 
-    def read(self, id):
+    def create_many(self, items):
+        created = []
+
+        for properties in items:
+            item = self.model()
+
+            for key, value in properties.items():
+                setattr(item, key, value)
+
+            signals.before_create.send(self.resource, item=item)
+            created.append(item)
+
         try:
-            return self.model.get(self.id_column == id)
+            with self.model._meta.database.atomic():
+                for item in created:
+                    item.save()
+        except pw.IntegrityError as e:
+            if current_app.debug:
+                raise BackendConflict(debug_info=e.args)
+            raise BackendConflict()
+
+        for item in created:
+            signals.after_create.send(self.resource, item=item)
+        return created
+
+    def read(self, id, attributes=None, embed=None):
+        query = self._query_options(self._query(), attributes, embed)
+
+        try:
+            return query.where(self.id_column == id).get()
         except self.model.DoesNotExist:
             raise ItemNotFound(self.resource, id=id)
 
@@ -248,4 +392,34 @@ class PeeweeManager(Manager):
         item.delete_instance()
 
         signals.after_delete.send(
-            self.resource, item=item)
\ No newline at end of file
+            self.resource, item=item)
+
+    def update_where(self, where, changes, signals=False):
+        if signals:
+            return super(PeeweeManager, self).update_where(where, changes, signals)
+
+        query = self.model.update(**changes)
+        if where:
+            query = PeeweeBaseFilter.apply(query, where)
+
+        try:
+            return query.execute()
+        except pw.IntegrityError as e:
+            if current_app.debug:
+                raise BackendConflict(debug_info=e.args)
+            raise BackendConflict()
+
+    def delete_where(self, where, signals=False):
+        if signals:
+            return super(PeeweeManager, self).delete_where(where, signals)
+
+        query = self.model.delete()
+        if where:
+            query = PeeweeBaseFilter.apply(query, where)
+
+        try:
+            return query.execute()
+        except pw.IntegrityError as e:
+            if current_app.debug:
+                raise BackendConflict(debug_info=e.args)
+            raise BackendConflict()
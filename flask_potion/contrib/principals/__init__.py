@@ -1,4 +1,5 @@
 import six
+from flask import g, has_app_context
 from sqlalchemy.orm.collections import InstrumentedList
 from werkzeug.exceptions import Forbidden
 from werkzeug.utils import cached_property
@@ -118,6 +119,14 @@ class PrincipalMixin(object):
         """
         return {operation: permission.can(item) for operation, permission in self._permissions.items()}
 
+    def can_read_item(self, item):
+        """
+        Looks up permissions on whether an item may be read.
+        :param item:
+        """
+        permission = self._permissions['read']
+        return permission.can(item)
+
     def can_create_item(self, item):
         """
         Looks up permissions on whether an item may be created.
@@ -143,6 +152,17 @@ class PrincipalMixin(object):
         permission = self._permissions['delete']
         return permission.can(item)
 
+    def _permission_key(self):
+        if True in self._needs['read']:
+            return None
+
+        identity = g.get('identity') if has_app_context() else None
+        if identity is None:
+            return ()
+
+        # needs are tuples, whose representation is stable across processes
+        return tuple(sorted(repr(need) for need in identity.provides))
+
     def _query_filter_read_permission(self, query):
         read_permission = self._permissions['read']
         return self._query_filter_permission(query, read_permission)
@@ -214,6 +234,12 @@ class PrincipalMixin(object):
             raise Forbidden()
         return super(PrincipalMixin, self).create(properties, commit)
 
+    def create_many(self, items):
+        for properties in items:
+            if not self.can_create_item(properties):
+                raise Forbidden()
+        return super(PrincipalMixin, self).create_many(items)
+
     def update(self, item, changes, *args, **kwargs):
         if not self.can_update_item(item, changes):
             raise Forbidden()
@@ -224,6 +250,17 @@ class PrincipalMixin(object):
             raise Forbidden()
         return super(PrincipalMixin, self).delete(item)
 
+    def update_where(self, where, changes, signals=False):
+        # set-based updates are only possible when the permission does not depend on the item
+        if not self._permissions['update'].can():
+            return RelationalManager.update_where(self, where, changes, signals)
+        return super(PrincipalMixin, self).update_where(where, changes, signals)
+
+    def delete_where(self, where, signals=False):
+        if not self._permissions['delete'].can():
+            return RelationalManager.delete_where(self, where, signals)
+        return super(PrincipalMixin, self).delete_where(where, signals)
+
 
 def principals(manager):
     if not issubclass(manager, RelationalManager):
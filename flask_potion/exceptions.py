@@ -29,16 +29,22 @@ class PotionException(Exception):
 class ItemNotFound(PotionException):
     werkzeug_exception = NotFound
 
-    def __init__(self, resource, where=None, id=None):
+    def __init__(self, resource, where=None, id=None, ids=None):
         super(ItemNotFound, self).__init__()
         self.resource = resource
         self.id = id
+        self.ids = ids
         self.where = where
 
     def as_dict(self):
         dct = super(ItemNotFound, self).as_dict()
 
-        if self.id is not None:
+        if self.ids is not None:
+            dct['items'] = [{
+                "$type": self.resource.meta.name,
+                "$id": id
+            } for id in self.ids]
+        elif self.id is not None:
             dct['item'] = {
                 "$type": self.resource.meta.name,
                 "$id": self.id
@@ -124,3 +130,11 @@ class PageNotFound(PotionException):
 
 class InvalidJSON(PotionException):
     werkzeug_exception = BadRequest
+
+
+class InvalidCursor(PotionException):
+    werkzeug_exception = BadRequest
+
+
+class InvalidFields(PotionException):
+    werkzeug_exception = BadRequest
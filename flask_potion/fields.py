@@ -1,4 +1,5 @@
 import calendar
+from collections import OrderedDict
 from datetime import datetime
 import re
 
@@ -7,9 +8,9 @@ from flask import current_app, request
 import six
 from werkzeug.utils import cached_property
 
-from flask_potion.utils import get_value, route_from
+from flask_potion.utils import get_value, route_item_id, unpack
 from flask_potion.reference import ResourceReference, ResourceBound, _bind_schema
-from flask_potion.schema import Schema
+from flask_potion.schema import Schema, SchemaImpl
 
 class Raw(Schema):
     """
@@ -150,6 +151,46 @@ class Raw(Schema):
         key = key if self.attribute is None else self.attribute
         return self.format(get_value(key, obj, self.default))
 
+    def _format_function(self):
+        """
+        :return: :meth:`format`, or ``None`` if it returns values unchanged
+        """
+        if _overrides(self, Raw, 'format') or _overrides(self, Raw, 'formatter'):
+            return self.format
+        return None
+
+    def _convert_function(self):
+        """
+        :return: a function equivalent to ``lambda value: self.convert(value, validate=False)``, or ``None`` if it
+            returns values unchanged
+        """
+        if _overrides(self, Raw, 'convert'):
+            convert = self.convert
+            return lambda value: convert(value, validate=False)
+        if _overrides(self, Raw, 'converter'):
+            converter = self.converter
+            return lambda value: None if value is None else converter(value)
+        return None
+
+    def _output_function(self, key, item_type):
+        """
+        Returns a function equivalent to ``lambda item: self.output(key, item)`` for items of the given type, which
+        reads the value directly from the item and skips formatters that do nothing.
+
+        :param str key:
+        :param type item_type:
+        """
+        if _overrides(self, Raw, 'output'):
+            output = self.output
+            return lambda item: output(key, item)
+
+        get = _value_getter(key if self.attribute is None else self.attribute, item_type, self)
+        format = self._format_function()
+
+        if format is None:
+            return get
+        return lambda item: format(get(item))
+
     def __repr__(self):
         return '{}(attribute={})'.format(self.__class__.__name__, repr(self.attribute))
 
@@ -161,6 +202,38 @@ class Any(Raw):
     def __init__(self, **kwargs):
         super(Any, self).__init__({"type": ["null", "string", "number", "boolean", "object", "array"]}, **kwargs)
 
+def _overrides(field, cls, name):
+    return six.get_unbound_function(getattr(type(field), name)) is not six.get_unbound_function(getattr(cls, name))
+
+
+_MISSING = object()
+
+
+def _value_getter(key, item_type, field=None):
+    """
+    Returns a function equivalent to ``lambda item: get_value(key, item, field.default)`` for items of the given type.
+    """
+    if not hasattr(item_type, '__getitem__'):
+        def get(item):
+            value = getattr(item, key, _MISSING)
+            if value is _MISSING:
+                return field.default if field else None
+            return value
+    elif issubclass(item_type, dict) and item_type.__getitem__ is dict.__getitem__:
+        def get(item):
+            try:
+                return item[key]
+            except KeyError:
+                value = getattr(item, key, _MISSING)
+                if value is _MISSING:
+                    return field.default if field else None
+                return value
+    else:
+        def get(item):
+            return get_value(key, item, field.default if field else None)
+    return get
+
+
 def _field_from_object(parent, cls_or_instance):
     # --- start of Flask-RESTful code ---
     # Copyright (c) 2013, Twilio, Inc.
@@ -240,7 +313,24 @@ class Array(Raw, ResourceBound):
     def formatter(self, value):
         return [self.container.format(v) for v in value]
 
+    def _format_function(self):
+        if _overrides(self, Array, 'format') or _overrides(self, Array, 'formatter') \
+                or self.container._format_function() is not None:
+            return self.format
+
+        nullable = self.nullable
+
+        def format(value):
+            if value is not None:
+                return list(value)
+            if not nullable:
+                return []
+            return value
+        return format
+
     def converter(self, value):
+        if isinstance(self.container, ToOne):
+            return self.container.convert_many(value)
         return [self.container.convert(v) for v in value]
 
 
@@ -685,14 +775,85 @@ class ToOne(Raw, ResourceBound):
     def formatter(self, item):
         return self.formatter_key.format(item)
 
-    def converter(self, value):
+    def _foreign_key(self, attribute):
+        format_id = getattr(self.formatter_key, 'format_id', None)
+        manager = getattr(self.resource, 'manager', None)
+
+        if format_id is not None and manager is not None:
+            return manager.foreign_key_attribute(attribute, self.target)
+        return None
+
+    def output(self, key, obj):
+        attribute = key if self.attribute is None else self.attribute
+        foreign_key = self._foreign_key(attribute)
+
+        # format the reference from the foreign key, without loading the referenced item
+        if foreign_key is not None:
+            id = get_value(foreign_key, obj, None)
+            return None if id is None else self.formatter_key.format_id(id)
+
+        return self.format(get_value(attribute, obj, self.default))
+
+    def _output_function(self, key, item_type):
+        attribute = key if self.attribute is None else self.attribute
+        foreign_key = self._foreign_key(attribute)
+        format = self.format
+
+        if foreign_key is None:
+            get = _value_getter(attribute, item_type, self)
+            return lambda item: format(get(item))
+
+        get_id = _value_getter(foreign_key, item_type)
+        format_id = self.formatter_key.format_id
+
+        def output(item):
+            id = get_id(item)
+            return None if id is None else format_id(id)
+        return output
+
+    def format_embedded(self, item, embed=None):
+        """
+        Formats the referenced item inline using the schema of the target resource. Items that the current user may
+        not read according to :meth:`manager.Manager.can_read_item` are formatted as references.
+
+        :param item:
+        :param dict embed: references of the target to embed in turn
+        """
+        if item is None:
+            return None
+        if not self.target.manager.can_read_item(item):
+            return self.format(item)
+        return self.target.schema.format(item, embed=embed)
+
+    def _key_converter(self, value):
         for python_type, json_type in (
                 (dict, 'object'),
                 (int, 'integer'),
                 ((list, tuple), 'array'),
                 (six.string_types, 'string')):
             if isinstance(value, python_type):
-                return self.target.meta.key_converters_by_type[json_type].convert(value)
+                return self.target.meta.key_converters_by_type[json_type]
+
+    def converter(self, value):
+        return self._key_converter(value).convert(value)
+
+    def convert_many(self, values):
+        """
+        Converts a list of references, resolving all references of the same key type together.
+
+        :return: a list of items in the order of ``values``
+        """
+        items = list(values)
+        groups = OrderedDict()
+
+        for i, value in enumerate(values):
+            if value is not None:
+                groups.setdefault(self._key_converter(value), []).append(i)
+
+        for key_converter, indices in groups.items():
+            for i, item in zip(indices, key_converter.convert_many([values[i] for i in indices])):
+                items[i] = item
+        return items
 
 
 class ToMany(Array):
@@ -702,6 +863,18 @@ class ToMany(Array):
     def __init__(self, resource, **kwargs):
         super(ToMany, self).__init__(ToOne(resource, nullable=False), **kwargs)
 
+    @property
+    def target(self):
+        return self.container.target
+
+    def format_embedded(self, items, embed=None):
+        """
+        Formats the referenced items inline using the schema of the target resource.
+        """
+        if items is None:
+            return None
+        return [self.container.format_embedded(item, embed) for item in items]
+
 
 class Inline(Raw, ResourceBound):
     """
@@ -709,11 +882,16 @@ class Inline(Raw, ResourceBound):
 
     :param resource: a resource reference as in :class:`ToOne`
     :param bool patchable: whether to allow partial objects
+    :param bool many: whether to also accept and format arrays of items
+    :param bool select: whether to format only the fields and references selected with the ``fields`` and ``embed``
+        query string parameters in responses
     """
 
-    def __init__(self, resource, patchable=False, **kwargs):
+    def __init__(self, resource, patchable=False, many=False, select=False, **kwargs):
         self.target_reference = ResourceReference(resource)
         self.patchable = patchable
+        self.many = many
+        self.select = select
 
         def schema():
             def _response_schema():
@@ -721,10 +899,15 @@ class Inline(Raw, ResourceBound):
                     return {"$ref": "#"}
                 return {"$ref": self.target.routes["describedBy"].rule_factory(self.target)}
 
+            def _many_schema(schema):
+                if not self.many:
+                    return schema
+                return {"anyOf": [schema, {"type": "array", "items": schema}]}
+
             if not self.patchable:
-                return _response_schema()
+                return _many_schema(_response_schema())
             else:
-                return _response_schema(), self.target.schema.patchable.update
+                return _many_schema(_response_schema()), _many_schema(self.target.schema.patchable.update)
 
         super(Inline, self).__init__(schema, **kwargs)
 
@@ -733,6 +916,8 @@ class Inline(Raw, ResourceBound):
             return self.__class__(
                 'self',
                 patchable=self.patchable,
+                many=self.many,
+                select=self.select,
                 default=self.default,
                 attribute=self.attribute,
                 nullable=self.nullable,
@@ -747,13 +932,37 @@ class Inline(Raw, ResourceBound):
     def target(self):
         return self.target_reference.resolve(self.resource)
 
-    def format(self, item):
-        return self.target.schema.format(item)
+    @cached_property
+    def _array_schema(self):
+        schema = self.target.schema.patchable if self.patchable else self.target.schema
+        create = {"type": "array", "items": schema.create}
+        return SchemaImpl((create, create, {"type": "array", "items": schema.update}))
+
+    def format(self, item, fields=None, embed=None):
+        if self.many and isinstance(item, (list, tuple)):
+            return [self.target.schema.format(i, fields, embed) for i in item]
+        return self.target.schema.format(item, fields, embed)
+
+    def format_response(self, response):
+        if not self.select:
+            return super(Inline, self).format_response(response)
+
+        data, code, headers = unpack(response)
+        schema = self.target.schema
+        fields = schema.select(request.args.get('fields'))
+        embed = schema.select_embed(request.args.get('embed'), current_app.config['POTION_MAX_EMBED_DEPTH'])
+        return self.format(data, fields, embed), code, headers
 
     def convert(self, item, update=False, validate=True):
         if not validate:
             raise NotImplementedError()
 
+        if self.many and isinstance(item, list):
+            # validate the array as a whole so that errors are reported with the index of the item
+            self._array_schema.convert(item, update=update)
+            return [self.target.schema.convert(i, update=update, patchable=self.patchable, validate=False)
+                    for i in item]
+
         return self.target.schema.convert(item, update=update, patchable=self.patchable)
 
 
@@ -771,6 +980,10 @@ class ItemType(Raw):
     def format(self, value):
         return self.resource.meta.name
 
+    def _output_function(self, key, item_type):
+        name = self.resource.meta.name
+        return lambda item: name
+
 
 class ItemUri(Raw):
     """
@@ -791,8 +1004,4 @@ class ItemUri(Raw):
         return '{}/{}'.format(self.target.route_prefix, value)
 
     def converter(self, value):
-        try:
-            endpoint, args = route_from(value, 'GET')
-        except Exception as e:
-            raise e
-        return self.target.manager.id_field.convert(args['id'])
+        return self.target.manager.id_field.convert(route_item_id(self.target, value))
@@ -1,3 +1,4 @@
+import six
 from werkzeug.utils import cached_property
 
 from .schema import Schema
@@ -40,6 +41,9 @@ class BaseFilter(Schema):
         is specified as: `?where={"field": {"$foo": filter-expression}}`
     """
 
+    # estimated fraction of items matched by a condition, used to order the tests of a compiled predicate
+    selectivity = 0.5
+
     def __init__(self, name, field=None, attribute=None):
         self.attribute = attribute or field.attribute
         self.field = field
@@ -55,6 +59,19 @@ class BaseFilter(Schema):
         """
         raise NotImplemented()
 
+    def _overrides_op(self, cls):
+        return six.get_unbound_function(type(self).op) is not six.get_unbound_function(cls.op)
+
+    def predicate(self, b):
+        """
+        Returns a function equivalent to ``lambda a: self.op(a, b)``. Filters can override this to prepare ``b``
+        once rather than for every item.
+
+        :param b: value filtered by
+        """
+        op = self.op
+        return lambda a: op(a, b)
+
     @property
     def filter_field(self):
         return self.field
@@ -94,11 +111,15 @@ class BaseFilter(Schema):
 
 
 class EqualFilter(BaseFilter):
+    selectivity = 0.1
+
     def op(self, a, b):
         return a == b
 
 
 class NotEqualFilter(BaseFilter):
+    selectivity = 0.9
+
     def op(self, a, b):
         return a != b
 
@@ -134,6 +155,7 @@ class GreaterThanEqualFilter(NumberBaseFilter):
 
 class InFilter(BaseFilter):
     min_items = 0
+    selectivity = 0.2
 
     @cached_property
     def filter_field(self):
@@ -144,6 +166,22 @@ class InFilter(BaseFilter):
     def op(self, a, b):
         return a in b
 
+    def predicate(self, b):
+        if self._overrides_op(InFilter):
+            return super(InFilter, self).predicate(b)
+
+        try:
+            values = frozenset(b)
+        except TypeError:
+            return lambda a: a in b
+
+        def predicate(a):
+            try:
+                return a in values
+            except TypeError:
+                return a in b
+        return predicate
+
 
 class ContainsFilter(BaseFilter):
     @cached_property
@@ -173,16 +211,34 @@ class StringIContainsFilter(BaseFilter):
     def op(self, a, b):
         return a and b.lower() in a.lower()
 
+    def predicate(self, b):
+        if self._overrides_op(StringIContainsFilter):
+            return super(StringIContainsFilter, self).predicate(b)
+
+        b = b.lower()
+        return lambda a: a and b in a.lower()
+
 
 class StartsWithFilter(StringBaseFilter):
+    selectivity = 0.2
+
     def op(self, a, b):
         return a.startswith(b)
 
 
 class IStartsWithFilter(StringBaseFilter):
+    selectivity = 0.2
+
     def op(self, a, b):
         return a.lower().startswith(b.lower())
 
+    def predicate(self, b):
+        if self._overrides_op(IStartsWithFilter):
+            return super(IStartsWithFilter, self).predicate(b)
+
+        b = b.lower()
+        return lambda a: a.lower().startswith(b)
+
 
 class EndsWithFilter(StringBaseFilter):
     def op(self, a, b):
@@ -193,6 +249,13 @@ class IEndsWithFilter(StringBaseFilter):
     def op(self, a, b):
         return a.lower().endswith(b.lower())
 
+    def predicate(self, b):
+        if self._overrides_op(IEndsWithFilter):
+            return super(IEndsWithFilter, self).predicate(b)
+
+        b = b.lower()
+        return lambda a: a.lower().endswith(b)
+
 
 class DateBetweenFilter(BaseFilter):
     @cached_property
@@ -201,10 +264,19 @@ class DateBetweenFilter(BaseFilter):
                      min_items=2,
                      max_items=2)
 
+    selectivity = 0.3
+
     def op(self, a, b):
         before, after = b
         return before <= a <= after
 
+    def predicate(self, b):
+        if self._overrides_op(DateBetweenFilter):
+            return super(DateBetweenFilter, self).predicate(b)
+
+        before, after = b
+        return lambda a: before <= a <= after
+
 
 EQUALITY_FILTER_NAME = 'eq'
 
@@ -324,6 +396,33 @@ class Condition(object):
         return self.filter.op(get_value(self.attribute, item, None), self.value)
 
 
+def compile_conditions(conditions):
+    """
+    Compiles conditions into a single predicate for items that match all of them. Values are prepared once by
+    :meth:`BaseFilter.predicate`, and the most selective conditions are tested first.
+
+    :param conditions: a sequence of :class:`Condition` objects
+    :return: a function that returns whether an item matches every condition
+    """
+    tests = [(attribute, predicate) for selectivity, i, attribute, predicate in sorted(
+        (condition.filter.selectivity, i, condition.attribute, condition.filter.predicate(condition.value))
+        for i, condition in enumerate(conditions))]
+
+    if not tests:
+        return lambda item: True
+
+    if len(tests) == 1:
+        (attribute, predicate), = tests
+        return lambda item: predicate(get_value(attribute, item, None))
+
+    def matches(item):
+        for attribute, predicate in tests:
+            if not predicate(get_value(attribute, item, None)):
+                return False
+        return True
+    return matches
+
+
 def _get_names_for_filter(filter, filter_names=FILTER_NAMES):
     for f, name in filter_names:
         if f == filter:
@@ -1,13 +1,50 @@
 from __future__ import division
+import base64
 import collections
+from functools import cmp_to_key
+import heapq
+from itertools import islice
 from math import ceil
-from flask import json, request, current_app
+from flask import request, current_app, Response, stream_with_context
+from werkzeug.urls import url_encode
 from werkzeug.utils import cached_property
-from .filters import convert_filters
-from .exceptions import InvalidJSON
-from .fields import ToMany
-from .reference import ResourceBound
+from .codec import current_codec
+from .filters import BaseFilter, Condition, convert_filters
+from .exceptions import InvalidJSON, InvalidCursor
+from .fields import ToMany, ToOne, Array, Object, Inline, Custom, Raw, _overrides
+from .reference import ResourceBound, _bind_schema
 from .schema import Schema
+from .utils import get_value, LRUCache
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+COUNT_MODES = ('exact', 'off', 'estimated', 'cached')
+
+
+def _converts_independently(field):
+    """
+    Whether values of a field are converted without depending on the current request or the stored items, which is not
+    the case for references that are resolved or for custom converters.
+    """
+    if isinstance(field, (ToOne, ToMany, Inline, Custom)):
+        return False
+    if isinstance(field, Array):
+        return _converts_independently(field.container)
+    if isinstance(field, Object):
+        nested = list((field.properties or {}).values()) + list((field.pattern_properties or {}).values())
+        if isinstance(field.additional_properties, Raw):
+            nested.append(field.additional_properties)
+        return all(_converts_independently(f) for f in nested)
+    return True
+
+
+def _cacheable(condition):
+    if not isinstance(condition, Condition):
+        return False
+
+    filter = condition.filter
+    return not (_overrides(filter, BaseFilter, 'convert') or _overrides(filter, BaseFilter, '_convert')) and \
+        _converts_independently(filter.filter_field)
 
 
 class PaginationMixin(object):
@@ -17,7 +54,104 @@ class PaginationMixin(object):
     def _pagination_types(self):
         raise NotImplemented()
 
+    @property
+    def _streaming(self):
+        raise NotImplementedError()
+
+    def item_formatter(self):
+        """
+        Returns a function that formats one item of the list. Options read from the request are resolved once, when
+        the function is created, rather than for each item.
+        """
+        raise NotImplementedError()
+
+    def _stream_mimetype(self, codec):
+        if request.accept_mimetypes.best_match((codec.mimetype, NDJSON_MIMETYPE)) == NDJSON_MIMETYPE:
+            return NDJSON_MIMETYPE
+        if self._streaming:
+            return codec.mimetype
+        return None
+
+    @staticmethod
+    def _stream(items, format_item, codec, mimetype):
+        dumps = codec.dumps
+
+        if mimetype == NDJSON_MIMETYPE:
+            for item in items:
+                yield dumps(format_item(item)) + '\n'
+            return
+
+        yield '['
+        for i, item in enumerate(items):
+            if i == 0:
+                yield dumps(format_item(item))
+            else:
+                yield ', ' + dumps(format_item(item))
+        yield ']'
+
+    def stream_response(self, items, headers, mimetype, codec=None):
+        """
+        Returns a response that formats and serializes ``items`` one at a time while they are sent to the client,
+        either as a JSON array or as newline-delimited JSON.
+
+        :param items: an iterable of items
+        :param dict headers: response headers
+        :param str mimetype: ``application/json`` or ``application/x-ndjson``
+        """
+        codec = codec or current_codec()
+        return Response(stream_with_context(self._stream(items, self.item_formatter(), codec, mimetype)),
+                        200,
+                        headers,
+                        mimetype=mimetype)
+
+    def _encode_cursor(self, item, keys, codec):
+        values = [field.format(get_value(attribute, item, None)) for field, attribute, reverse in keys]
+        return base64.urlsafe_b64encode(codec.dumps(values).encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, cursor, keys, codec):
+        if not cursor:
+            return ()
+
+        try:
+            values = codec.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(keys):
+                raise ValueError()
+            return tuple(None if value is None else field.convert(value, validate=False)
+                         for (field, attribute, reverse), value in zip(keys, values))
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor('Invalid cursor')
+
+    def format_keyset_response(self, data):
+        """
+        Formats a :class:`KeysetPagination` with ``Link`` headers that carry the cursors of the adjacent pages.
+        """
+        codec = current_codec()
+        params = [(name, request.args[name]) for name in self.query_params if name in request.args]
+        params.append(('per_page', data.per_page))
+
+        def link(rel, direction, cursor):
+            return '<{}?{}>; rel="{}"'.format(request.path, url_encode(collections.OrderedDict(params + [(direction, cursor)])), rel)
+
+        links = [link('first', 'after', '')]
+
+        if data.has_prev and data.items:
+            links.append(link('prev', 'before', self._encode_cursor(data.items[0], data.keys, codec)))
+        if data.has_next and data.items:
+            links.append(link('next', 'after', self._encode_cursor(data.items[-1], data.keys, codec)))
+
+        links.append(link('last', 'before', ''))
+        headers = {'Link': ','.join(links)}
+
+        mimetype = self._stream_mimetype(codec)
+        if mimetype is not None:
+            return self.stream_response(data.items, headers, mimetype, codec)
+
+        return self.format(data.items), 200, headers
+
     def format_response(self, data):
+        if isinstance(data, KeysetPagination):
+            return self.format_keyset_response(data)
+
         if not isinstance(data, self._pagination_types):
             return self.format(data)
 
@@ -29,17 +163,26 @@ class PaginationMixin(object):
         if data.has_next:
             links.append((request.path, data.page + 1, data.per_page, 'next'))
 
-        # HACK max(data.pages, 1): Flask-SQLAlchemy returns pages=0 when no results are returned
-        links.append((request.path, max(data.pages, 1), data.per_page, 'last'))
+        if data.total is not None:
+            # HACK max(data.pages, 1): Flask-SQLAlchemy returns pages=0 when no results are returned
+            links.append((request.path, max(data.pages, 1), data.per_page, 'last'))
 
         # FIXME links must contain filters & sort
         # TODO include query_params
 
         headers = {
-            'Link': ','.join(('<{0}?page={1}&per_page={2}>; rel="{3}"'.format(*link) for link in links)),
-            'X-Total-Count': data.total
+            'Link': ','.join(('<{0}?page={1}&per_page={2}>; rel="{3}"'.format(*link) for link in links))
         }
 
+        if data.total is not None:
+            headers['X-Total-Count'] = data.total
+
+        codec = current_codec()
+        mimetype = self._stream_mimetype(codec)
+        if mimetype is not None:
+            items = data.iter_items() if isinstance(data, QueryPagination) else data.items
+            return self.stream_response(items, headers, mimetype, codec)
+
         return self.format(data.items), 200, headers
 
 
@@ -49,15 +192,28 @@ class RelationInstances(PaginationMixin, ToMany):
     def _pagination_types(self):
         return self.container.target.manager.PAGINATION_TYPES
 
+    @property
+    def _streaming(self):
+        return self.container.target.meta.get('streaming', False)
+
+    def item_formatter(self):
+        return self.container.format
+
 
 class Instances(PaginationMixin, Schema, ResourceBound):
     """
     This is what implements all of the pagination, filter, and sorting logic.
 
     Works like a field, but reads 'where' and 'sort' query string parameters as well as link headers.
+
+    The parsed pagination, filter and sort parameters are cached by their raw values and the pagination settings of
+    the application, unless converting a filter depends on the request, such as when a reference has to be resolved.
+    :meth:`cache_info` returns the cache statistics.
     """
     query_params = ('where', 'sort')
 
+    PARSE_CACHE_SIZE = 500
+
     def rebind(self, resource):
         return self.__class__().bind(resource)
 
@@ -65,6 +221,10 @@ class Instances(PaginationMixin, Schema, ResourceBound):
     def _pagination_types(self):
         return self.resource.manager.PAGINATION_TYPES
 
+    @property
+    def _streaming(self):
+        return self.resource.meta.get('streaming', False)
+
     def _field_filters_schema(self, filters):
         if len(filters) == 1:
             return next(iter(filters.values())).request
@@ -123,6 +283,27 @@ class Instances(PaginationMixin, Schema, ResourceBound):
                     "minimum": 1,
                     "maximum": current_app.config['POTION_MAX_PER_PAGE'],
                     "default": current_app.config['POTION_DEFAULT_PER_PAGE'],
+                },
+                "count": {
+                    "type": "string",
+                    "enum": list(COUNT_MODES),
+                    "description": "How to count the total number of items: 'exact', 'off', 'estimated', or 'cached'."
+                },
+                "fields": {
+                    "type": "string",
+                    "description": "Comma-separated list of the fields to include in each item."
+                },
+                "embed": {
+                    "type": "string",
+                    "description": "Comma-separated list of dotted paths of references to format inline."
+                },
+                "after": {
+                    "type": "string",
+                    "description": "Cursor of the item after which to start the page; empty for the first page."
+                },
+                "before": {
+                    "type": "string",
+                    "description": "Cursor of the item before which to end the page; empty for the last page."
                 }
             },
             "additionalProperties": True
@@ -144,15 +325,58 @@ class Instances(PaginationMixin, Schema, ResourceBound):
             field = self._sort_fields[name]
             yield field, field.attribute or name, reverse
 
+    @cached_property
+    def _parse_cache(self):
+        return LRUCache(self.PARSE_CACHE_SIZE)
+
+    def cache_info(self):
+        """
+        :return: a :class:`utils.CacheInfo` tuple of hits, misses, maximum size and current size of the cache of
+            parsed query string parameters
+        """
+        return self._parse_cache.info()
+
     def parse_request(self, request):
+        codec = current_codec()
+        # the defaults depend on the application, which can change between requests
+        config = current_app.config
+        key = (config['POTION_DEFAULT_PER_PAGE'], config['POTION_MAX_PER_PAGE']) + \
+            tuple(request.args.get(name) for name in ('where', 'sort', 'page', 'per_page', 'count'))
+
+        parsed = self._parse_cache.get(key)
+        if parsed is None:
+            query = self._parse_query(request, codec)
+            parsed = tuple(query.items())
+            if all(_cacheable(condition) for condition in query['where']):
+                self._parse_cache.set(key, parsed)
+
+        result = dict(parsed)
+        result['fields'], result['embed'] = self._select()
+
+        if 'after' in request.args or 'before' in request.args:
+            if 'after' in request.args and 'before' in request.args:
+                raise InvalidCursor("Only one of 'after' and 'before' may be given")
+
+            if any(isinstance(field, ToOne) for field, attribute, reverse in result['sort']):
+                raise InvalidCursor('Cursors are not supported when sorting by a reference')
+
+            keys = self.resource.manager._keyset(result['sort'])
+            for direction in ('after', 'before'):
+                if direction in request.args:
+                    result[direction] = self._decode_cursor(request.args[direction], keys, codec)
+        elif self._stream_mimetype(codec) is not None:
+            result['stream'] = True
+
+        return result
 
+    def _parse_query(self, request, codec):
         # TODO convert instances to FieldSet
         # TODO (implement in FieldSet too:) load values from request.args
         try:
             page = request.args.get('page', 1, type=int)
             per_page = request.args.get('per_page', current_app.config['POTION_DEFAULT_PER_PAGE'], type=int)
-            where = json.loads(request.args.get('where', '{}'))  # FIXME
-            sort = json.loads(request.args.get('sort', '{}'), object_pairs_hook=collections.OrderedDict)
+            where = codec.loads(request.args.get('where', '{}'))  # FIXME
+            sort = codec.loads(request.args.get('sort', '{}'), object_pairs_hook=collections.OrderedDict)
         except ValueError:
             raise InvalidJSON()
 
@@ -160,15 +384,106 @@ class Instances(PaginationMixin, Schema, ResourceBound):
             "page": page,
             "per_page": per_page,
             "where": where,
-            "sort": sort
+            "sort": sort,
+            "count": request.args.get('count', self.resource.meta.get('total_count', 'exact'))
         })
 
         result['where'] = tuple(self._convert_filters(result['where']))
         result['sort'] = tuple(self._convert_sort(result['sort']))
         return result
 
+    def _select(self):
+        # already validated in parse_request()
+        schema = self.resource.schema
+        return (schema.select(request.args.get('fields')),
+                schema.select_embed(request.args.get('embed'), current_app.config['POTION_MAX_EMBED_DEPTH']))
+
+    def item_formatter(self):
+        fields, embed = self._select()
+        format = self.resource.schema.format
+        return lambda item: format(item, fields, embed)
+
     def format(self, items):
-        return [self.resource.schema.format(item) for item in items]
+        format_item = self.item_formatter()
+        return [format_item(item) for item in items]
+
+
+class Where(Instances):
+    """
+    Reads the 'where' query string parameter for routes that act on every item matching a filter. Unlike
+    :class:`Instances`, the parameter is required.
+
+    :param changes: an optional schema for changes in the request body, which are passed to the view as ``changes``
+    """
+    query_params = ('where',)
+
+    def __init__(self, changes=None):
+        self.changes = changes
+
+    def _on_bind(self, resource):
+        self.changes = _bind_schema(self.changes, resource)
+
+    def rebind(self, resource):
+        return self.__class__(self.changes).bind(resource)
+
+    def schema(self):
+        return {
+            "type": "object",
+            "properties": {
+                "where": self._filter_schema
+            },
+            "required": ["where"],
+            "additionalProperties": True
+        }
+
+    def parse_request(self, request):
+        args = {}
+
+        if 'where' in request.args:
+            try:
+                args['where'] = current_codec().loads(request.args['where'])
+            except ValueError:
+                raise InvalidJSON()
+
+        result = {'where': tuple(self._convert_filters(self.convert(args)['where']))}
+
+        if self.changes is not None:
+            result['changes'] = self.changes.parse_request(request)
+        return result
+
+
+class KeysetPagination(object):
+    """
+    A page of items in keyset pagination mode, where pages are addressed with cursors rather than page numbers.
+
+    :param items: items of the page, in order
+    :param keys: a tuple of ``(field, attribute, reverse)`` keys the items are ordered by; used to encode cursors
+    :param per_page:
+    :param bool has_next: whether there may be items after the page
+    :param bool has_prev: whether there may be items before the page
+    """
+
+    def __init__(self, items, keys, per_page, has_next, has_prev):
+        self.items = items
+        self.keys = keys
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+    @classmethod
+    def from_items(cls, items, keys, per_page, cursor, backwards=False):
+        """
+        :param list items: up to ``per_page + 1`` items following the cursor in the direction of travel
+        :param cursor: the cursor the items were read from
+        :param bool backwards: whether the items were read in reverse order, preceding the cursor
+        """
+        more = len(items) > per_page
+        items = list(items[:per_page])
+
+        if backwards:
+            items.reverse()
+            return cls(items, keys, per_page, has_next=bool(cursor), has_prev=more)
+        return cls(items, keys, per_page, has_next=more, has_prev=bool(cursor))
 
 
 class Pagination(object):
@@ -178,17 +493,21 @@ class Pagination(object):
     :param items:
     :param page:
     :param per_page:
-    :param total:
+    :param total: total number of items, or ``None`` if the items were not counted
+    :param bool has_next: whether there is a next page; required when ``total`` is ``None``
     """
 
-    def __init__(self, items, page, per_page, total):
+    def __init__(self, items, page, per_page, total, has_next=None):
         self.items = items
         self.page = page
         self.per_page = per_page
         self.total = total
+        self._has_next = has_next
 
     @property
     def pages(self):
+        if self.total is None:
+            return None
         return max(1, int(ceil(self.total / self.per_page)))
 
     @property
@@ -197,9 +516,109 @@ class Pagination(object):
 
     @property
     def has_next(self):
+        if self._has_next is not None:
+            return self._has_next
         return self.page < self.pages
 
     @classmethod
     def from_list(cls, items, page, per_page):
         start = per_page * (page - 1)
-        return Pagination(items[start:start + per_page], page, per_page, len(items))
\ No newline at end of file
+        return Pagination(items[start:start + per_page], page, per_page, len(items))
+
+
+class QueryPagination(Pagination):
+    """
+    A page of items that are read from the data store only while they are iterated, so that a streamed response does
+    not hold every item of the page at once. Reading :attr:`items` fetches all of them.
+
+    :param query: a callable returning an iterable of the items of the page
+    :param page:
+    :param per_page:
+    :param total: total number of items, or ``None`` if the items were not counted
+    :param bool has_next: whether there is a next page; required when ``total`` is ``None``
+    """
+
+    def __init__(self, query, page, per_page, total, has_next=None):
+        self._query = query
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self._has_next = has_next
+
+    @cached_property
+    def items(self):
+        return list(self._query())
+
+    def iter_items(self):
+        """
+        Iterates over the items of the page. Unless :attr:`items` has already been read, they are read from the data
+        store once the iteration begins.
+        """
+        items = self.items if 'items' in self.__dict__ else self._query()
+        for item in items:
+            yield item
+
+
+_MISSING = object()
+
+
+class _CountingIterator(object):
+
+    def __init__(self, items):
+        self._items = iter(items)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._items)
+        self.count += 1
+        return item
+
+    next = __next__
+
+
+def _first_sorted(n, items, sort):
+    """
+    Returns the first ``n`` items sorted by ``(field, attribute, reverse)`` tuples, as repeated stable sorts by each
+    attribute would, using a heap of at most ``n`` items.
+    """
+    def compare(a, b):
+        for field, attribute, reverse in sort:
+            x, y = get_value(attribute, a, None), get_value(attribute, b, None)
+            if x != y:
+                return (1 if x < y else -1) if reverse else (-1 if x < y else 1)
+        return 0
+
+    return heapq.nsmallest(n, items, key=cmp_to_key(compare))
+
+
+class IterablePagination(Pagination):
+    """
+    A pagination of an iterable of items, which is read in a single pass. Only the items of the page are kept; the
+    items after them are counted, or not read at all when ``count`` is ``False``. When ``sort`` is given, the items are
+    not sorted in full, but the first pages are selected using a bounded heap.
+
+    :param items: an iterable of items
+    :param int page:
+    :param int per_page:
+    :param sort: a list of ``(field, attribute, reverse)`` tuples the items are sorted by, or ``None``
+    :param bool count: whether to count the items
+    """
+
+    def __init__(self, items, page, per_page, sort=None, count=True):
+        start = per_page * (page - 1)
+        end = start + per_page
+
+        counter = _CountingIterator(items)
+        items = iter(_first_sorted(end + 1, counter, sort)) if sort else counter
+
+        page_items = list(islice(items, start, end))
+        has_next = next(items, _MISSING) is not _MISSING
+
+        if count:
+            collections.deque(counter, maxlen=0)
+            super(IterablePagination, self).__init__(page_items, page, per_page, counter.count)
+        else:
+            super(IterablePagination, self).__init__(page_items, page, per_page, None, has_next=has_next)
\ No newline at end of file
@@ -1,12 +1,27 @@
+from collections import OrderedDict
 import datetime
+import time
+from itertools import islice
 import six
 from werkzeug.utils import cached_property
-from .fields import String, Boolean, Number, Integer, Date, DateTime, DateString, DateTimeString, Array, Object, Uri, ItemUri, ItemType
-from .instances import Pagination
-from .exceptions import ItemNotFound
+from .fields import String, Boolean, Number, Integer, Date, DateTime, DateString, DateTimeString, Array, Object, Uri, ItemUri, ItemType, Raw
+from . import signals
+from .cache import ManagerCache, LocalCache, IdentityMap
+from .codec import current_codec
+from .instances import Pagination, KeysetPagination, QueryPagination
+from .exceptions import ItemNotFound, PageNotFound
 from .filters import FILTER_NAMES, FILTERS_BY_TYPE, filters_for_fields
+from .utils import get_value
 import decimal
 
+
+def _items_not_found(resource, ids):
+    ids = list(OrderedDict.fromkeys(ids))
+    if len(ids) == 1:
+        return ItemNotFound(resource, id=ids[0])
+    return ItemNotFound(resource, ids=ids)
+
+
 class Manager(object):
     """
 
@@ -16,10 +31,20 @@ class Manager(object):
     FILTER_NAMES = FILTER_NAMES
     FILTERS_BY_TYPE = FILTERS_BY_TYPE
     PAGINATION_TYPES = (Pagination,)
+    TOTAL_CACHE_SIZE = 1000
+    CACHE_SIZE = 1000
+
+    # number of rows fetched at a time while a streamed page is read
+    STREAM_BATCH_SIZE = 100
+
+    # whether rollback() discards every change made since begin(), including changes committed by the routes
+    TRANSACTIONS = False
 
     def __init__(self, resource, model):
         self.resource = resource
         self.filters = {}
+        self.cache = None
+        self._total_cache = {}
 
         # attach manager to the resource (key converters require backref)
         resource.manager = self
@@ -29,6 +54,20 @@ class Manager(object):
         self._init_key_converters(resource, resource.meta)
         self._post_init(resource, resource.meta)
 
+        if resource.meta.get('cache'):
+            self._init_cache(resource, resource.meta)
+
+        self._init_identity_map(resource)
+
+        for signal in (signals.after_create, signals.after_update, signals.after_delete):
+            signal.connect(self._clear_total_cache, sender=resource)
+
+        self.update_where = self._clearing_total_cache(self.update_where)
+        self.delete_where = self._clearing_total_cache(self.delete_where)
+
+        # rolled back changes send no signals
+        self.rollback = self._clearing_total_cache(self.rollback)
+
     def _init_model(self, resource, model, meta):
         self.model = model
         self.id_attribute = id_attribute = meta.id_attribute or 'id'
@@ -87,6 +126,52 @@ class Manager(object):
         if meta.id_converter is None:
             meta.id_converter = getattr(meta.id_field_class, 'url_rule_converter', None)
 
+    def _init_cache(self, resource, meta):
+        store = meta.cache
+        if store is True:
+            store = LocalCache(self.CACHE_SIZE)
+
+        self.cache = cache = ManagerCache(self, store, meta.get('cache_timeout', 60))
+        self.read = cache.read(self.read)
+        self.paginated_instances = cache.paginated_instances(self.paginated_instances)
+        self.update_where = cache.invalidating(self.update_where)
+        self.delete_where = cache.invalidating(self.delete_where)
+
+    def _init_identity_map(self, resource):
+        self.read = IdentityMap.read(self, self.read)
+        self.read_many = IdentityMap.read_many(self, self.read_many)
+        self.update = IdentityMap.forgetting(self, self.update)
+        self.delete = IdentityMap.forgetting(self, self.delete)
+        self.update_where = IdentityMap.clearing(resource, self.update_where)
+        self.delete_where = IdentityMap.clearing(resource, self.delete_where)
+
+    def _to_cache(self, item):
+        """
+        Returns a copy of an item that can be kept in the cache beyond the current request. Managers whose items are
+        bound to a session, such as SQLAlchemy models, should return a snapshot of the values that have been loaded.
+
+        :param item: an item read by the manager
+        :return: a value that :meth:`_from_cache` turns back into an item
+        """
+        return item
+
+    def _from_cache(self, item):
+        """
+        Prepares an item read from the cache for use in the current request. Managers whose items are bound to a
+        session, such as SQLAlchemy models, should attach the item to the current session.
+
+        :param item: a value returned by :meth:`_to_cache`
+        :return: the item
+        """
+        return item
+
+    def _in_transaction(self):
+        """
+        Whether a transaction started with :meth:`begin` is open. Items read within a transaction are not cached,
+        since its changes may still be rolled back.
+        """
+        return False
+
     @staticmethod
     def _get_field_from_python_type(python_type):
         try:
@@ -108,6 +193,17 @@ class Manager(object):
     def get_field_comparators(self, field):
         pass
 
+    def foreign_key_attribute(self, attribute, target_resource):
+        """
+        Returns the name of an attribute holding the id of the item referenced by ``attribute``, so that the reference
+        can be formatted without loading the referenced item.
+
+        :param str attribute: a reference attribute
+        :param target_resource: the resource of the referenced item
+        :return: an attribute name, or ``None``
+        """
+        return None
+
     def relation_instances(self, item, attribute, target_resource, page=None, per_page=None):
         """
 
@@ -142,17 +238,115 @@ class Manager(object):
         """
         raise NotImplementedError()
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
+    def paginated_instances(self, page, per_page, where=None, sort=None, count='exact', attributes=None, embed=None,
+                            stream=False):
         """
 
         :param page:
         :param per_page:
         :param where:
         :param sort:
+        :param str count: how to count the total number of items: ``'exact'``, ``'off'`` (not counted),
+            ``'estimated'`` or ``'cached'``
+        :param attributes: the attributes that will be read from the items, or ``None`` for all attributes;
+            managers may use this to avoid loading others
+        :param embed: dotted attribute paths of references that will be formatted inline; managers should load
+            them along with the items, rather than one item at a time
+        :param bool stream: whether the page will be streamed to the client; managers may then return a
+            :class:`QueryPagination` that reads the items while they are sent
         :return: a :class:`Pagination` object or similar
         """
         pass
 
+    def _query_pagination(self, page, per_page, where, count, items, exists, exact, estimated=None):
+        """
+        Returns a :class:`QueryPagination` for a streamed page. Rather than reading the items of the page up front,
+        the page is checked and the next page is found with queries for a single item.
+
+        :param items: a callable returning an iterable of the items of the page
+        :param exists: a callable returning whether there is an item at a given offset
+        :param exact: a callable returning the exact count, as in :meth:`_total`
+        :param estimated: a callable returning an estimated count, as in :meth:`_total`
+        """
+        if page > 1 and not exists((page - 1) * per_page):
+            raise PageNotFound()
+
+        total = self._total(where, count, exact, estimated)
+        has_next = None if count == 'exact' else exists(page * per_page)
+        return QueryPagination(items, page, per_page, total, has_next=has_next)
+
+    def _permission_key(self):
+        """
+        Returns a key for the set of items the current user is permitted to read, which is part of the keys of cached
+        entries. Managers that filter items by permission must override this.
+
+        :return: a hashable value with a stable ``repr()``, or ``None`` if every user may read every item
+        """
+        return None
+
+    def _clear_total_cache(self, sender=None, **kwargs):
+        self._total_cache.clear()
+
+    def _clearing_total_cache(self, method):
+        def clearing_method(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._total_cache.clear()
+        return clearing_method
+
+    def _where_key(self, where):
+        codec = current_codec()
+        return tuple(sorted((condition.attribute,
+                             condition.filter.name or '',
+                             codec.dumps(condition.filter.filter_field.format(condition.value), sort_keys=True))
+                            for condition in where or ()))
+
+    def _total(self, where, count, exact, estimated=None):
+        """
+        Returns the total number of items matching ``where`` using the given counting mode.
+
+        In ``'cached'`` mode, totals are kept per normalized ``where`` and :meth:`_permission_key` for
+        ``Meta.total_count_cache_timeout`` seconds, or until an item of the resource is created, updated or deleted or
+        a transaction is rolled back. Totals are counted exactly while a transaction is open.
+        Managers that cannot estimate a total fall back to counting exactly in ``'estimated'`` mode.
+
+        :param where: a tuple of conditions
+        :param str count: the counting mode
+        :param exact: a callable returning the exact count
+        :param estimated: a callable returning an estimated count
+        :return: the total number of items, or ``None`` if ``count`` is ``'off'``
+        """
+        if count == 'off':
+            return None
+
+        if count == 'estimated':
+            return (estimated or exact)()
+
+        if count == 'cached' and not self._in_transaction():
+            key = (self._permission_key(), self._where_key(where))
+            now = time.time()
+
+            try:
+                total, expires = self._total_cache[key]
+                if expires > now:
+                    return total
+            except KeyError:
+                pass
+
+            if len(self._total_cache) >= self.TOTAL_CACHE_SIZE:
+                for k, (_, expires) in list(self._total_cache.items()):
+                    if expires <= now:
+                        del self._total_cache[k]
+                if len(self._total_cache) >= self.TOTAL_CACHE_SIZE:
+                    self._total_cache.clear()
+
+            total = exact()
+            self._total_cache[key] = (total, now + self.resource.meta.get('total_count_cache_timeout', 60))
+            return total
+
+        return exact()
+
     def instances(self, where=None, sort=None):
         """
 
@@ -162,6 +356,69 @@ class Manager(object):
         """
         pass
 
+    def _keyset(self, sort=None):
+        """
+        Returns the keys used to order items in keyset pagination mode: the sort keys, or ``Meta.sort_attribute``
+        when no sort is given, followed by the id attribute as a tie-breaker.
+
+        :param sort: a tuple of ``(field, attribute, reverse)`` keys
+        """
+        keys = list(sort or ())
+        sort_attribute = self.resource.meta.get('sort_attribute')
+
+        if not keys and sort_attribute:
+            attribute, reverse = sort_attribute
+            field = next((field for name, field in self.resource.schema.fields.items()
+                          if (field.attribute or name) == attribute), Raw({}))
+            keys.append((field, attribute, reverse))
+
+        if not any(attribute == self.id_attribute for field, attribute, reverse in keys):
+            keys.append((self.id_field, self.id_attribute, False))
+        return tuple(keys)
+
+    def keyset_instances(self, per_page, where=None, sort=None, after=None, before=None, attributes=None,
+                         embed=None):
+        """
+        Returns a page of items in keyset pagination mode. Rather than skipping over the items of previous pages, the
+        page starts right after (or ends right before) the item with the given key values, so the cost of reading a
+        page does not grow with its position.
+
+        Managers should override this to translate the cursor into a seek predicate on the keys; the default
+        implementation compares the keys of all items in Python. Items with ``null`` key values are not supported.
+
+        :param int per_page:
+        :param where:
+        :param sort:
+        :param tuple after: key values of the item preceding the page, as returned by :meth:`_keyset`; an empty
+            tuple for the first page
+        :param tuple before: key values of the item following the page; an empty tuple for the last page
+        :param attributes: the attributes that will be read from the items, as in :meth:`paginated_instances`
+        :param embed: references that will be formatted inline, as in :meth:`paginated_instances`
+        :return: a :class:`KeysetPagination` object
+        """
+        keys = self._keyset(sort)
+        backwards = before is not None
+        cursor = before if backwards else after
+
+        if backwards:
+            order = tuple((field, attribute, not reverse) for field, attribute, reverse in keys)
+        else:
+            order = keys
+
+        items = self.instances(where=where, sort=order)
+
+        if cursor:
+            def follows(item):
+                for (field, attribute, reverse), bound in zip(order, cursor):
+                    value = get_value(attribute, item, None)
+                    if value != bound:
+                        return value < bound if reverse else value > bound
+                return False
+
+            items = (item for item in items if follows(item))
+
+        return KeysetPagination.from_items(list(islice(items, per_page + 1)), keys, per_page, cursor, backwards)
+
     def first(self, where=None, sort=None):
         """
 
@@ -184,14 +441,75 @@ class Manager(object):
         """
         pass
 
-    def read(self, id):
+    def create_many(self, items):
+        """
+        Creates several items in a single transaction. Managers can override this to use the bulk insert path of
+        their backend; the default implementation calls :meth:`create` for each item and commits once at the end.
+
+        :param list items: a list of property dictionaries
+        :return: a list of the created items
+        """
+        self.begin()
+        try:
+            created = [self.create(properties, commit=False) for properties in items]
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+        return created
+
+    def read(self, id, attributes=None, embed=None):
         """
 
         :param id:
+        :param attributes: the attributes that will be read from the item, as in :meth:`paginated_instances`
+        :param embed: references that will be formatted inline, as in :meth:`paginated_instances`
         :return:
         """
         pass
 
+    def can_read_item(self, item):
+        """
+        Whether the current user may read an item that was loaded through a reference, such as when it is embedded
+        in another item. Managers that filter items by permission must override this.
+
+        :param item:
+        """
+        return True
+
+    def read_many(self, ids):
+        """
+        Reads several items by id. Managers can override this to read all items in one query.
+
+        :param ids: a sequence of ids
+        :return: a list of items in the order of ``ids``
+        :raises exceptions.ItemNotFound: listing every id for which there is no item
+        """
+        items = []
+        missing = []
+
+        for id in ids:
+            try:
+                items.append(self.read(id))
+            except ItemNotFound:
+                missing.append(id)
+
+        if missing:
+            raise _items_not_found(self.resource, missing)
+        return items
+
+    def read_attributes(self, id, attributes):
+        """
+        Reads the values of some attributes of an item. Managers can override this to avoid loading the whole item.
+
+        :param id:
+        :param attributes: a sequence of attribute names
+        :return: a tuple of values
+        :raises exceptions.ItemNotFound:
+        """
+        item = self.read(id)
+        return tuple(get_value(attribute, item, None) for attribute in attributes)
+
     def update(self, item, changes, commit=True):
         """
 
@@ -218,10 +536,68 @@ class Manager(object):
         """
         return self.delete(self.read(id))
 
+    def update_where(self, where, changes, signals=False):
+        """
+        Updates every item matching ``where`` in a single transaction. Managers can override this to send one
+        set-based update to their backend when ``signals`` is ``False``; the default implementation updates the
+        items one at a time using :meth:`update`.
+
+        :param where: a tuple of conditions
+        :param changes: a dictionary of changes
+        :param bool signals: whether update signals must be sent for each item
+        :return: the number of updated items
+        """
+        items = list(self.instances(where=where))
+
+        self.begin()
+        try:
+            for item in items:
+                self.update(item, changes)
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+        return len(items)
+
+    def delete_where(self, where, signals=False):
+        """
+        Deletes every item matching ``where`` in a single transaction. Like :meth:`update_where`, the default
+        implementation deletes the items one at a time using :meth:`delete`.
+
+        :param where: a tuple of conditions
+        :param bool signals: whether delete signals must be sent for each item
+        :return: the number of deleted items
+        """
+        items = list(self.instances(where=where))
+
+        self.begin()
+        try:
+            for item in items:
+                self.delete(item)
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+        return len(items)
+
     def commit(self):
+        """
+        Commits pending changes. Ends a transaction started with :meth:`begin`; when transactions are nested, only
+        the outermost :meth:`commit` writes the changes.
+        """
         pass
 
     def begin(self):
+        """
+        Starts a transaction. Changes made within the transaction, including changes that would otherwise be
+        committed immediately, are held back until the matching :meth:`commit`.
+        """
+        pass
+
+    def rollback(self):
+        """
+        Discards changes made in the current transaction and ends it.
+        """
         pass
 
 
@@ -267,6 +643,24 @@ class RelationalManager(Manager):
     def _query_get_paginated_items(self, query, page, per_page):
         raise NotImplementedError()
 
+    def _query_load_only(self, query, attributes):
+        """
+        Restricts the attributes loaded by a query. Loads all attributes by default.
+
+        :param query:
+        :param attributes: a sequence of attribute names
+        """
+        return query
+
+    def _query_embed(self, query, paths):
+        """
+        Loads references along with the items of a query. Leaves references to be loaded when accessed by default.
+
+        :param query:
+        :param paths: a sequence of dotted attribute paths
+        """
+        return query
+
     def _query_get_all(self, query):
         raise NotImplementedError()
 
@@ -276,22 +670,51 @@ class RelationalManager(Manager):
     def _query_get_first(self, query):
         raise NotImplementedError()
 
-    def paginated_instances(self, page, per_page, where=None, sort=None):
+    def paginated_instances(self, page, per_page, where=None, sort=None, count='exact', attributes=None, embed=None,
+                            stream=False):
         instances = self.instances(where=where, sort=sort)
         if isinstance(instances, list):
-            return Pagination.from_list(instances, page, per_page)
-        return self._query_get_paginated_items(instances, page, per_page)
+            pagination = Pagination.from_list(instances, page, per_page)
+        else:
+            if attributes is not None:
+                instances = self._query_load_only(instances, attributes)
+            if embed:
+                instances = self._query_embed(instances, embed)
+            pagination = self._query_get_paginated_items(instances, page, per_page)
 
-    def instances(self, where=None, sort=None):
+        if count == 'off':
+            return Pagination(pagination.items, page, per_page, None, has_next=pagination.has_next)
+        return pagination
+
+    def read_many(self, ids):
         query = self._query()
+        items = {}
 
-        if query is None:
-            return []
+        if query is not None and ids:
+            query = self._query_filter(query, self._expression_for_ids(list(set(ids))))
+            for item in self._query_get_all(query):
+                items[get_value(self.id_attribute, item, None)] = item
+
+        missing = [id for id in ids if id not in items]
+        if missing:
+            raise _items_not_found(self.resource, missing)
+        return [items[id] for id in ids]
+
+    def _query_where(self, where=None):
+        query = self._query()
 
-        if where:
+        if query is not None and where:
             expressions = [self._expression_for_condition(condition) for condition in where]
             query = self._query_filter(query, self._and_expression(expressions))
 
+        return query
+
+    def instances(self, where=None, sort=None):
+        query = self._query_where(where)
+
+        if query is None:
+            return []
+
         return self._query_order_by(query, sort)
 
     def first(self, where=None, sort=None):
@@ -306,9 +729,14 @@ class RelationalManager(Manager):
         except IndexError:
             raise ItemNotFound(self.resource, where=where)
 
-    def read(self, id):
+    def read(self, id, attributes=None, embed=None):
         query = self._query()
 
         if query is None:
             raise ItemNotFound(self.resource, id=id)
+
+        if attributes is not None:
+            query = self._query_load_only(query, attributes)
+        if embed:
+            query = self._query_embed(query, embed)
         return self._query_filter_by_id(query, id)
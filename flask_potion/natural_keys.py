@@ -1,13 +1,15 @@
+from collections import OrderedDict
 import re
 
 import six
 from werkzeug.utils import cached_property
 from .filters import Condition
 
+from .cache import IdentityMap
 from .schema import Schema
 from .reference import ResourceBound
 from .exceptions import ItemNotFound
-from .utils import route_from, get_value
+from .utils import route_item_id, get_value
 
 
 class Key(Schema, ResourceBound):
@@ -24,6 +26,31 @@ class Key(Schema, ResourceBound):
     def schema(self):
         raise NotImplementedError()
 
+    def convert_many(self, values):
+        """
+        Converts several values at once. Keys can override this to read all items in one query.
+
+        :return: a list of items in the order of ``values``
+        """
+        return [self.convert(value) for value in values]
+
+    def _first(self, value, where):
+        manager = self.resource.manager
+        identity_map = IdentityMap.current()
+
+        if identity_map is None:
+            return manager.first(where=where)
+
+        identity = identity_map.get_key(self, value)
+        if identity is not None:
+            return manager.read(identity[1])
+
+        item = manager.first(where=where)
+        id = get_value(manager.id_attribute, item, None)
+        identity_map.add(self.resource, id, item)
+        identity_map.add_key(self, value, self.resource, id)
+        return item
+
 
 class RefKey(Key):
 
@@ -50,14 +77,15 @@ class RefKey(Key):
     def format(self, item):
         return {"$ref": self._item_uri(self.resource, item)}
 
+    def format_id(self, id):
+        return {"$ref": '{}/{}'.format(self.resource.route_prefix, id)}
+
     def convert(self, value):
-        try:
-            endpoint, args = route_from(value["$ref"], 'GET')
-        except Exception as e:
-            raise e
         # XXX verify endpoint is correct (it should be)
-        # assert resource.endpoint == endpoint
-        return self.resource.manager.read(args['id'])
+        return self.resource.manager.read(route_item_id(self.resource, value["$ref"]))
+
+    def convert_many(self, values):
+        return self.resource.manager.read_many([route_item_id(self.resource, value["$ref"]) for value in values])
 
 
 class PropertyKey(Key):
@@ -79,7 +107,27 @@ class PropertyKey(Key):
         return self.resource.manager.filters[self.property][None]
 
     def convert(self, value):
-        return self.resource.manager.first(where=[Condition(self.property, self._field_filter, value)])
+        return self._first(value, [Condition(self.property, self._field_filter, value)])
+
+    def convert_many(self, values):
+        in_filter = self.resource.manager.filters[self.property].get('in')
+
+        try:
+            unique_values = list(OrderedDict.fromkeys(values))
+        except TypeError:
+            unique_values = None
+
+        if in_filter is None or unique_values is None:
+            return super(PropertyKey, self).convert_many(values)
+
+        items = {}
+        for item in self.resource.manager.instances(where=[Condition(self.property, in_filter, unique_values)]):
+            items[self.format(item)] = item
+
+        missing = [value for value in unique_values if value not in items]
+        if missing:
+            raise ItemNotFound(self.resource, where=[Condition(self.property, in_filter, missing)])
+        return [items[value] for value in values]
 
 
 class PropertiesKey(Key):
@@ -109,7 +157,7 @@ class PropertiesKey(Key):
         return self.resource.manager.filters
 
     def convert(self, value):
-        return self.resource.manager.first(where=[
+        return self._first(value, [
             Condition(property, self._field_filters[property][None], value[i])
             for i, property in enumerate(self.properties)
         ])
@@ -126,5 +174,11 @@ class IDKey(Key):
     def format(self, item):
         return self.id_field.output(self.resource.manager.id_attribute, item)
 
+    def format_id(self, id):
+        return self.id_field.format(id)
+
     def convert(self, value):
         return self.resource.manager.read(self.id_field.convert(value))
+
+    def convert_many(self, values):
+        return self.resource.manager.read_many([self.id_field.convert(value) for value in values])
@@ -4,12 +4,14 @@ from operator import attrgetter
 import itertools
 
 import six
+from flask import request, Response, current_app
+from werkzeug.http import is_resource_modified, http_date, quote_etag
 
 from .natural_keys import RefKey, IDKey, PropertyKey, PropertiesKey
 from .fields import ItemType, ItemUri, Integer, Inline
 from .reference import ResourceBound
-from .instances import Instances
-from .utils import AttributeDict
+from .instances import Instances, Where
+from .utils import AttributeDict, get_value
 from .routes import Route
 from .schema import FieldSet
 
@@ -156,6 +158,11 @@ class Resource(six.with_metaclass(ResourceMeta, object)):
 
         The prefix URI to any route in this resource; includes the API prefix.
 
+    .. attribute:: item_url_matcher
+
+        A :class:`utils.ItemUrlMatcher` for reading ids from the urls of items of this resource, set up when the
+        resource is registered with an application.
+
     .. method:: described_by
 
         A :class:`Route` at ``/schema`` that contains the JSON Hyper-Schema for this resource.
@@ -166,6 +173,7 @@ class Resource(six.with_metaclass(ResourceMeta, object)):
     routes = None
     schema = None
     route_prefix = None
+    item_url_matcher = None
 
     @Route.GET('/schema', rel="describedBy", attribute="schema")
     def described_by(self): # No "targetSchema" because that would be way too meta.
@@ -217,9 +225,29 @@ class ModelResourceMeta(ResourceMeta):
         if sort_attribute is not None and isinstance(sort_attribute, str):
             meta.sort_attribute = sort_attribute, False
 
+        # bulk routes are opt-in, and are left out where the route for a single item they extend to many items is
+        # excluded or overridden, so that they cannot bypass it
+        routes = class_.routes
+        for bulk_relation, relation in (('updateWhere', 'update'), ('destroyWhere', 'destroy')):
+            if bulk_relation not in routes:
+                continue
+            if not class_.meta.get('bulk_routes') or \
+                    _route_owner(class_, routes.get(relation)) is not _route_owner(class_, routes[bulk_relation]):
+                del routes[bulk_relation]
+
         return class_
 
 
+def _route_owner(class_, route):
+    # the class in which a route is defined
+    if route is None:
+        return None
+    for base in class_.__mro__:
+        if any(member is route for member in vars(base).values()):
+            return base
+    return None
+
+
 class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
     """
     :class:`Meta` class attributes:
@@ -233,28 +261,95 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
     sort_attribute         None                            The field used to sort the list in the `instances` endpoint. Can be the
                                                            field name as ``string`` or a ``tuple`` with the field name and a boolean
                                                            for ``reverse`` (defaults to ``False``).
+    streaming              ``False``                       Whether lists of items in the `instances` and relation endpoints are
+                                                           formatted and sent to the client one item at a time. Lists are
+                                                           always streamed as newline-delimited JSON when requested with
+                                                           ``Accept: application/x-ndjson``. The SQLAlchemy, peewee and
+                                                           MongoEngine managers read the items of a streamed `instances`
+                                                           page from the database while it is sent, a batch of rows at a
+                                                           time; relation lists, keyset pages and cached pages are read
+                                                           in full first.
+    etag                   ``False``                       Whether responses to `GET` requests carry a strong ``ETag`` and conditional
+                                                           requests (``If-None-Match``, ``If-Modified-Since``) are answered with
+                                                           ``304 Not Modified``. The ETag is a digest of the response unless
+                                                           ``etag_attribute`` is set.
+    etag_attribute         ``None``                        A version attribute (such as a revision counter or update timestamp) used
+                                                           for the ETag of an item. When set, conditional `read` requests are
+                                                           answered from the version alone, without loading the item. The ETag
+                                                           includes the ``?fields=`` and ``?embed=`` of the request.
+    last_modified_attribute ``None``                       A timestamp attribute used for the ``Last-Modified`` header of an item.
+    bulk_routes            ``False``                       Whether the `update_where` and `destroy_where` routes (``PATCH`` and ``DELETE``
+                                                           on the instances with ``?where=``) are published. Either route is left out
+                                                           when `update` or `destroy` is excluded or overridden.
+    bulk_signals           ``False``                       Whether `update_where` and `destroy_where` send update and delete signals. When
+                                                           ``True``, matching items are loaded and changed one at a time; otherwise a
+                                                           single set-based ``UPDATE`` or ``DELETE`` is sent to the backend.
+    total_count            ``'exact'``                     How `instances` counts the total number of items by default: ``'exact'``,
+                                                           ``'off'`` (no ``X-Total-Count`` header or ``last`` link), ``'estimated'`` from
+                                                           database statistics, or ``'cached'``. Can be overridden with ``?count=``.
+    total_count_cache_timeout ``60``                       Number of seconds a total count is cached for a given ``where`` in
+                                                           ``'cached'`` mode.
+    cache                  ``False``                       Whether items and pages of items read in `GET` requests are cached by the
+                                                           manager; ``True`` for a per-process :class:`cache.LocalCache`, or a
+                                                           :class:`cache.Cache` store. Entries are invalidated by the manager signals.
+    cache_timeout          ``60``                          Number of seconds items and pages are cached for, or ``None``.
+    indexes                ``None``                        A dictionary of attributes indexed by a :class:`contrib.memory.MemoryManager`,
+                                                           with either ``'hash'`` or ``'ordered'`` indexes.
+    persist                ``None``                        A directory in which a :class:`contrib.memory.MemoryManager` keeps a
+                                                           snapshot and a write-ahead log of its items, which are loaded on startup.
+                                                           The directory can only be used by one process at a time.
     =====================  ==============================  ==============================================================================
 
     .. method:: create
 
-        A link --- part of a :class:`Route` at the root of the resource --- for creating new items.
+        A link --- part of a :class:`Route` at the root of the resource --- for creating new items. When sent an array
+        of items, creates all of them in a single transaction using :meth:`Manager.create_many`.
 
-        :param properties:
-        :return: created item
+        :param properties: properties of an item, or a list thereof
+        :return: created item or list of items
 
     .. method:: instances
 
         A link --- part of a :class:`Route` at the root of the resource --- for reading item instances.
 
+        When given an ``after`` or ``before`` cursor --- empty for the first or last page --- pages are read in keyset
+        pagination mode using :meth:`Manager.keyset_instances`, and the ``Link`` header carries the cursors of the
+        adjacent pages.
+
         :param where:
         :param sort:
         :param int page:
         :param int per_page:
+        :param after:
+        :param before:
+        :param str count: overrides ``Meta.total_count``
+        :param fields: comma-separated fields to include in each item; managers load only the matching attributes
+            where they can
+        :param embed: comma-separated dotted paths of references to format inline rather than as ``{"$ref"}``
+            objects, up to ``POTION_MAX_EMBED_DEPTH`` levels deep; managers load the references along with the items
         :return: list of items
 
+    .. method:: update_where
+
+        A link --- part of a :class:`Route` at the root of the resource --- for updating every item matching the
+        required ``where`` query string parameter.
+
+        :param changes: changes
+        :param where:
+        :return: number of updated items
+
+    .. method:: destroy_where
+
+        A link --- part of a :class:`Route` at the root of the resource --- for deleting every item matching the
+        required ``where`` query string parameter.
+
+        :param where:
+        :return: number of deleted items
+
     .. method:: read
 
         A link --- part of a :class:`Route` at ``/<{Resource.meta.id_converter}:id>`` --- for reading a specific item.
+        The optional ``fields`` and ``embed`` query string parameters work as in `instances`.
 
         :param id: item id
         :return: item
@@ -278,7 +373,21 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
     manager = None
 
     @Route.GET('', rel="instances")
-    def instances(self, **kwargs):
+    def instances(self, after=None, before=None, fields=None, embed=None, **kwargs):
+        if after is not None or before is not None:
+            kwargs.pop('page', None)
+            kwargs.pop('count', None)
+            if embed:
+                kwargs['embed'] = self._embed_paths(embed, fields)
+            if fields is not None:
+                keys = self.manager._keyset(kwargs.get('sort'))
+                kwargs['attributes'] = self._attributes(fields, *(attribute for field, attribute, reverse in keys))
+            return self.manager.keyset_instances(after=after, before=before, **kwargs)
+
+        if embed:
+            kwargs['embed'] = self._embed_paths(embed, fields)
+        if fields is not None:
+            kwargs['attributes'] = self._attributes(fields)
         return self.manager.paginated_instances(**kwargs)
 
     # TODO custom schema (Instances/Instances) that contains the necessary schema.
@@ -286,17 +395,62 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
 
     @instances.POST(rel="create")
     def create(self, properties):  # XXX need some way for field bindings to be dynamic/work dynamically.
+        if isinstance(properties, list):
+            return self.manager.create_many(properties)
+
         item = self.manager.create(properties)
         return item  # TODO consider 201 Created
 
-    create.request_schema = create.response_schema = Inline('self')
+    create.request_schema = create.response_schema = Inline('self', many=True, select=True)
+
+    @instances.PATCH(rel="updateWhere")
+    def update_where(self, changes, where):
+        return self.manager.update_where(where, changes, signals=self.meta.bulk_signals)
+
+    update_where.request_schema = Where(Inline('self', patchable=True))
+    update_where.response_schema = Integer()
+
+    @instances.DELETE(rel="destroyWhere")
+    def destroy_where(self, where):
+        return self.manager.delete_where(where, signals=self.meta.bulk_signals)
+
+    destroy_where.request_schema = Where()
+    destroy_where.response_schema = Integer()
 
     @Route.GET(lambda r: '/<{}:id>'.format(r.meta.id_converter), rel="self", attribute="instance")
     def read(self, id):
-        return self.manager.read(id)
+        version_attributes = self._version_attributes()
+        fields = self.schema.select(request.args.get('fields'))
+        embed = self.schema.select_embed(request.args.get('embed'), current_app.config['POTION_MAX_EMBED_DEPTH'])
+        kwargs = {}
+
+        if embed:
+            kwargs['embed'] = self._embed_paths(embed, fields)
+        if fields is not None:
+            kwargs['attributes'] = self._attributes(fields, *version_attributes)
+
+        if not version_attributes:
+            return self.manager.read(id, **kwargs)
+
+        # representations with different ?fields= or ?embed= must not share an ETag
+        representation = tuple('{}={}'.format(key, ','.join(kwargs[key])) for key in ('attributes', 'embed')
+                               if key in kwargs)
+
+        # answer conditional requests without loading the whole item
+        if 'HTTP_IF_NONE_MATCH' in request.environ or 'HTTP_IF_MODIFIED_SINCE' in request.environ:
+            headers = self._version_headers(id, self.manager.read_attributes(id, version_attributes), representation)
+
+            if not is_resource_modified(request.environ,
+                                        etag=headers.get('ETag'),
+                                        last_modified=headers.get('Last-Modified')):
+                return Response(status=304, headers=headers)
+
+        item = self.manager.read(id, **kwargs)
+        return item, 200, self._version_headers(id, [get_value(a, item, None) for a in version_attributes],
+                                                representation)
 
     read.request_schema = None
-    read.response_schema = Inline('self')
+    read.response_schema = Inline('self', select=True)
 
     @read.PATCH(rel="update")
     def update(self, properties, id):
@@ -304,7 +458,7 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
         updated_item = self.manager.update(item, properties)
         return updated_item
 
-    update.request_schema = Inline('self', patchable=True)
+    update.request_schema = Inline('self', patchable=True, select=True)
     update.response_schema = update.request_schema
 
     @update.DELETE(rel="destroy")
@@ -312,6 +466,56 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
         self.manager.delete_by_id(id)
         return None, 204
 
+    def _attributes(self, fields, *extra):
+        """
+        Returns the attributes needed to format the given fields.
+
+        :param fields: a tuple of keys, as returned by :meth:`FieldSet.select`
+        :param extra: additional attributes the view reads
+        """
+        schema_fields = self.schema.fields
+        attributes = [self.manager.id_attribute]
+        attributes += [schema_fields[key].attribute or key for key in fields]
+        attributes += extra
+        return tuple(OrderedDict.fromkeys(attributes))
+
+    def _embed_paths(self, embed, fields=None, schema=None):
+        """
+        Returns the dotted attribute paths of the references to embed.
+
+        :param dict embed: as returned by :meth:`FieldSet.select_embed`
+        :param fields: a tuple of keys, as returned by :meth:`FieldSet.select`
+        """
+        schema = schema or self.schema
+        paths = []
+
+        for key, nested in embed.items():
+            if fields is not None and key not in fields:
+                continue
+
+            field = schema.fields[key]
+            attribute = field.attribute or key
+            nested_paths = self._embed_paths(nested, schema=field.target.schema)
+            paths += ['.'.join((attribute, path)) for path in nested_paths] or [attribute]
+        return tuple(paths)
+
+    def _version_attributes(self):
+        if not self.meta.etag:
+            return ()
+        return tuple(a for a in (self.meta.etag_attribute, self.meta.last_modified_attribute) if a)
+
+    def _version_headers(self, id, values, representation=()):
+        headers = {}
+        values = iter(values)
+
+        if self.meta.etag_attribute:
+            headers['ETag'] = quote_etag(';'.join(('{}:{}'.format(id, next(values)),) + representation))
+        if self.meta.last_modified_attribute:
+            last_modified = next(values)
+            if last_modified is not None:
+                headers['Last-Modified'] = http_date(last_modified)
+        return headers
+
     class Schema:
         pass
 
@@ -335,6 +539,17 @@ class ModelResource(six.with_metaclass(ModelResourceMeta, Resource)):
         postgres_text_search_fields = ()
         postgres_full_text_index = None  # $fulltext
         cache = False
+        cache_timeout = 60
+        indexes = None
+        persist = None
+        streaming = False
+        etag = False
+        etag_attribute = None
+        last_modified_attribute = None
+        bulk_routes = False
+        bulk_signals = False
+        total_count = 'exact'
+        total_count_cache_timeout = 60
         key_converters = (
             RefKey(),
             IDKey()
@@ -5,6 +5,7 @@ from types import MethodType
 
 from flask import request
 from werkzeug.utils import cached_property
+from werkzeug.wrappers import BaseResponse
 
 from flask_potion.reference import _bind_schema
 from flask_potion.fields import ToOne, Integer
@@ -270,6 +271,9 @@ class Route(object):
 
             response = view_func(instance, *args, **kwargs)
 
+            if isinstance(response, BaseResponse):
+                return response
+
             if not isinstance(response, tuple) and self.success_code:
                 response = (response, self.success_code)
 
@@ -431,6 +435,7 @@ class Relation(RouteSet, ResourceBound):
 
         if "w" in io or "u" in io:
             def relation_add(resource, item, target_item):
+                resource.manager.begin()
                 resource.manager.relation_add(item, self.attribute, self.target, target_item)
                 resource.manager.commit()
                 return target_item
@@ -443,6 +448,7 @@ class Relation(RouteSet, ResourceBound):
 
             def relation_remove(resource, item, target_id):
                 target_item = self.target.manager.read(target_id)
+                resource.manager.begin()
                 resource.manager.relation_remove(item, self.attribute, self.target, target_item)
                 resource.manager.commit()
                 return None, 204
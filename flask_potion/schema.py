@@ -1,12 +1,13 @@
 from collections import OrderedDict
 
-from flask import json
 from werkzeug.utils import cached_property
-from jsonschema import Draft4Validator, ValidationError, FormatChecker
+from jsonschema import Draft4Validator, FormatChecker
 
+from flask_potion.codec import current_codec
 from flask_potion.reference import ResourceBound
-from flask_potion.utils import unpack
-from flask_potion.exceptions import ValidationError as PotionValidationError, RequestMustBeJSON
+from flask_potion.utils import unpack, get_value
+from flask_potion.exceptions import ValidationError as PotionValidationError, RequestMustBeJSON, InvalidFields
+from flask_potion.validation import Validator, NotCompilable, compile_schema
 
 
 class Schema(object):
@@ -61,13 +62,12 @@ class Schema(object):
     @cached_property
     def _validator(self):
         Draft4Validator.check_schema(self.request)
-        return Draft4Validator(self.request, format_checker=FormatChecker())
+        return Validator(self.request, format_checker=FormatChecker())
 
     @cached_property
     def _update_validator(self):
         Draft4Validator.check_schema(self.update)
-        return Draft4Validator(self.update, format_checker=FormatChecker())
-
+        return Validator(self.update, format_checker=FormatChecker())
 
     def format(self, value):
         """
@@ -89,11 +89,9 @@ class Schema(object):
             validator = self._update_validator
         else:
             validator = self._validator
-        try:
-            validator.validate(instance)
-        except ValidationError as ve:
-            errors = validator.iter_errors(instance)
-            raise PotionValidationError(errors)
+
+        if not validator.is_valid(instance):
+            raise PotionValidationError(validator.iter_errors(instance))
         return instance
 
     def parse_request(self, request):
@@ -103,7 +101,7 @@ class Schema(object):
         :param request: Flask request object
         :return:
         """
-        data = request.json
+        data = current_codec().get_json(request)
 
         if not data and request.method in ('GET', 'HEAD'):
             data = dict(request.args)
@@ -140,13 +138,19 @@ class FieldSet(Schema, ResourceBound):
     :param required_fields: a list or tuple of field names that are required during parsing
     """
 
+    FORMATTER_CACHE_SIZE = 100
+
     def __init__(self, fields, required_fields=None):
         self.fields = fields
         self.required = set(required_fields or ())
+        self._formatters = {}
+        self._converters = {}
 
     def bind(self, resource):
         if self.resource is None:
             self.resource = resource
+            self._formatters = {}
+            self._converters = {}
             self.fields = {
                 key: field.bind(resource) if isinstance(field, ResourceBound) else field
                 for key, field in self.fields.items()
@@ -165,6 +169,8 @@ class FieldSet(Schema, ResourceBound):
         if self.resource and isinstance(field, ResourceBound):
             field = field.bind(self.resource)
         self.fields[key] = field
+        self._formatters = {}
+        self._converters = {}
 
     def _schema(self, patchable=False):
         read_schema = {
@@ -212,20 +218,113 @@ class FieldSet(Schema, ResourceBound):
     def all_fields_optional(self):
         return all(((i.default is not None) or i.nullable for i in (self.fields or {}).values()))
 
-    def format(self, item):
-        return OrderedDict((key, field.output(key, item)) for key, field in self.fields.items() if 'r' in field.io)
+    def select(self, value):
+        """
+        Parses a comma-separated list of keys, such as the value of the ``fields`` query string parameter.
+
+        :param str value: comma-separated keys or ``None``
+        :return: a tuple of keys, or ``None`` if ``value`` is ``None``
+        :raises InvalidFields: if a key is not a readable field
+        """
+        if value is None:
+            return None
+
+        keys = tuple(key.strip() for key in value.split(',') if key.strip())
+        unknown = [key for key in keys if key not in self.readable_fields]
 
-    def convert(self, instance, update=False, pre_resolved_properties=None, patchable=False, strict=False):
+        if unknown:
+            raise InvalidFields('Unknown fields: {}'.format(', '.join(unknown)))
+        return keys
+
+    def select_embed(self, value, max_depth):
+        """
+        Parses a comma-separated list of dotted paths of reference fields, such as the value of the ``embed`` query
+        string parameter.
+
+        :param str value: comma-separated paths or ``None``
+        :param int max_depth: maximum number of references in a path
+        :return: a dictionary mapping keys to dictionaries of nested keys, or ``None`` if ``value`` is ``None``
+        :raises InvalidFields: if a path is too long or does not consist of readable reference fields
+        """
+        if value is None:
+            return None
+
+        embed = {}
+        for path in (path.strip() for path in value.split(',')):
+            if not path:
+                continue
+
+            keys = path.split('.')
+            if len(keys) > max_depth:
+                raise InvalidFields('Cannot embed more than {} levels: {}'.format(max_depth, path))
+
+            schema, nested = self, embed
+            for key in keys:
+                field = schema.readable_fields.get(key)
+                if not hasattr(field, 'format_embedded'):
+                    raise InvalidFields('Cannot embed {}'.format(path))
+                schema, nested = field.target.schema, nested.setdefault(key, {})
+        return embed
+
+    def format(self, item, fields=None, embed=None):
+        """
+        :param item:
+        :param fields: keys to restrict the output to; keys starting with ``$`` are always included
+        :param dict embed: keys of reference fields to format inline, as returned by :meth:`select_embed`
+        """
+        if embed:
+            return OrderedDict((key, self._format_field(key, field, item, embed)) for key, field in self.fields.items()
+                               if 'r' in field.io and (fields is None or key in fields or key.startswith('$')))
+
+        try:
+            formatter = self._formatters[(type(item), fields)]
+        except KeyError:
+            if len(self._formatters) >= self.FORMATTER_CACHE_SIZE:
+                self._formatters.clear()
+            formatter = self._formatters[(type(item), fields)] = self._compile_formatter(type(item), fields)
+        return formatter(item)
+
+    def _compile_formatter(self, item_type, fields=None):
+        """
+        Returns a function that formats items of the given type, using the output functions of the fields
+        specialized for that type.
+        """
+        outputs = [(key, field._output_function(key, item_type)) for key, field in self.fields.items()
+                   if 'r' in field.io and (fields is None or key in fields or key.startswith('$'))]
+
+        def format(item):
+            return OrderedDict([(key, output(item)) for key, output in outputs])
+        return format
+
+    @staticmethod
+    def _format_field(key, field, item, embed):
+        if key not in embed:
+            return field.output(key, item)
+        return field.format_embedded(get_value(field.attribute or key, item, field.default), embed[key])
+
+    def convert(self, instance, update=False, pre_resolved_properties=None, patchable=False, strict=False,
+                validate=True):
         """
         :param instance: JSON-object
         :param pre_resolved_properties: optional dictionary of properties that are already known
         :param bool patchable: when ``True`` does not check for required fields
         :param bool strict:
+        :param bool validate: when ``False``, skips validation of an instance that has already been validated
         :return:
         """
         result = dict(pre_resolved_properties) if pre_resolved_properties else {}
 
-        if patchable:
+        try:
+            converter = self._converters[(update, patchable)]
+        except KeyError:
+            converter = self._converters[(update, patchable)] = self._compile_converter(update, patchable)
+
+        if converter is not None and converter(instance, result, validate):
+            return result
+
+        if not validate:
+            object_ = instance
+        elif patchable:
             object_ = self.patchable.convert(instance, update)
         else:
             object_ = super(FieldSet, self).convert(instance, update)
@@ -257,6 +356,58 @@ class FieldSet(Schema, ResourceBound):
             result[field.attribute or key] = value
         return result
 
+    def _compile_converter(self, update=False, patchable=False):
+        """
+        Returns a function ``convert(instance, result, validate)`` that validates and converts an instance in a single
+        pass over the fields writable in the given mode, or ``None`` if the request schema cannot be compiled.
+
+        The function adds the converted properties to ``result`` and returns ``True``, or returns ``False`` without
+        changing ``result`` if the instance is not valid.
+        """
+        schema = self.patchable if patchable else self
+        json_schema = schema.update if update else schema.request
+
+        if json_schema.get('type') != 'object' or json_schema.get('additionalProperties') is not False or \
+                set(json_schema) - {'type', 'additionalProperties', 'properties', 'required'}:
+            return None
+
+        properties = json_schema['properties']
+        required = tuple(json_schema.get('required', ()))
+        format_checker = FormatChecker()
+
+        try:
+            plan = [(key, field.attribute or key, compile_schema(properties[key], format_checker),
+                     field._convert_function(), field)
+                    for key, field in self.fields.items() if key in properties]
+        except NotCompilable:
+            return None
+
+        def convert(instance, result, validate):
+            if validate and not (isinstance(instance, dict) and all(key in instance for key in required)):
+                return False
+
+            values = []
+            present = 0
+            for key, attribute, is_valid, convert_value, field in plan:
+                if key in instance:
+                    value = instance[key]
+                    present += 1
+                    if validate and not is_valid(value):
+                        return False
+                    # ignore fields that have been pre-resolved
+                    if key not in result:
+                        values.append((attribute, convert_value, value))
+                elif not (patchable or key in result):
+                    values.append((attribute, None, field.default))
+
+            if validate and present != len(instance):
+                return False
+
+            for attribute, convert_value, value in values:
+                result[attribute] = value if convert_value is None else convert_value(value)
+            return True
+        return convert
+
     def parse_request(self, request):
         if request.method in ('POST', 'PATCH', 'PUT', 'DELETE'):
             if self.fields and request.mimetype != 'application/json':
@@ -265,7 +416,8 @@ class FieldSet(Schema, ResourceBound):
                     raise RequestMustBeJSON()
 
         # TODO change to request.get_json(silent=False) to catch invalid JSON
-        data = request.get_json(silent=True)
+        codec = current_codec()
+        data = codec.get_json(request, silent=True)
 
         if data is None and self.all_fields_optional:
             data = {}
@@ -283,7 +435,7 @@ class FieldSet(Schema, ResourceBound):
                     value = request.args[name]
                     # FIXME type conversion!
                     try:
-                        data[name] = json.loads(value)
+                        data[name] = codec.loads(value)
                     except ValueError:
                         data[name] = value
                 except KeyError:
@@ -1,5 +1,10 @@
+from collections import OrderedDict, namedtuple
+import re
+import threading
+
 from flask import _app_ctx_stack, _request_ctx_stack
 from werkzeug.exceptions import NotFound
+from werkzeug.routing import ValidationError
 from werkzeug.urls import url_parse
 
 
@@ -27,6 +32,57 @@ def route_from(url, method=None):
     return url_adapter.match(parsed_url.path, method)
 
 
+class ItemUrlMatcher(object):
+    """
+    Reads the id from the url of an item of a resource without going through the URL map of the application. Only
+    urls of the form ``{route_prefix}/{id}`` with an id matching the converter are matched; :meth:`match` returns
+    ``None`` for any other url, which must then be matched using :func:`route_from`.
+
+    :param str route_prefix: the route prefix of the resource
+    :param converter: a :class:`werkzeug.routing.BaseConverter` instance for the id
+    :param reserved: urls below the route prefix that belong to other routes
+    """
+
+    def __init__(self, route_prefix, converter, reserved=()):
+        self.prefix = route_prefix + '/'
+        self._pattern = re.compile('(?:{})$'.format(converter.regex))
+        self._to_python = converter.to_python
+        self._reserved = frozenset(reserved)
+
+    def match(self, url):
+        """
+        :return: the converted id, or ``None``
+        """
+        if not url.startswith(self.prefix) or url in self._reserved:
+            return None
+
+        id = url[len(self.prefix):]
+        if '%' in id or '?' in id or '#' in id or self._pattern.match(id) is None:
+            return None
+
+        try:
+            return self._to_python(id)
+        except ValidationError:
+            return None
+
+
+def route_item_id(resource, url):
+    """
+    Returns the id from the url of an item of a resource, using the :class:`ItemUrlMatcher` of the resource when it
+    has one and :func:`route_from` otherwise.
+
+    :raises werkzeug.exceptions.NotFound: if the url does not match any route
+    """
+    matcher = resource.item_url_matcher
+    if matcher is not None:
+        id = matcher.match(url)
+        if id is not None:
+            return id
+
+    endpoint, args = route_from(url, 'GET')
+    return args['id']
+
+
 # --- start of Flask-RESTful code ---
 # Copyright (c) 2013, Twilio, Inc.
 # All rights reserved.
@@ -65,3 +121,55 @@ def get_value(key, obj, default):
 class AttributeDict(dict):
     __getattr__ = dict.__getitem__
     __setattr__ = dict.__setitem__
+
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+
+class LRUCache(object):
+    """
+    A bounded, thread-safe cache that discards the least recently used entries first and counts hits and misses.
+
+    :param int maxsize: maximum number of entries
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """
+        :return: a :class:`CacheInfo` tuple of hits, misses, maximum size and current size
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
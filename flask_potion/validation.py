@@ -0,0 +1,275 @@
+import numbers
+import re
+
+import six
+from jsonschema import Draft4Validator
+
+
+class NotCompilable(Exception):
+    """
+    Raised when a schema uses a feature that cannot be compiled, such as ``$ref``.
+    """
+    pass
+
+
+_PYTHON_TYPES = {
+    "array": (list,),
+    "boolean": (bool,),
+    "integer": six.integer_types,
+    "null": (type(None),),
+    "number": (numbers.Number,),
+    "object": (dict,),
+    "string": six.string_types,
+}
+
+# keywords without sub-schemas that are rarely used and checked with a separate Draft4Validator
+_DELEGATED_KEYWORDS = ('multipleOf', 'uniqueItems', 'minProperties', 'maxProperties')
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def _unbool(value, true=object(), false=object()):
+    if value is True:
+        return true
+    elif value is False:
+        return false
+    return value
+
+
+def _compile_type(types, schema, format_checker):
+    if isinstance(types, six.string_types):
+        types = [types]
+
+    try:
+        python_types = tuple(python_type for type_ in types for python_type in _PYTHON_TYPES[type_])
+    except (KeyError, TypeError):
+        raise NotCompilable(types)
+
+    if 'boolean' in types:
+        return lambda value: isinstance(value, python_types)
+    return lambda value: isinstance(value, python_types) and not isinstance(value, bool)
+
+
+def _compile_enum(enum, schema, format_checker):
+    def check(value):
+        if value == 0 or value == 1:
+            unbooled = _unbool(value)
+            return any(unbooled == _unbool(choice) for choice in enum)
+        return value in enum
+    return check
+
+
+def _compile_format(format, schema, format_checker):
+    if format_checker is None:
+        return None
+    return lambda value: format_checker.conforms(value, format)
+
+
+def _compile_min_length(length, schema, format_checker):
+    return lambda value: not isinstance(value, six.string_types) or len(value) >= length
+
+
+def _compile_max_length(length, schema, format_checker):
+    return lambda value: not isinstance(value, six.string_types) or len(value) <= length
+
+
+def _compile_pattern(pattern, schema, format_checker):
+    search = re.compile(pattern).search
+    return lambda value: not isinstance(value, six.string_types) or search(value) is not None
+
+
+def _compile_minimum(minimum, schema, format_checker):
+    if schema.get('exclusiveMinimum', False):
+        return lambda value: not _is_number(value) or value > minimum
+    return lambda value: not _is_number(value) or value >= minimum
+
+
+def _compile_maximum(maximum, schema, format_checker):
+    if schema.get('exclusiveMaximum', False):
+        return lambda value: not _is_number(value) or value < maximum
+    return lambda value: not _is_number(value) or value <= maximum
+
+
+def _compile_min_items(length, schema, format_checker):
+    return lambda value: not isinstance(value, list) or len(value) >= length
+
+
+def _compile_max_items(length, schema, format_checker):
+    return lambda value: not isinstance(value, list) or len(value) <= length
+
+
+def _compile_items(items, schema, format_checker):
+    if isinstance(items, dict):
+        check = compile_schema(items, format_checker)
+        return lambda value: not isinstance(value, list) or all(check(item) for item in value)
+
+    checks = [compile_schema(item, format_checker) for item in items]
+    return lambda value: not isinstance(value, list) or all(check(item) for check, item in zip(checks, value))
+
+
+def _compile_additional_items(additional_items, schema, format_checker):
+    items = schema.get('items', {})
+    if isinstance(items, dict) or additional_items is True:
+        return None
+
+    length = len(items)
+    if isinstance(additional_items, dict):
+        check = compile_schema(additional_items, format_checker)
+        return lambda value: not isinstance(value, list) or all(check(item) for item in value[length:])
+    return lambda value: not isinstance(value, list) or len(value) <= length
+
+
+def _compile_properties(properties, schema, format_checker):
+    checks = [(key, compile_schema(property, format_checker)) for key, property in properties.items()]
+    return lambda value: not isinstance(value, dict) or all(check(value[key]) for key, check in checks if key in value)
+
+
+def _compile_pattern_properties(pattern_properties, schema, format_checker):
+    checks = [(re.compile(pattern).search, compile_schema(property, format_checker))
+              for pattern, property in pattern_properties.items()]
+
+    return lambda value: not isinstance(value, dict) or all(check(item) for search, check in checks
+                                                            for key, item in value.items() if search(key))
+
+
+def _compile_additional_properties(additional_properties, schema, format_checker):
+    if additional_properties is True:
+        return None
+
+    properties = schema.get('properties', {})
+    patterns = '|'.join(schema.get('patternProperties', {}))
+    search = re.compile(patterns).search if patterns else None
+
+    def additional(value):
+        return [key for key in value if key not in properties and not (search and search(key))]
+
+    if isinstance(additional_properties, dict):
+        check = compile_schema(additional_properties, format_checker)
+        return lambda value: not isinstance(value, dict) or all(check(value[key]) for key in additional(value))
+    return lambda value: not isinstance(value, dict) or not additional(value)
+
+
+def _compile_required(required, schema, format_checker):
+    return lambda value: not isinstance(value, dict) or all(key in value for key in required)
+
+
+def _compile_any_of(schemas, schema, format_checker):
+    checks = [compile_schema(s, format_checker) for s in schemas]
+    return lambda value: any(check(value) for check in checks)
+
+
+def _compile_one_of(schemas, schema, format_checker):
+    checks = [compile_schema(s, format_checker) for s in schemas]
+    return lambda value: sum(1 for check in checks if check(value)) == 1
+
+
+def _compile_all_of(schemas, schema, format_checker):
+    checks = [compile_schema(s, format_checker) for s in schemas]
+    return lambda value: all(check(value) for check in checks)
+
+
+def _compile_not(not_schema, schema, format_checker):
+    check = compile_schema(not_schema, format_checker)
+    return lambda value: not check(value)
+
+
+_COMPILERS = {
+    "type": _compile_type,
+    "enum": _compile_enum,
+    "format": _compile_format,
+    "minLength": _compile_min_length,
+    "maxLength": _compile_max_length,
+    "pattern": _compile_pattern,
+    "minimum": _compile_minimum,
+    "maximum": _compile_maximum,
+    "minItems": _compile_min_items,
+    "maxItems": _compile_max_items,
+    "items": _compile_items,
+    "additionalItems": _compile_additional_items,
+    "properties": _compile_properties,
+    "patternProperties": _compile_pattern_properties,
+    "additionalProperties": _compile_additional_properties,
+    "required": _compile_required,
+    "anyOf": _compile_any_of,
+    "oneOf": _compile_one_of,
+    "allOf": _compile_all_of,
+    "not": _compile_not,
+}
+
+
+def compile_schema(schema, format_checker=None):
+    """
+    Compiles a Draft 4 JSON-schema into a function that returns whether an instance is valid.
+
+    Covers the keywords used in schemas generated by Potion. Keywords that are not validation keywords, such as
+    ``title`` or ``readOnly``, are ignored the way :class:`jsonschema.Draft4Validator` ignores them.
+
+    :param dict schema: JSON-schema
+    :param format_checker: optional :class:`jsonschema.FormatChecker`
+    :raises NotCompilable: if the schema contains ``$ref`` or an unsupported keyword
+    """
+    if not isinstance(schema, dict) or '$ref' in schema:
+        raise NotCompilable(schema)
+
+    checks = []
+    for keyword, value in sorted(schema.items(), key=lambda item: item[0] != 'type'):
+        if keyword in _COMPILERS:
+            check = _COMPILERS[keyword](value, schema, format_checker)
+        elif keyword in _DELEGATED_KEYWORDS:
+            check = Draft4Validator({keyword: value}, format_checker=format_checker).is_valid
+        elif keyword in Draft4Validator.VALIDATORS:
+            raise NotCompilable(keyword)
+        else:
+            continue
+
+        if check is not None:
+            checks.append(check)
+
+    if not checks:
+        return lambda value: True
+    elif len(checks) == 1:
+        return checks[0]
+
+    def is_valid(value):
+        for check in checks:
+            if not check(value):
+                return False
+        return True
+    return is_valid
+
+
+class Validator(object):
+    """
+    A replacement for :class:`jsonschema.Draft4Validator` that checks instances with a compiled schema.
+
+    Errors are always produced by :class:`jsonschema.Draft4Validator`, so they are identical to those of an
+    uncompiled validator. Schemas that cannot be compiled are checked with :class:`jsonschema.Draft4Validator` only.
+
+    :param dict schema: JSON-schema
+    :param format_checker: optional :class:`jsonschema.FormatChecker`
+    """
+
+    def __init__(self, schema, format_checker=None):
+        self.schema = schema
+        self._validator = Draft4Validator(schema, format_checker=format_checker)
+
+        try:
+            self._is_valid = compile_schema(schema, format_checker)
+            self.compiled = True
+        except NotCompilable:
+            self._is_valid = self._validator.is_valid
+            self.compiled = False
+
+    def is_valid(self, instance):
+        # when the compiled check fails, the slower validator has the last word
+        return self._is_valid(instance) or self._validator.is_valid(instance)
+
+    def iter_errors(self, instance):
+        return self._validator.iter_errors(instance)
+
+    def validate(self, instance):
+        if not self.is_valid(instance):
+            for error in self.iter_errors(instance):
+                raise error
@@ -10,6 +10,7 @@ tests_require = [
     'Flask-SQLAlchemy>=2.0',
     'Flask-MongoEngine>=0.7.1',
     'peewee==2.*',
+    'numpy',
     'nose>=1.1.2',
 ]
 
@@ -64,6 +65,9 @@ setup(
         'mongoengine': [
             'Flask-MongoEngine>=0.7.0'
         ],
+        'numpy': [
+            'numpy'
+        ],
         'tests': tests_require,
     }
 )
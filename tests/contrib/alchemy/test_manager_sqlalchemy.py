@@ -1,6 +1,7 @@
 import unittest
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import backref, joinedload
+from flask_potion.exceptions import ItemNotFound
 from flask_potion.routes import Relation
 from flask_potion.contrib.alchemy import SQLAlchemyManager
 from flask_potion import Api, fields
@@ -12,7 +13,7 @@ class SQLAlchemyTestCase(BaseTestCase):
     def setUp(self):
         super(SQLAlchemyTestCase, self).setUp()
         self.app.config['SQLALCHEMY_ENGINE'] = 'sqlite://'
-        self.api = Api(self.app, default_manager=SQLAlchemyManager)
+        self.api = Api(self.app, default_manager=SQLAlchemyManager, batch=True)
         self.sa = sa = SQLAlchemy(self.app, session_options={"autoflush": False})
 
         class Type(sa.Model):
@@ -36,6 +37,7 @@ class SQLAlchemyTestCase(BaseTestCase):
                 model = Machine
                 include_id = True
                 include_type = True
+                bulk_routes = True
 
             class Schema:
                 type = fields.ToOne('type')
@@ -45,6 +47,7 @@ class SQLAlchemyTestCase(BaseTestCase):
                 model = Type
                 include_id = True
                 include_type = True
+                bulk_routes = True
 
             class Schema:
                 machines = fields.ToMany('machine')
@@ -228,6 +231,270 @@ class SQLAlchemyTestCase(BaseTestCase):
         self.assert404(response)
 
 
+    def test_etag_attribute(self):
+        self.TypeResource.meta.etag = True
+        self.TypeResource.meta.etag_attribute = 'version'
+
+        self.client.post('/type', data={"name": "x-ray"})
+        self.TypeResource.meta.model.query.update({"version": 2})
+        self.sa.session.commit()
+
+        response = self.client.get('/type/1')
+        self.assertEqual('"1:2"', response.headers['ETag'])
+
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/type/1', headers={'If-None-Match': '"1:2"'})
+            self.assertStatus(response, 304)
+
+        counter.assert_count(1)
+        self.assertNotIn('name', str(counter.statements[0][0]).split('FROM')[0])
+
+        response = self.client.get('/type/2', headers={'If-None-Match': '"1:2"'})
+        self.assert404(response)
+
+
+    def test_create_many(self):
+        commits = []
+        self.sa.event.listen(self.sa.session, 'after_commit', commits.append)
+
+        response = self.client.post('/type', data=[{"name": "x-ray"}, {"name": "y-ray"}, {"name": "z-ray"}])
+
+        self.assert200(response)
+        self.assertEqual(['x-ray', 'y-ray', 'z-ray'], [item['name'] for item in response.json])
+        self.assertEqual([1, 2, 3], [item['$id'] for item in response.json])
+        self.assertEqual(1, len(commits))
+
+        response = self.client.post('/machine', data=[
+            {"name": "Irradiator I", "type": {"$ref": "/type/1"}},
+            {"name": "Irradiator II", "type": {"$ref": "/type/2"}, "wattage": 10000}
+        ])
+
+        self.assert200(response)
+        self.assertEqual([{"$ref": "/type/1"}, {"$ref": "/type/2"}], [item['type'] for item in response.json])
+
+        response = self.client.post('/type', data=[{"name": "w-ray"}, {"name": "x-ray"}])
+        self.assertStatus(response, 409)
+        self.assertEqual(3, len(self.client.get('/type').json))
+
+    def test_update_and_delete_where(self):
+        self.client.post('/type', data=[{"name": "x-ray"}, {"name": "y-ray"}])
+        self.client.post('/machine', data=[
+            {"name": "Irradiator I", "type": {"$ref": "/type/1"}, "wattage": 10},
+            {"name": "Irradiator II", "type": {"$ref": "/type/1"}, "wattage": 20},
+            {"name": "Sterilizer", "type": {"$ref": "/type/2"}, "wattage": 30}
+        ])
+
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.patch('/machine?where={"name": {"$startswith": "Irradiator"}}',
+                                         data={"wattage": 15})
+
+        self.assert200(response)
+        self.assertEqual(2, response.json)
+        counter.assert_count(1)
+        self.assertEqual([15, 15, 30], [machine['wattage'] for machine in self.client.get('/machine').json])
+
+        # relationships are updated item by item
+        response = self.client.patch('/machine?where={"wattage": 30}', data={"type": {"$ref": "/type/1"}})
+        self.assertEqual(1, response.json)
+        self.assertEqual([{"$ref": "/type/1"}] * 3, [machine['type'] for machine in self.client.get('/machine').json])
+
+        response = self.client.patch('/type?where={}', data={"name": "x-ray"})
+        self.assertStatus(response, 409)
+
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.delete('/machine?where={"wattage": {"$lt": 20}}')
+
+        self.assertEqual(2, response.json)
+        counter.assert_count(1)
+        self.assertEqual(['Sterilizer'], [machine['name'] for machine in self.client.get('/machine').json])
+
+    def test_keyset_pagination(self):
+        self.client.post('/type', data={"name": "x-ray"})
+        self.client.post('/machine', data=[{"name": "Machine {}".format(i), "wattage": i % 3, "type": {"$ref": "/type/1"}}
+                                           for i in range(1, 12)])
+
+        expected = [item['name'] for item in self.client.get('/machine?sort={"wattage": false}').json]
+        names = []
+        uri = '/machine?sort={"wattage": false}&per_page=4&after='
+
+        while uri:
+            with DBQueryCounter(self.sa.session) as counter:
+                response = self.client.get(uri)
+
+            # one query for the page; the type shared by all machines is formatted from its foreign key
+            self.assert200(response)
+            counter.assert_count(1)
+            self.assertNotIn('FROM type', str(counter.statements[0][0]))
+            names += [item['name'] for item in response.json]
+
+            links = dict(reversed(link.split('; ')) for link in response.headers['Link'].split(','))
+            uri = links.get('rel="next"', '')[1:-1]
+
+        self.assertEqual(11, len(names))
+        self.assertEqual(sorted(expected, key=lambda name: int(name.split()[1]) % 3), names)
+
+        response = self.client.get('/machine?sort={"type": false}&after=')
+        self.assert400(response)
+
+    def test_keyset_pagination_null_keys(self):
+        self.client.post('/type', data={"name": "x-ray"})
+        self.client.post('/machine', data=[{"name": "Machine {}".format(i), "wattage": None if i % 3 == 0 else i % 2,
+                                            "type": {"$ref": "/type/1"}} for i in range(1, 12)])
+
+        def pages(uri, direction):
+            names = []
+            while uri:
+                response = self.client.get(uri)
+                self.assert200(response)
+                page = [item['name'] for item in response.json]
+                names = names + page if direction == 'next' else page + names
+                links = dict(reversed(link.split('; ')) for link in response.headers['Link'].split(','))
+                uri = links.get('rel="{}"'.format(direction), '')[1:-1]
+            return names
+
+        for reverse in (False, True):
+            machines = [(None if i % 3 == 0 else i % 2, i) for i in range(1, 12)]
+            expected = ['Machine {}'.format(i) for wattage, i in sorted(
+                machines, key=lambda m: (m[0] is not None, m[0] or 0, m[1] if not reverse else -m[1]), reverse=reverse)]
+
+            sort = '{{"wattage": {}}}'.format('true' if reverse else 'false')
+            self.assertEqual(expected, pages('/machine?sort={}&per_page=2&after='.format(sort), 'next'))
+            self.assertEqual(expected, pages('/machine?sort={}&per_page=2&before='.format(sort), 'prev'))
+
+    def test_pagination_count(self):
+        self.client.post('/type', data={"name": "x-ray"})
+        self.client.post('/machine', data=[{"name": "Machine {}".format(i), "wattage": i, "type": {"$ref": "/type/1"}}
+                                           for i in range(1, 12)])
+
+        # the query for the page is not followed by one for the type, which is formatted from its foreign key
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/machine?per_page=20')
+
+        # a first page that is not full is not counted
+        counter.assert_count(1)
+        self.assertNotIn('FROM type', str(counter.statements[0][0]))
+        self.assertEqual('11', response.headers['X-Total-Count'])
+
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/machine?per_page=4&count=off')
+
+        counter.assert_count(1)
+        self.assertNotIn('X-Total-Count', response.headers)
+        self.assertNotIn('rel="last"', response.headers['Link'])
+        self.assertIn('rel="next"', response.headers['Link'])
+
+        # nor is a first page that is not full
+        response = self.client.get('/machine?per_page=20&count=off')
+        self.assertEqual(11, len(response.json))
+        self.assertNotIn('X-Total-Count', response.headers)
+        self.assertNotIn('rel="last"', response.headers['Link'])
+        self.assertNotIn('rel="next"', response.headers['Link'])
+
+        for i in range(2):
+            with DBQueryCounter(self.sa.session) as counter:
+                response = self.client.get('/machine?per_page=4&count=cached&where={"wattage": {"$gt": 0}}')
+
+            counter.assert_count(2 - i)
+            self.assertEqual('11', response.headers['X-Total-Count'])
+
+        response = self.client.get('/machine?per_page=4&page=3&count=estimated')
+        self.assertEqual('11', response.headers['X-Total-Count'])
+        self.assertEqual(3, len(response.json))
+
+        self.assert404(self.client.get('/machine?per_page=4&page=4'))
+
+    def test_pagination_count_cached_rollback(self):
+        self.client.post('/type', data={"name": "x-ray"})
+        self.client.post('/machine', data=[{"name": "Machine {}".format(i), "type": 1} for i in range(1, 3)])
+        self.assertEqual('2', self.client.get('/machine?per_page=1&count=cached').headers['X-Total-Count'])
+
+        response = self.client.post('/batch', data={
+            "atomic": True,
+            "operations": [
+                {"method": "POST", "path": "/machine", "body": {"name": "Machine 3", "type": 1}},
+                {"method": "GET", "path": "/machine?per_page=1&count=cached"},
+                {"method": "GET", "path": "/machine/99"}
+            ]
+        })
+
+        self.assertEqual([200, 200, 404], [result['status'] for result in response.json])
+        self.assertEqual('2', self.client.get('/machine?per_page=1&count=cached').headers['X-Total-Count'])
+
+    def test_stream_instances(self):
+        self.client.post('/type', data={"name": "x-ray"})
+        self.client.post('/machine', data=[{"name": "Machine {}".format(i), "wattage": i, "type": {"$ref": "/type/1"}}
+                                           for i in range(1, 12)])
+
+        expected = self.client.get('/machine?per_page=4&page=2').json
+        self.api.resources['machine'].meta.streaming = True
+
+        for count in ('exact', 'off'):
+            with DBQueryCounter(self.sa.session) as counter:
+                response = self.client.get('/machine?per_page=4&page=2&count={}'.format(count), buffered=False)
+
+                # the page is checked and counted before any of its items are read
+                self.assertFalse(any('ORDER BY' in str(statement[0]) for statement in counter.statements))
+                self.assertIn('rel="next"', response.headers['Link'])
+
+                self.assertEqual(expected, response.json)
+                self.assertIn('ORDER BY', str(counter.statements[-1][0]))
+                response.close()
+
+        self.assert404(self.client.get('/machine?per_page=4&page=4'))
+
+    def test_sparse_fieldsets(self):
+        self.client.post('/type', data={"name": "x-ray"})
+        self.client.post('/machine', data={"name": "Irradiator I", "wattage": 10.0, "type": {"$ref": "/type/1"}})
+
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/machine?fields=name')
+
+        self.assert200(response)
+        self.assertEqual([{"$id": 1, "$type": "machine", "name": "Irradiator I"}], response.json)
+        counter.assert_count(1)
+        self.assertNotIn('wattage', str(counter.statements[0][0]))
+
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/machine/1?fields=type')
+
+        self.assertEqual({"$id": 1, "$type": "machine", "type": {"$ref": "/type/1"}}, response.json)
+        self.assertNotIn('machine.name', str(counter.statements[0][0]))
+        self.assertIn('machine.type_id', str(counter.statements[0][0]))
+
+        self.assert400(self.client.get('/machine?fields=name,foo'))
+
+    def test_batch_atomic(self):
+        response = self.client.post('/batch', data={
+            "atomic": True,
+            "operations": [
+                {"method": "POST", "path": "/type", "body": {"name": "x-ray"}},
+                {"method": "POST", "path": "/machine", "body": {"name": "Irradiator I", "type": 1}},
+                {"method": "POST", "path": "/type", "body": {"name": "x-ray"}},
+                {"method": "POST", "path": "/type", "body": {"name": "y-ray"}}
+            ]
+        })
+
+        self.assert200(response)
+        self.assertEqual([200, 200, 409], [result['status'] for result in response.json])
+        self.assertEqual([True, True, True], [result['rolled_back'] for result in response.json])
+        self.assertEqual([], self.client.get('/type').json)
+        self.assertEqual([], self.client.get('/machine').json)
+
+        response = self.client.post('/batch', data={
+            "atomic": True,
+            "operations": [
+                {"method": "POST", "path": "/type", "body": {"name": "x-ray"}},
+                {"method": "POST", "path": "/machine", "body": {"name": "Irradiator I", "type": 1}},
+                {"method": "PATCH", "path": "/machine/1", "body": {"wattage": 10.0}}
+            ]
+        })
+
+        self.assertEqual([200, 200, 200], [result['status'] for result in response.json])
+        self.assertNotIn('rolled_back', response.json[0])
+        self.assertEqual(10.0, self.client.get('/machine/1').json['wattage'])
+        self.assertEqual(1, len(self.client.get('/type').json))
+
+
 class SQLAlchemyRelationTestCase(BaseTestCase):
 
     def setUp(self):
@@ -524,6 +791,102 @@ class SQLAlchemySortTestCase(BaseTestCase):
         type_uris = [entry['type']['$ref'] for entry in response.json]
         self.assertTrue(type_uris, [bbb_uri, aaa_uri])
 
+    def test_embed(self):
+        self.client.post('/type', data={"name": "aaa"})
+        self.client.post('/type', data={"name": "bbb"})
+        for i, type_id in enumerate((1, 2, 1)):
+            self.client.post('/machine', data={"name": "m{}".format(i), "type": {"$ref": "/type/{}".format(type_id)}})
+
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/machine?embed=type')
+
+        self.assert200(response)
+        counter.assert_count(1)
+        self.assertEqual([{"$uri": "/type/1", "name": "aaa"},
+                          {"$uri": "/type/2", "name": "bbb"},
+                          {"$uri": "/type/1", "name": "aaa"}], [machine['type'] for machine in response.json])
+
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/machine/2?embed=type')
+
+        counter.assert_count(1)
+        self.assertEqual({"$uri": "/type/2", "name": "bbb"}, response.json['type'])
+
+
+class SQLAlchemyEagerLoadingTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SQLAlchemyEagerLoadingTestCase, self).setUp()
+        self.app.config['SQLALCHEMY_ENGINE'] = 'sqlite://'
+        self.api = Api(self.app)
+        self.sa = sa = SQLAlchemy(self.app, session_options={"autoflush": False})
+
+        class Author(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String(60), nullable=False)
+
+        class Book(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            title = sa.Column(sa.String(60), nullable=False)
+
+            author_id = sa.Column(sa.Integer, sa.ForeignKey(Author.id))
+            author = sa.relationship(Author, backref='books')
+
+        sa.create_all()
+
+        class AuthorResource(ModelResource):
+            class Meta:
+                model = Author
+
+            class Schema:
+                books = fields.ToMany('book', io='r')
+
+        class BookResource(ModelResource):
+            class Meta:
+                model = Book
+
+            class Schema:
+                author = fields.ToOne('author', nullable=True)
+
+        self.api.add_resource(AuthorResource)
+        self.api.add_resource(BookResource)
+
+    def test_schema_query_options(self):
+        for i in range(1, 4):
+            self.client.post('/author', data={"name": "Author {}".format(i)})
+            self.client.post('/book', data={"title": "Book {}".format(i), "author": {"$ref": "/author/{}".format(i)}})
+        self.client.post('/book', data={"title": "Anonymous", "author": None})
+
+        # references are formatted from the foreign key
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/book')
+
+        counter.assert_count(1)
+        self.assertEqual([{"$ref": "/author/1"}, {"$ref": "/author/2"}, {"$ref": "/author/3"}, None],
+                         [book['author'] for book in response.json])
+
+        # collections are loaded for the whole page at once
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/author')
+
+        counter.assert_count(2)
+        self.assertEqual([[{"$ref": "/book/1"}], [{"$ref": "/book/2"}], [{"$ref": "/book/3"}]],
+                         [author['books'] for author in response.json])
+
+        # collections left out of the fields are not loaded
+        with DBQueryCounter(self.sa.session) as counter:
+            response = self.client.get('/author?fields=name')
+
+        counter.assert_count(1)
+        self.assertEqual(["Author 1", "Author 2", "Author 3"], [author['name'] for author in response.json])
+
+        # nor are they loaded with items read by id, which might not be formatted
+        with DBQueryCounter(self.sa.session) as counter:
+            with self.app.test_request_context('/book/1'):
+                self.api.resources['author'].manager.read(1)
+
+        counter.assert_count(1)
+
 
 class QueryOptionsSQLAlchemyTestCase(BaseTestCase):
     def setUp(self):
@@ -597,3 +960,224 @@ class QueryOptionsSQLAlchemyTestCase(BaseTestCase):
              'version': None,
              })
         counter.assert_count(1)
+
+
+class SQLAlchemyCacheTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SQLAlchemyCacheTestCase, self).setUp()
+        self.app.config['SQLALCHEMY_ENGINE'] = 'sqlite://'
+        self.api = Api(self.app, batch=True)
+        self.sa = sa = SQLAlchemy(self.app, session_options={"autoflush": False})
+
+        class Author(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String(60), nullable=False)
+
+        class Book(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            title = sa.Column(sa.String(60), nullable=False)
+
+            author_id = sa.Column(sa.Integer, sa.ForeignKey(Author.id))
+            author = sa.relationship(Author, backref='books')
+
+        sa.create_all()
+
+        class AuthorResource(ModelResource):
+            class Meta:
+                model = Author
+                cache = True
+                bulk_routes = True
+
+            class Schema:
+                books = fields.ToMany('book', io='r')
+
+        class BookResource(ModelResource):
+            class Meta:
+                model = Book
+
+            class Schema:
+                author = fields.ToOne('author', nullable=True)
+
+        self.api.add_resource(AuthorResource)
+        self.api.add_resource(BookResource)
+
+    def tearDown(self):
+        self.sa.drop_all()
+
+    def test_cache(self):
+        self.client.post('/author', data={"name": "Ann"})
+        self.client.post('/book', data={"title": "A", "author": {"$ref": "/author/1"}})
+
+        self.assertEqual({"$uri": "/author/1", "name": "Ann", "books": [{"$ref": "/book/1"}]},
+                         self.client.get('/author/1').json)
+        self.assertEqual([{"$uri": "/author/1", "name": "Ann", "books": [{"$ref": "/book/1"}]}],
+                         self.client.get('/author').json)
+
+        # the test client shares one session, which must not be expired to tell whether the items were cached
+        with DBQueryCounter(self.sa.session, reset=False) as counter:
+            self.assertEqual({"$uri": "/author/1", "name": "Ann", "books": [{"$ref": "/book/1"}]},
+                             self.client.get('/author/1').json)
+            self.assertEqual([{"$uri": "/author/1", "name": "Ann", "books": [{"$ref": "/book/1"}]}],
+                             self.client.get('/author').json)
+
+        counter.assert_count(0)
+
+        self.client.patch('/author/1', data={"name": "Anna"})
+        self.assertEqual("Anna", self.client.get('/author/1').json['name'])
+        self.assertEqual(["Anna"], [author['name'] for author in self.client.get('/author').json])
+
+        # items are invalidated when items referencing them change
+        self.client.post('/book', data={"title": "B", "author": {"$ref": "/author/1"}})
+        self.assertEqual([{"$ref": "/book/1"}, {"$ref": "/book/2"}], self.client.get('/author/1').json['books'])
+        self.assertEqual([[{"$ref": "/book/1"}, {"$ref": "/book/2"}]],
+                         [author['books'] for author in self.client.get('/author').json])
+
+        self.client.patch('/book/1', data={"author": None})
+        self.assertEqual([{"$ref": "/book/2"}], self.client.get('/author/1').json['books'])
+
+        self.client.delete('/book/2')
+        self.assertEqual([], self.client.get('/author/1').json['books'])
+
+        # updates without signals invalidate every item
+        self.assert200(self.client.patch('/author?where={"name": "Anna"}', data={"name": "Anne"}))
+        self.assertEqual("Anne", self.client.get('/author/1').json['name'])
+
+        self.client.delete('/author/1')
+        self.assert404(self.client.get('/author/1'))
+        self.assertEqual([], self.client.get('/author').json)
+
+    def test_cache_batch_rollback(self):
+        self.client.post('/author', data={"name": "Ann"})
+
+        response = self.client.post('/batch', data={
+            "atomic": True,
+            "operations": [
+                {"method": "PATCH", "path": "/author/1", "body": {"name": "Anna"}},
+                {"method": "POST", "path": "/author", "body": {"name": "Bob"}},
+                {"method": "POST", "path": "/author", "body": {"name": "Cy"}},
+                {"method": "GET", "path": "/author/1"},
+                {"method": "GET", "path": "/author?per_page=1"},
+                {"method": "GET", "path": "/author?per_page=1&page=2"},
+                {"method": "GET", "path": "/author/99"}
+            ]
+        })
+
+        self.assertEqual([200, 200, 200, 200, 200, 200, 404], [result['status'] for result in response.json])
+
+        # nothing read within the rolled back batch was cached
+        response = self.client.get('/author?per_page=1')
+        self.assertEqual('1', response.headers['X-Total-Count'])
+        self.assertEqual([{"$uri": "/author/1", "name": "Ann", "books": []}], response.json)
+        self.assertEqual("Ann", self.client.get('/author/1').json['name'])
+        self.assert404(self.client.get('/author?per_page=1&page=2'))
+
+
+
+class SQLAlchemyIdentityMapTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SQLAlchemyIdentityMapTestCase, self).setUp()
+        self.app.config['SQLALCHEMY_ENGINE'] = 'sqlite://'
+        self.api = Api(self.app)
+        self.sa = sa = SQLAlchemy(self.app, session_options={"autoflush": False})
+
+        class Book(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            title = sa.Column(sa.String(60), nullable=False)
+
+        sa.create_all()
+
+        class BookResource(ModelResource):
+            class Meta:
+                model = Book
+
+        self.api.add_resource(BookResource)
+
+    def tearDown(self):
+        self.sa.drop_all()
+
+    def test_identity_map(self):
+        self.client.post('/book', data={"title": "A"})
+
+        manager = self.api.resources['book'].manager
+
+        with self.app.test_request_context('/book/1'):
+            with DBQueryCounter(self.sa.session) as counter:
+                book = manager.read(1)
+                self.assertIs(book, manager.read(1))
+                self.assertIs(book, manager.read(1, attributes=['title']))
+
+            counter.assert_count(1)
+
+            manager.delete(book)
+            self.assertRaises(ItemNotFound, manager.read, 1)
+
+
+class SQLAlchemyReferenceTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(SQLAlchemyReferenceTestCase, self).setUp()
+        self.app.config['SQLALCHEMY_ENGINE'] = 'sqlite://'
+        self.api = Api(self.app)
+        self.sa = sa = SQLAlchemy(self.app, session_options={"autoflush": False})
+
+        article_tags = sa.Table('article_tags',
+                                sa.Column('article_id', sa.Integer(), sa.ForeignKey('article.id')),
+                                sa.Column('tag_id', sa.Integer(), sa.ForeignKey('tag.id')))
+
+        class Tag(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            name = sa.Column(sa.String(60), nullable=False, unique=True)
+
+        class Article(sa.Model):
+            id = sa.Column(sa.Integer, primary_key=True)
+            tags = sa.relationship(Tag, secondary=article_tags, order_by=Tag.id)
+
+        sa.create_all()
+
+        class TagResource(ModelResource):
+            class Meta:
+                model = Tag
+                natural_key = 'name'
+
+        class ArticleResource(ModelResource):
+            class Meta:
+                model = Article
+
+            class Schema:
+                tags = fields.ToMany('tag')
+
+        self.api.add_resource(TagResource)
+        self.api.add_resource(ArticleResource)
+
+    def tearDown(self):
+        self.sa.drop_all()
+
+    def test_to_many_references(self):
+        for name in ('a', 'b', 'c'):
+            self.client.post('/tag', data={"name": name})
+
+        self.client.post('/article', data={})
+
+        # the items are read with one query for each type of key
+        with DBQueryCounter(self.sa.session) as counter:
+            with self.app.test_request_context('/article/1'):
+                tags = self.api.resources['article'].schema.fields['tags'].convert(
+                    [{"$ref": "/tag/3"}, "a", 2, {"$ref": "/tag/1"}, "c"])
+
+        counter.assert_count(3)
+        self.assertEqual([3, 1, 2, 1, 3], [tag.id for tag in tags])
+
+        response = self.client.patch('/article/1', data={"tags": ["c", {"$ref": "/tag/2"}]})
+        self.assert200(response)
+        self.assertEqual([{"$ref": "/tag/2"}, {"$ref": "/tag/3"}], response.json['tags'])
+
+        response = self.client.patch('/article/1', data={"tags": [{"$ref": "/tag/4"}, {"$ref": "/tag/1"},
+                                                                  {"$ref": "/tag/5"}]})
+        self.assert404(response)
+        self.assertEqual([{"$type": "tag", "$id": 4}, {"$type": "tag", "$id": 5}], response.json['items'])
+
+        response = self.client.patch('/article/1', data={"tags": ["a", "x", "y"]})
+        self.assert404(response)
+        self.assertEqual({"$type": "tag", "$where": {"name": {"$in": ["x", "y"]}}}, response.json['item'])
@@ -49,6 +49,7 @@ class SQLAlchemySignalTestCase(BaseTestCase):
         class UserResource(ModelResource):
             class Meta:
                 model = User
+                bulk_routes = True
 
             children = Relation('self')
 
@@ -114,6 +115,41 @@ class SQLAlchemySignalTestCase(BaseTestCase):
             self.assertJSONEqual({'$uri': '/user/1', "name": "Foo", "gender": None}, response.json)
 
 
+    def test_create_many_signal(self):
+
+        with self.assertSignals([
+            (signals.before_create, self.UserResource, {'item': self.User(name="Foo")}),
+            (signals.before_create, self.UserResource, {'item': self.User(name="Bar")}),
+            (signals.after_create, self.UserResource, {'item': self.User(name="Foo")}),
+            (signals.after_create, self.UserResource, {'item': self.User(name="Bar")})
+        ]):
+            response = self.client.post('/user', data=[{"name": "Foo"}, {"name": "Bar"}])
+            self.assert200(response)
+            self.assertJSONEqual([
+                {'$uri': '/user/1', "name": "Foo", "gender": None},
+                {'$uri': '/user/2', "name": "Bar", "gender": None}
+            ], response.json)
+
+    def test_update_where_signal(self):
+        self.client.post('/user', data=[{"name": "Foo"}, {"name": "Bar"}])
+
+        with self.assertSignals([]):
+            response = self.client.patch('/user?where={"name": "Foo"}', data={"gender": "f"})
+            self.assertEqual(1, response.json)
+
+        self.UserResource.meta.bulk_signals = True
+
+        with self.assertSignals([
+            (signals.before_update, self.UserResource, {'item': self.User(name="Foo"), 'changes': {'gender': 'm'}}),
+            (signals.after_update, self.UserResource, {'item': self.User(name="Foo"), 'changes': {'gender': 'm'}}),
+            (signals.before_delete, self.UserResource, {'item': self.User(name="Foo")}),
+            (signals.after_delete, self.UserResource, {'item': self.User(name="Foo")})
+        ]):
+            response = self.client.patch('/user?where={"name": "Foo"}', data={"gender": "m"})
+            self.assertEqual(1, response.json)
+            response = self.client.delete('/user?where={"gender": "m"}')
+            self.assertEqual(1, response.json)
+
     def test_update_signal(self):
         response = self.client.post('/user', data={"name": "Foo"})
         self.assert200(response)
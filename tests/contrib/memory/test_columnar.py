@@ -0,0 +1,141 @@
+import unittest
+
+from flask_potion import Api, fields
+from flask_potion.contrib.memory import MemoryManager
+from flask_potion.filters import Condition
+from flask_potion.resource import ModelResource
+from tests import BaseTestCase
+
+try:
+    from flask_potion.contrib.memory.columnar import ColumnarMemoryManager
+except ImportError:
+    ColumnarMemoryManager = None
+
+
+@unittest.skipIf(ColumnarMemoryManager is None, 'NumPy is not installed')
+class ColumnarMemoryManagerTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(ColumnarMemoryManagerTestCase, self).setUp()
+        self.api = Api(self.app)
+
+        def strain_resource(resource_name, resource_manager):
+            class StrainResource(ModelResource):
+                class Meta:
+                    name = resource_name
+                    model = resource_name
+                    manager = resource_manager
+
+                class Schema:
+                    name = fields.String()
+                    organism = fields.String(nullable=True)
+                    year = fields.Integer(nullable=True)
+                    yield_ = fields.Number(attribute='yield', nullable=True)
+                    public = fields.Boolean(default=False)
+                    tags = fields.Array(fields.String)
+
+            return StrainResource
+
+        self.api.add_resource(strain_resource('strain', ColumnarMemoryManager))
+        self.api.add_resource(strain_resource('dict_strain', MemoryManager))
+
+        for name, organism, year, yield_, public, tags in [
+                ('ecoli-1', 'E. coli', 2001, 0.5, True, ['k12']),
+                ('yeast-1', 'S. cerevisiae', 2005, None, False, []),
+                ('ecoli-2', 'E. coli', 2005, 1.5, True, ['k12', 'bl21']),
+                ('ecoli-10', None, 1999, 0.25, False, []),
+                ('yeast-2', 'S. cerevisiae', 2001, 2.0, True, ['s288c'])]:
+            for prefix in ('/strain', '/dict_strain'):
+                self.client.post(prefix, data={'name': name, 'organism': organism, 'year': year,
+                                               'yield_': yield_, 'public': public, 'tags': tags})
+
+    def assertQueryResult(self, expected, query):
+        response = self.client.get('/strain?{}'.format(query))
+        dict_response = self.client.get('/dict_strain?{}'.format(query))
+
+        self.assertEqual(expected, [item['name'] for item in response.json])
+        self.assertEqual([dict(item, **{'$uri': None}) for item in dict_response.json],
+                         [dict(item, **{'$uri': None}) for item in response.json])
+        self.assertEqual(dict_response.headers.get('X-Total-Count'), response.headers.get('X-Total-Count'))
+
+    def test_read(self):
+        self.assertEqual({'$uri': '/strain/3', 'name': 'ecoli-2', 'organism': 'E. coli', 'year': 2005,
+                          'yield_': 1.5, 'public': True, 'tags': ['k12', 'bl21']},
+                         self.client.get('/strain/3').json)
+        self.assert404(self.client.get('/strain/6'))
+
+    def test_where(self):
+        self.assertQueryResult(['ecoli-1', 'ecoli-2'], 'where={"organism": "E. coli"}')
+        self.assertQueryResult(['ecoli-10'], 'where={"organism": null}')
+        self.assertQueryResult(['ecoli-1', 'yeast-1', 'ecoli-2', 'yeast-2'], 'where={"organism": {"$ne": null}}')
+        self.assertQueryResult(['yeast-1', 'ecoli-2', 'yeast-2'],
+                               'where={"organism": {"$in": ["S. cerevisiae", "E. coli", "B. subtilis"]}, '
+                               '"year": {"$gt": 2000}, "name": {"$ne": "ecoli-1"}}')
+        self.assertQueryResult(['ecoli-1', 'ecoli-2'], 'where={"yield_": {"$lte": 1.5}, "public": true}')
+        self.assertQueryResult(['ecoli-1', 'ecoli-10'], 'where={"name": {"$istartswith": "ECOLI-1"}}')
+        self.assertQueryResult(['ecoli-1', 'ecoli-2', 'yeast-2'], 'where={"public": true}')
+        self.assertQueryResult(['ecoli-2'], 'where={"tags": {"$contains": "bl21"}}')
+
+    def test_sort(self):
+        self.assertQueryResult(['ecoli-10', 'ecoli-1', 'yeast-2', 'yeast-1', 'ecoli-2'], 'sort={"year": false}')
+        self.assertQueryResult(['ecoli-1', 'ecoli-2', 'yeast-2', 'ecoli-10', 'yeast-1'],
+                               'sort={"public": true, "name": false}')
+        self.assertQueryResult(['yeast-2', 'yeast-1'],
+                               'sort={"name": true}&where={"organism": "S. cerevisiae"}')
+        self.assertQueryResult(['ecoli-1', 'yeast-1'], 'sort={"year": false, "name": true}&page=2&per_page=2')
+
+    def test_update_delete(self):
+        self.client.patch('/strain/1', data={'organism': 'B. subtilis', 'year': None})
+        self.client.delete('/strain/2')
+
+        for i in range(6, 2000):
+            self.api.resources['strain'].manager.create({'name': 'strain-{}'.format(i), 'year': i})
+
+        self.assertEqual({'$uri': '/strain/1', 'name': 'ecoli-1', 'organism': 'B. subtilis', 'year': None,
+                          'yield_': 0.5, 'public': True, 'tags': ['k12']},
+                         self.client.get('/strain/1').json)
+        self.assert404(self.client.get('/strain/2'))
+
+        response = self.client.get('/strain?where={"year": {"$lt": 2002}}&per_page=3')
+        self.assertEqual(['ecoli-10', 'yeast-2', 'strain-6'], [item['name'] for item in response.json])
+        self.assertEqual('1996', response.headers['X-Total-Count'])
+
+    def test_delete_create(self):
+        manager = self.api.resources['strain'].manager
+
+        for i in range(10):
+            items = [manager.create({'name': 'strain-{}-{}'.format(i, j), 'year': j}) for j in range(100)]
+            for item in items:
+                manager.delete(item)
+
+        self.assertLessEqual(manager._size, 105)
+        self.assertEqual(5, len(manager._columns['name'].categories))
+        self.assertQueryResult(['ecoli-1', 'yeast-1', 'ecoli-2', 'ecoli-10', 'yeast-2'], '')
+        self.assertQueryResult(['yeast-1', 'ecoli-2'], 'where={"year": 2005}')
+
+    def test_number_types(self):
+        manager = self.api.resources['strain'].manager
+        manager.update(manager.read(1), {'yield': 3})
+        manager.update(manager.read(2), {'yield': 3.0})
+
+        self.assertIsInstance(manager.read(1)['yield'], int)
+        self.assertIsInstance(manager.read(2)['yield'], float)
+
+        filters = manager.filters['yield_']
+        where = (Condition('yield', filters['gt'], 1), Condition('yield', filters['lt'], 3.5))
+        self.assertEqual(['ecoli-2', 'yeast-2', 'ecoli-1', 'yeast-1'],
+                         [item['name'] for item in manager.instances(where, [(None, 'yield', False)])])
+
+    def test_overflow(self):
+        manager = self.api.resources['strain'].manager
+
+        with self.assertRaises(OverflowError):
+            manager.create({'name': 'strain-6', 'year': 2 ** 70})
+        with self.assertRaises(OverflowError):
+            manager.update(manager.read(1), {'name': 'ecoli-1a', 'yield': 2 ** 60 + 1})
+
+        # items are not stored in part
+        self.assertEqual(5, len(list(manager.instances())))
+        self.assertEqual({'id': 1, 'name': 'ecoli-1', 'organism': 'E. coli', 'year': 2001, 'yield': 0.5,
+                          'public': True, 'tags': ['k12']}, manager.read(1))
+
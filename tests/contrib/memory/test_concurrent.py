@@ -0,0 +1,107 @@
+import threading
+
+from flask_potion import Api, fields
+from flask_potion.contrib.memory import ConcurrentMemoryManager
+from flask_potion.filters import Condition
+from flask_potion.resource import ModelResource
+from tests import BaseTestCase
+
+
+class ConcurrentMemoryManagerTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(ConcurrentMemoryManagerTestCase, self).setUp()
+        self.api = Api(self.app, default_manager=ConcurrentMemoryManager)
+
+        class StrainResource(ModelResource):
+            class Meta:
+                name = 'strain'
+                model = 'strain'
+                indexes = {'year': 'ordered', 'organism': 'hash'}
+
+            class Schema:
+                name = fields.String()
+                organism = fields.String()
+                year = fields.Integer()
+                parents = fields.ToMany('strain')
+
+        self.api.add_resource(StrainResource)
+        self.manager = StrainResource.manager
+
+    def _names(self, items):
+        return [item['name'] for item in items]
+
+    def test_snapshot_isolation(self):
+        for name, year in [('ecoli-1', 2001), ('ecoli-2', 2005)]:
+            self.manager.create({'name': name, 'organism': 'E. coli', 'year': year})
+
+        sort = [(None, 'year', False)]
+        items = self.manager.instances(sort=sort)
+        ecoli_1 = self.manager.read(1)
+
+        self.manager.create({'name': 'ecoli-0', 'organism': 'E. coli', 'year': 1999})
+        self.manager.update(ecoli_1, {'name': 'ecoli-1a'})
+        self.manager.delete(self.manager.read(2))
+
+        self.assertEqual(['ecoli-1', 'ecoli-2'], self._names(items))
+        self.assertEqual('ecoli-1', ecoli_1['name'])
+        self.assertEqual(['ecoli-0', 'ecoli-1a'], self._names(self.manager.instances(sort=sort)))
+
+    def test_relations(self):
+        for name in ('ecoli-1', 'ecoli-2', 'ecoli-3'):
+            self.manager.create({'name': name, 'organism': 'E. coli', 'year': 2001})
+
+        item = self.manager.read(3)
+        self.manager.relation_add(item, 'parents', self.manager.resource, self.manager.read(1))
+        self.manager.relation_add(item, 'parents', self.manager.resource, self.manager.read(2))
+        self.manager.relation_remove(item, 'parents', self.manager.resource, self.manager.read(1))
+
+        self.assertNotIn('parents', item)
+        self.assertEqual({2}, self.manager.read(3)['parents'])
+
+        self.manager.delete(self.manager.read(2))
+        self.assertEqual([], self.manager.relation_instances(self.manager.read(3), 'parents',
+                                                             self.manager.resource, 1, 20).items)
+
+    def test_sessions_per_thread(self):
+        self.manager.begin()
+        self.manager.create({'name': 'ecoli-1', 'organism': 'E. coli', 'year': 2001}, commit=False)
+
+        thread = threading.Thread(target=self.manager.commit)
+        thread.start()
+        thread.join()
+        self.assertEqual([], list(self.manager.instances()))
+
+        self.manager.commit()
+        self.assertEqual(['ecoli-1'], self._names(self.manager.instances()))
+
+    def test_concurrent_reads_and_writes(self):
+        errors = []
+        done = threading.Event()
+
+        def write(organism):
+            for i in range(50):
+                self.manager.create({'name': '{}-{}'.format(organism, i), 'organism': organism, 'year': 2000 + i})
+
+        def read():
+            where = (Condition('organism', self.manager.filters['organism']['eq'], 'E. coli'),)
+            sort = [(None, 'year', False)]
+            while not done.is_set():
+                pagination = self.manager.paginated_instances(1, 1000, where=where, sort=sort)
+                years = [item['year'] for item in pagination.items]
+                if len(years) != pagination.total or years != sorted(years):
+                    errors.append(years)
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        writers = [threading.Thread(target=write, args=(organism,)) for organism in ('E. coli', 'S. cerevisiae')]
+
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(list(range(1, 101)), sorted(item['id'] for item in self.manager.instances()))
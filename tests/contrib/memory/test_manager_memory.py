@@ -0,0 +1,188 @@
+from flask_potion import Api, fields
+from flask_potion.contrib.memory import MemoryManager
+from flask_potion.contrib.memory.indexes import OrderedIndex
+from flask_potion.exceptions import ItemNotFound
+from flask_potion.filters import Condition, compile_conditions
+from flask_potion.resource import ModelResource
+from tests import BaseTestCase
+
+
+class MemoryManagerIndexTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(MemoryManagerIndexTestCase, self).setUp()
+        self.api = Api(self.app, default_manager=MemoryManager)
+
+        def strain_resource(resource_name, resource_indexes):
+            class StrainResource(ModelResource):
+                class Meta:
+                    name = resource_name
+                    model = resource_name
+                    indexes = resource_indexes
+
+                class Schema:
+                    name = fields.String()
+                    organism = fields.String()
+                    year = fields.Integer(nullable=True)
+
+            return StrainResource
+
+        StrainResource = strain_resource('strain', {'name': 'ordered', 'organism': 'hash', 'year': 'ordered'})
+        UnindexedStrainResource = strain_resource('unindexed_strain', None)
+
+        self.api.add_resource(StrainResource)
+        self.api.add_resource(UnindexedStrainResource)
+
+        self.managers = (StrainResource.manager, UnindexedStrainResource.manager)
+
+        for i, (name, organism, year) in enumerate([('ecoli-1', 'E. coli', 2001),
+                                                    ('yeast-1', 'S. cerevisiae', 2005),
+                                                    ('ecoli-2', 'E. coli', 2005),
+                                                    ('ecoli-10', 'E. coli', 1999),
+                                                    ('yeast-2', 'S. cerevisiae', 2001)]):
+            for manager in self.managers:
+                manager.create({'name': name, 'organism': organism, 'year': year})
+
+    def _where(self, manager, *conditions):
+        return tuple(Condition(attribute, manager.filters[attribute][name], value)
+                     for attribute, name, value in conditions)
+
+    def _names(self, items):
+        return [item['name'] for item in items]
+
+    def _sort(self, manager, *attributes):
+        return [(manager.resource.schema.fields[attribute], attribute, reverse) for attribute, reverse in attributes]
+
+    def assertQueryResult(self, expected, conditions=(), sort=()):
+        results = []
+        for manager in self.managers:
+            where = self._where(manager, *conditions) or None
+            results.append(self._names(manager.instances(where, self._sort(manager, *sort) or None)))
+
+        self.assertEqual(expected, results[0])
+        self.assertEqual(results[1], results[0])
+
+    def test_index_conditions(self):
+        self.assertQueryResult(['ecoli-1', 'ecoli-2', 'ecoli-10'], [('organism', None, 'E. coli')])
+        self.assertQueryResult(['ecoli-1', 'yeast-1', 'ecoli-2', 'ecoli-10', 'yeast-2'],
+                               [('organism', 'in', ['E. coli', 'S. cerevisiae', 'B. subtilis'])])
+        self.assertQueryResult(['yeast-1', 'ecoli-2'], [('year', 'gt', 2001)])
+        self.assertQueryResult(['ecoli-1', 'ecoli-10', 'yeast-2'], [('year', 'lte', 2001)])
+        self.assertQueryResult(['ecoli-2'], [('year', 'gte', 2005), ('name', 'startswith', 'ecoli')])
+        self.assertQueryResult(['ecoli-1', 'ecoli-2', 'ecoli-10'], [('name', 'startswith', 'ecoli-')])
+        self.assertQueryResult([], [('name', None, 'bacillus-1')])
+
+    def test_index_sort(self):
+        self.assertQueryResult(['ecoli-10', 'ecoli-1', 'yeast-2', 'yeast-1', 'ecoli-2'], sort=[('year', False)])
+        self.assertQueryResult(['yeast-1', 'ecoli-2', 'ecoli-1', 'yeast-2', 'ecoli-10'], sort=[('year', True)])
+        self.assertQueryResult(['yeast-2', 'yeast-1', 'ecoli-2', 'ecoli-10', 'ecoli-1'], sort=[('name', True)])
+        self.assertQueryResult(['ecoli-1', 'ecoli-10'], [('year', 'lt', 2005), ('organism', None, 'E. coli')],
+                               sort=[('name', False)])
+
+        for manager in self.managers:
+            sort = self._sort(manager, ('organism', True), ('year', False))
+            pagination = manager.paginated_instances(2, 2, sort=sort)
+            self.assertEqual(['ecoli-10', 'ecoli-1'], self._names(pagination.items))
+            self.assertEqual(5, pagination.total)
+
+            pagination = manager.paginated_instances(1, 2, sort=self._sort(manager, ('year', True)), count='off')
+            self.assertEqual(['yeast-1', 'ecoli-2'], self._names(pagination.items))
+            self.assertTrue(pagination.has_next)
+
+    def test_index_maintenance(self):
+        for manager in self.managers:
+            manager.update(manager.read(2), {'organism': 'E. coli', 'year': 1998})
+            manager.delete(manager.read(3))
+
+            manager.begin()
+            manager.create({'name': 'ecoli-3', 'organism': 'E. coli', 'year': 2010}, commit=False)
+            manager.commit()
+
+        self.assertQueryResult(['ecoli-1', 'yeast-1', 'ecoli-10', 'ecoli-3'], [('organism', None, 'E. coli')])
+        self.assertQueryResult(['ecoli-3'], [('year', 'gt', 2001)])
+        self.assertQueryResult(['ecoli-1', 'ecoli-10', 'yeast-2'], [('year', 'in', [1999, 2001])])
+
+    def test_index_build(self):
+        for manager in self.managers:
+            manager.INDEX_BUILD_SIZE = 3
+            manager.update(manager.read(1), {'year': 1998})
+            manager.create_many([{'name': 'ecoli-3', 'organism': 'E. coli', 'year': 2010},
+                                 {'name': 'bacillus-1', 'organism': 'B. subtilis', 'year': 1999},
+                                 {'name': 'yeast-3', 'organism': 'S. cerevisiae', 'year': 2001}])
+
+        self.assertQueryResult(['ecoli-1', 'ecoli-10', 'bacillus-1', 'yeast-2', 'yeast-3', 'yeast-1', 'ecoli-2',
+                                'ecoli-3'], sort=[('year', False)])
+        self.assertQueryResult(['yeast-2', 'yeast-3'], [('year', None, 2001)])
+        self.assertQueryResult(['ecoli-1', 'ecoli-2', 'ecoli-10', 'ecoli-3'], [('organism', None, 'E. coli')])
+
+        index = OrderedIndex('year')
+        index.build([(1, 2001), (2, None), (3, 1999), (4, 2001)])
+        self.assertEqual([3, 1, 4], list(index.ordered_ids()))
+        self.assertEqual({2}, index._unindexed)
+
+        # values that cannot be compared with each other are added one at a time
+        index.build([(1, 2001), (2, 'unknown'), (3, 1999)])
+        self.assertEqual([3, 1], list(index.ordered_ids()))
+        self.assertEqual({2}, index._unindexed)
+
+    def test_compile_conditions(self):
+        manager = self.managers[1]
+        items = list(manager.items.values())
+
+        for conditions, expected in (
+                ([], ['ecoli-1', 'yeast-1', 'ecoli-2', 'ecoli-10', 'yeast-2']),
+                ([('organism', 'in', ['E. coli'])], ['ecoli-1', 'ecoli-2', 'ecoli-10']),
+                ([('name', 'icontains', 'COLI-1'), ('year', 'ne', 2001)], ['ecoli-10']),
+                ([('organism', 'istartswith', 's. c'), ('year', 'gte', 2000), ('year', 'lt', 2004)], ['yeast-2']),
+                ([('name', 'iendswith', '-2'), ('organism', None, 'E. coli')], ['ecoli-2'])):
+            where = self._where(manager, *conditions)
+            matches = compile_conditions(where)
+
+            self.assertEqual(expected, self._names(item for item in items if matches(item)))
+            self.assertEqual(expected, self._names(item for item in items if all(c(item) for c in where)))
+
+
+class MemoryManagerIdentityMapTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(MemoryManagerIdentityMapTestCase, self).setUp()
+        self.api = Api(self.app, default_manager=MemoryManager)
+
+        class StrainResource(ModelResource):
+            class Meta:
+                name = 'strain'
+                model = 'strain'
+
+            class Schema:
+                name = fields.String()
+
+        self.api.add_resource(StrainResource)
+        self.manager = StrainResource.manager
+
+    def test_identity_map(self):
+        manager = self.manager
+        manager.create({'name': 'ecoli-1'})
+        manager.create({'name': 'ecoli-2'})
+
+        with self.app.test_request_context('/strain/1'):
+            strain = manager.read(1)
+            self.assertIs(strain, manager.read(1))
+            self.assertIs(strain, manager.read(1, attributes=['name']))
+            self.assertEqual([strain, manager.read(2)], manager.read_many([1, 2]))
+
+            # the manager replaces updated items, which must not be read from the identity map
+            updated = manager.update(strain, {'name': 'ecoli-1a'})
+            self.assertIs(updated, manager.read(1))
+            self.assertIsNot(strain, manager.read(1))
+
+            # items changed in bulk are forgotten too
+            where = (Condition('name', manager.filters['name']['eq'], 'ecoli-2'),)
+            manager.update_where(where, {'name': 'ecoli-2a'})
+            self.assertEqual('ecoli-2a', manager.read(2)['name'])
+
+            manager.delete(manager.read(2))
+            self.assertRaises(ItemNotFound, manager.read, 2)
+
+        # each request has its own identity map
+        with self.app.test_request_context('/strain/1'):
+            self.assertEqual('ecoli-1a', manager.read(1)['name'])
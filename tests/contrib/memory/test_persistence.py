@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask_potion import Api, fields
+from flask_potion.contrib.memory import MemoryManager
+from flask_potion.contrib.memory.persistence import SnapshotItems
+from flask_potion.filters import Condition
+from flask_potion.resource import ModelResource
+from tests import BaseTestCase
+
+try:
+    from flask_potion.contrib.memory.columnar import ColumnarMemoryManager
+except ImportError:
+    ColumnarMemoryManager = None
+
+
+class MemoryManagerPersistenceTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(MemoryManagerPersistenceTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.api = Api(self.app, default_manager=MemoryManager)
+
+        def strain_resource(resource_name, resource_indexes):
+            class StrainResource(ModelResource):
+                class Meta:
+                    name = resource_name
+                    model = resource_name
+                    indexes = resource_indexes
+                    persist = self.directory
+
+                class Schema:
+                    name = fields.String()
+                    year = fields.Integer(nullable=True)
+
+            return StrainResource
+
+        self.StrainResource = strain_resource('strain', None)
+        self.IndexedStrainResource = strain_resource('indexed_strain', {'year': 'ordered'})
+        self.api.add_resource(self.StrainResource)
+        self.api.add_resource(self.IndexedStrainResource)
+
+    def tearDown(self):
+        for resource in (self.StrainResource, self.IndexedStrainResource):
+            resource.manager.log.close()
+        shutil.rmtree(self.directory)
+        super(MemoryManagerPersistenceTestCase, self).tearDown()
+
+    def _reopen(self, resource):
+        resource.manager.log.close()
+        return type(resource.manager)(resource, resource.meta.model)
+
+    def _populate(self, manager):
+        for name, year in [('ecoli-1', 2001), ('yeast-1', 2005), ('ecoli-2', 2005)]:
+            manager.create({'name': name, 'year': year})
+
+        manager.update(manager.read(1), {'year': 1999})
+        manager.delete(manager.read(2))
+
+    def test_replay_log(self):
+        manager = self.StrainResource.manager
+        self._populate(manager)
+
+        manager.begin()
+        manager.create({'name': 'yeast-2', 'year': None}, commit=False)
+        manager.commit()
+
+        manager = self._reopen(self.StrainResource)
+        self.assertEqual([{'id': 1, 'name': 'ecoli-1', 'year': 1999},
+                          {'id': 3, 'name': 'ecoli-2', 'year': 2005},
+                          {'id': 4, 'name': 'yeast-2', 'year': None}], list(manager.instances()))
+
+        self.assertEqual(5, manager.create({'name': 'ecoli-10'})['id'])
+        self.StrainResource.manager = manager
+
+    def test_commit_rollback(self):
+        manager = self.StrainResource.manager
+        self._populate(manager)
+        size = manager.log.size
+
+        manager.begin()
+        manager.create({'name': 'yeast-2'}, commit=False)
+        manager.commit()
+        manager.commit()
+        self.assertEqual(size + 1, manager.log.size)
+
+        with self.assertRaises(TypeError):
+            manager.create_many([{'name': 'yeast-3'}, None])
+        manager.commit()
+
+        self.assertEqual(size + 1, manager.log.size)
+        self.assertEqual(['ecoli-1', 'ecoli-2', 'yeast-2'], [item['name'] for item in manager.instances()])
+
+    def test_snapshot(self):
+        manager = self.StrainResource.manager
+        self._populate(manager)
+        manager.snapshot()
+
+        self.assertEqual(0, os.path.getsize(os.path.join(self.directory, 'strain.log')))
+        manager.update(manager.read(3), {'name': 'ecoli-3'})
+
+        manager = self._reopen(self.StrainResource)
+        self.assertIsInstance(manager.items, SnapshotItems)
+        self.assertEqual(['ecoli-1', 'ecoli-3'], [item['name'] for item in manager.instances()])
+        self.assertEqual(4, manager.create({'name': 'ecoli-10'})['id'])
+
+        # records that were not read are copied into the next snapshot
+        manager.snapshot()
+        manager = self._reopen(self.StrainResource)
+        self.assertEqual(['ecoli-1', 'ecoli-3', 'ecoli-10'], [item['name'] for item in manager.instances()])
+        self.StrainResource.manager = manager
+
+    def test_snapshot_interval(self):
+        manager = self.IndexedStrainResource.manager
+        manager.SNAPSHOT_INTERVAL = 4
+        self._populate(manager)
+
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'indexed_strain.snapshot')))
+        self.assertEqual(1, manager.log.size)
+
+        manager = self._reopen(self.IndexedStrainResource)
+        where = (Condition('year', manager.filters['year']['gt'], 2000),)
+        self.assertEqual(['ecoli-2'], [item['name'] for item in manager.paginated_instances(1, 20, where).items])
+        self.IndexedStrainResource.manager = manager
+
+    def test_incomplete_log_record(self):
+        manager = self.StrainResource.manager
+        self._populate(manager)
+
+        path = os.path.join(self.directory, 'strain.log')
+        size = os.path.getsize(path)
+        manager.create({'name': 'yeast-2'})
+        manager.log.close()
+
+        with open(path, 'r+b') as file:
+            file.truncate(os.path.getsize(path) - 1)
+
+        manager = MemoryManager(self.StrainResource, 'strain')
+        self.assertEqual(['ecoli-1', 'ecoli-2'], [item['name'] for item in manager.instances()])
+        self.assertEqual(size, os.path.getsize(path))
+        self.StrainResource.manager = manager
+
+    @unittest.skipIf(ColumnarMemoryManager is None, 'NumPy is not installed')
+    def test_failed_write(self):
+        class ColumnarStrainResource(ModelResource):
+            class Meta:
+                name = 'columnar_strain'
+                model = 'columnar_strain'
+                manager = ColumnarMemoryManager
+                persist = self.directory
+
+            class Schema:
+                name = fields.String()
+                year = fields.Integer(nullable=True)
+
+        self.api.add_resource(ColumnarStrainResource)
+        manager = ColumnarStrainResource.manager
+
+        try:
+            self._populate(manager)
+
+            path = os.path.join(self.directory, 'columnar_strain.log')
+            size = os.path.getsize(path)
+
+            with self.assertRaises(OverflowError):
+                manager.create({'name': 'yeast-2', 'year': 2 ** 70})
+
+            # the change is not left in the log, where it would fail again on startup
+            self.assertEqual(size, os.path.getsize(path))
+            manager.create({'name': 'yeast-2', 'year': 2010})
+
+            manager = self._reopen(ColumnarStrainResource)
+            self.assertEqual(['ecoli-1', 'ecoli-2', 'yeast-2'], [item['name'] for item in manager.instances()])
+        finally:
+            manager.log.close()
+
+    def test_lock(self):
+        with self.assertRaises(RuntimeError):
+            MemoryManager(self.StrainResource, 'strain')
+
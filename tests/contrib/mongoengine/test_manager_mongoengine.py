@@ -160,6 +160,43 @@ class MongoEngineManagerTestCase(MongoEngineTestCase):
     def test_pagination(self):
         pass  # TODO
 
+    def test_pagination_count_off(self):
+        for i in range(1, 4):
+            self.assert200(self.client.post('/type', data={"name": "T{}".format(i)}))
+
+        response = self.client.get('/type?count=off')
+        self.assert200(response)
+        self.assertEqual(3, len(response.json))
+        self.assertNotIn('X-Total-Count', response.headers)
+        self.assertNotIn('rel="last"', response.headers['Link'])
+
+    def test_keyset_pagination_null_keys(self):
+        type_id = self.client.post('/type', data={"name": "x-ray"}).json["$id"]
+        for i in range(1, 12):
+            self.client.post('/machine', data={"name": "Machine {}".format(i),
+                                               "wattage": None if i % 3 == 0 else i % 2,
+                                               "type": type_id})
+
+        def pages(uri, direction):
+            names = []
+            while uri:
+                response = self.client.get(uri)
+                self.assert200(response)
+                page = [item['name'] for item in response.json]
+                names = names + page if direction == 'next' else page + names
+                links = dict(reversed(link.split('; ')) for link in response.headers['Link'].split(','))
+                uri = links.get('rel="{}"'.format(direction), '')[1:-1]
+            return names
+
+        for reverse in (False, True):
+            machines = [(None if i % 3 == 0 else i % 2, i) for i in range(1, 12)]
+            expected = ['Machine {}'.format(i) for wattage, i in sorted(
+                machines, key=lambda m: (m[0] is not None, m[0] or 0, m[1] if not reverse else -m[1]), reverse=reverse)]
+
+            sort = '{{"wattage": {}}}'.format('true' if reverse else 'false')
+            self.assertEqual(expected, pages('/machine?sort={}&per_page=2&after='.format(sort), 'next'))
+            self.assertEqual(expected, pages('/machine?sort={}&per_page=2&before='.format(sort), 'prev'))
+
     def test_update(self):
         response = self.client.post('/type', data={"name": "T1"})
         type1_id = response.json["$id"]
@@ -391,6 +391,116 @@ class PrincipalTestCase(BaseTestCase):
         self.mock_user = {'id': 4}
         self.assertEqual([], self.client.get('/book').json)
 
+    def test_item_need_read_cached_total(self):
+
+        class BookResource(PrincipalResource):
+            class Meta:
+                model = self.BOOK
+                permissions = {
+                    'read': ['owns-copy', 'admin'],
+                    'create': 'admin',
+                    'owns-copy': 'owns-copy'
+                }
+
+        self.api.add_resource(BookResource)
+
+        self.mock_user = {'id': 1, 'roles': ['admin']}
+
+        for i in range(5):
+            self.client.post('/book', data={'title': 'GoT Vol. {}'.format(i + 1)})
+
+        response = self.client.get('/book?per_page=2&count=cached')
+        self.assertEqual('5', response.headers['X-Total-Count'])
+
+        self.mock_user = {'id': 2, 'needs': [ItemNeed('owns-copy', i, 'book') for i in (1, 2, 4)]}
+        response = self.client.get('/book?per_page=2&count=cached')
+        self.assertEqual('3', response.headers['X-Total-Count'])
+
+        self.mock_user = {'id': 1, 'roles': ['admin']}
+        self.client.post('/book', data={'title': 'GoT Vol. 6'})
+        response = self.client.get('/book?per_page=2&count=cached')
+        self.assertEqual('6', response.headers['X-Total-Count'])
+
+    def test_item_need_read_cache(self):
+
+        class BookResource(PrincipalResource):
+            class Meta:
+                model = self.BOOK
+                cache = True
+                permissions = {
+                    'read': ['owns-copy', 'admin'],
+                    'create': 'admin',
+                    'owns-copy': 'owns-copy'
+                }
+
+        self.api.add_resource(BookResource)
+
+        self.mock_user = {'id': 1, 'roles': ['admin']}
+
+        for i in range(3):
+            self.client.post('/book', data={'title': 'GoT Vol. {}'.format(i + 1)})
+
+        self.assert200(self.client.get('/book/2'))
+        self.assertEqual(3, len(self.client.get('/book').json))
+
+        self.mock_user = {'id': 2, 'needs': [ItemNeed('owns-copy', 1, 'book')]}
+        self.assert404(self.client.get('/book/2'))
+        self.assertEqual([{'$uri': '/book/1', 'title': 'GoT Vol. 1'}], self.client.get('/book').json)
+        self.assert200(self.client.get('/book/1'))
+
+        # entries of every identity are invalidated when an item changes
+        self.mock_user = {'id': 1, 'roles': ['admin']}
+        self.assert200(self.client.patch('/book/1', data={'title': 'GoT Vol. I'}))
+
+        self.mock_user = {'id': 2, 'needs': [ItemNeed('owns-copy', 1, 'book')]}
+        self.assertEqual('GoT Vol. I', self.client.get('/book/1').json['title'])
+        self.assertEqual([{'$uri': '/book/1', 'title': 'GoT Vol. I'}], self.client.get('/book').json)
+
+    def test_embed_read_permission(self):
+
+        class UserResource(PrincipalResource):
+            class Schema:
+                books = fields.ToMany('book', io='r')
+
+            class Meta:
+                model = self.USER
+                permissions = {
+                    'read': ['self', 'admin'],
+                    'create': 'admin',
+                    'self': 'self'
+                }
+
+        class BookResource(PrincipalResource):
+            class Schema:
+                author = fields.ToOne('user')
+
+            class Meta:
+                model = self.BOOK
+                permissions = {
+                    'create': 'admin'
+                }
+
+        self.api.add_resource(UserResource)
+        self.api.add_resource(BookResource)
+
+        self.mock_user = {'id': 1, 'roles': ['admin']}
+        self.client.post('/user', data={'name': 'Admin'})
+        self.client.post('/user', data={'name': 'Author'})
+        self.client.post('/book', data={'title': 'Foo', 'author': {'$ref': '/user/1'}})
+        self.client.post('/book', data={'title': 'Bar', 'author': {'$ref': '/user/2'}})
+
+        self.mock_user = {'id': 2, 'needs': [ItemNeed('self', 2, 'user')]}
+        self.assertEqual([
+            {'$uri': '/book/1', 'title': 'Foo', 'author': {'$ref': '/user/1'}},
+            {'$uri': '/book/2', 'title': 'Bar', 'author': {
+                '$uri': '/user/2',
+                'name': 'Author',
+                'books': [{'$ref': '/book/2'}]
+            }}
+        ], self.client.get('/book?embed=author').json)
+
+        self.assertEqual({'$ref': '/user/1'}, self.client.get('/book/1?embed=author').json['author'])
+
     def test_relationship(self):
         "should require update permission on parent resource for updating, read permissions on both"
 
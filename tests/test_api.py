@@ -237,3 +237,76 @@ class ApiTestCase(BaseTestCase):
                                  }
                              ],
                          }, response.json)
+
+    def test_schema_cache(self):
+        class BookResource(ModelResource):
+            class Meta:
+                name = "book"
+                model = "book"
+                manager = MemoryManager
+
+        class AuthorResource(ModelResource):
+            class Meta:
+                name = "author"
+                model = "author"
+                manager = MemoryManager
+
+        self.app.debug = False  # allow adding routes after the first request
+        api = Api(self.app)
+        api.add_resource(BookResource)
+
+        calls = []
+        schema_factory = BookResource.routes['instances'].schema_factory
+        BookResource.routes['instances'].schema_factory = lambda resource: calls.append(resource) or schema_factory(resource)
+
+        response = self.client.get("/book/schema")
+        self.assert200(response)
+        etag = response.headers['ETag']
+        self.assertEqual(1, len(calls))
+
+        self.assertEqual(response.data, self.client.get("/book/schema").data)
+        self.assertEqual(1, len(calls))
+
+        response = self.client.get("/book/schema", headers={"If-None-Match": etag})
+        self.assertStatus(response, 304)
+
+        response = self.client.get("/schema")
+        self.assertEqual(["book"], list(response.json["properties"]))
+        schema_etag = response.headers['ETag']
+
+        api.add_resource(AuthorResource)
+
+        response = self.client.get("/schema", headers={"If-None-Match": schema_etag})
+        self.assert200(response)
+        self.assertEqual(["author", "book"], sorted(response.json["properties"]))
+
+        self.client.get("/book/schema")
+        self.assertEqual(2, len(calls))
+
+    def test_item_url_matcher(self):
+        api = Api(self.app, prefix='/api')
+
+        class BookResource(ModelResource):
+            class Meta:
+                name = "book"
+                model = "book"
+                manager = MemoryManager
+
+            @Route.GET
+            def genres(self):
+                return ['fiction', 'non-fiction']
+
+        api.add_resource(BookResource)
+        matcher = BookResource.item_url_matcher
+
+        self.assertEqual(1, matcher.match('/api/book/1'))
+        self.assertEqual(None, matcher.match('/api/book/genres'))
+        self.assertEqual(None, matcher.match('/api/book/schema'))
+        self.assertEqual(None, matcher.match('/api/book/x'))
+        self.assertEqual(None, matcher.match('/api/book/1/rating'))
+        self.assertEqual(None, matcher.match('http://localhost/api/book/1'))
+
+        with self.app.test_request_context('/api/book'):
+            # urls that are not matched directly are matched using the url map
+            self.assertEqual(1, BookResource.schema.fields['$uri'].converter('/api/book/1'))
+            self.assertEqual(2, BookResource.schema.fields['$uri'].converter('http://localhost/api/book/2'))
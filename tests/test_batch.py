@@ -0,0 +1,125 @@
+from flask import request, Response
+
+from flask_potion import Api, fields
+from flask_potion.contrib.memory import MemoryManager
+from flask_potion.resource import ModelResource
+from flask_potion.routes import Relation
+from tests import BaseTestCase
+
+
+class BatchTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(BatchTestCase, self).setUp()
+        self.api = Api(self.app, prefix='/api', batch=True)
+
+        class Book(ModelResource):
+            class Schema:
+                title = fields.String()
+                rating = fields.Integer(nullable=True)
+
+            class Meta:
+                name = "book"
+                model = name
+                manager = MemoryManager
+
+            sequels = Relation('self')
+
+        self.api.add_resource(Book)
+
+    def test_batch(self):
+        response = self.client.post('/api/batch', data={
+            "operations": [
+                {"method": "POST", "path": "/api/book", "body": {"title": "Foo"}},
+                {"method": "POST", "path": "/api/book", "body": {"title": "Bar", "rating": 4}},
+                {"method": "PATCH", "path": "/api/book/1", "body": {"rating": 5}},
+                {"method": "POST", "path": "/api/book/1/sequels", "body": {"$ref": "/api/book/2"}},
+                {"method": "GET", "path": '/api/book?where={"rating": {"$gt": 4}}'},
+                {"method": "DELETE", "path": "/api/book/2"}
+            ]
+        })
+
+        self.assert200(response)
+        self.assertEqual([200, 200, 200, 200, 200, 204], [result['status'] for result in response.json])
+        self.assertEqual({"$uri": "/api/book/1", "title": "Foo", "rating": 5}, response.json[2]['body'])
+        self.assertEqual({"$ref": "/api/book/2"}, response.json[3]['body'])
+        self.assertEqual([{"$uri": "/api/book/1", "title": "Foo", "rating": 5}], response.json[4]['body'])
+        self.assertEqual('1', response.json[4]['headers']['X-Total-Count'])
+        self.assertEqual(None, response.json[5]['body'])
+
+        response = self.client.get('/api/book')
+        self.assertEqual([{"$uri": "/api/book/1", "title": "Foo", "rating": 5}], response.json)
+
+    def test_batch_errors(self):
+        response = self.client.post('/api/batch', data={
+            "operations": [
+                {"method": "GET", "path": "/api/book/1"},
+                {"method": "POST", "path": "/api/book", "body": {"title": 1}},
+                {"method": "GET", "path": "/api/missing"},
+                {"method": "POST", "path": "/api/batch", "body": {"operations": []}},
+                {"method": "POST", "path": "/api/book", "body": {"title": "Foo"}}
+            ]
+        })
+
+        self.assert200(response)
+        self.assertEqual([404, 400, 404, 400, 200], [result['status'] for result in response.json])
+        self.assertEqual({"$id": 1, "$type": "book"}, response.json[0]['body']['item'])
+
+        response = self.client.post('/api/batch', data={
+            "stop_on_error": True,
+            "operations": [
+                {"method": "POST", "path": "/api/book", "body": {"title": "Bar"}},
+                {"method": "GET", "path": "/api/book/5"},
+                {"method": "POST", "path": "/api/book", "body": {"title": "Baz"}}
+            ]
+        })
+
+        self.assertEqual([200, 404], [result['status'] for result in response.json])
+        self.assertEqual(2, len(self.client.get('/api/book').json))
+
+    def test_batch_atomic_unsupported(self):
+        response = self.client.post('/api/batch', data={
+            "atomic": True,
+            "operations": [{"method": "POST", "path": "/api/book", "body": {"title": "Foo"}}]
+        })
+
+        self.assert400(response)
+        self.assertEqual([], self.client.get('/api/book').json)
+
+    def test_batch_request_hooks(self):
+        paths = []
+
+        @self.app.before_request
+        def deny_delete():
+            paths.append(request.path)
+            if request.method == 'DELETE':
+                return Response(status=403)
+
+        @self.app.after_request
+        def add_header(response):
+            response.headers['X-Hooked'] = 'yes'
+            return response
+
+        response = self.client.post('/api/batch', data={
+            "operations": [
+                {"method": "POST", "path": "/api/book", "body": {"title": "Foo"}},
+                {"method": "DELETE", "path": "/api/book/1"}
+            ]
+        })
+
+        self.assertEqual(['/api/batch', '/api/book', '/api/book/1'], paths)
+        self.assertEqual([200, 403], [result['status'] for result in response.json])
+        self.assertEqual('yes', response.json[0]['headers']['X-Hooked'])
+        self.assertEqual(1, len(self.client.get('/api/book').json))
+
+    def test_batch_invalid(self):
+        response = self.client.post('/api/batch', data={"operations": [{"method": "GET"}]})
+        self.assert400(response)
+
+        response = self.client.post('/api/batch', data={"operations": [{"method": "FOO", "path": "/api/book"}]})
+        self.assert400(response)
+
+    def test_batch_disabled(self):
+        app = self.create_app()
+        Api(app, prefix='/api')
+        self.assert404(app.test_client().post('/api/batch', data={"operations": []}))
@@ -0,0 +1,26 @@
+from unittest import TestCase
+from flask_potion.cache import LocalCache
+
+
+class LocalCacheTestCase(TestCase):
+
+    def test_local_cache(self):
+        cache = LocalCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2, timeout=0)
+
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(None, cache.get('b'))
+
+        cache.set('c', 3, timeout=60)
+        self.assertEqual(1, cache.get('a'))
+
+        # the least recently used entry is discarded
+        cache.set('d', 4)
+        self.assertEqual(None, cache.get('c'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(4, cache.get('d'))
+
+        cache.delete('d')
+        self.assertEqual(None, cache.get('d'))
+        self.assertEqual((5, 2, 2, 1), cache.info())
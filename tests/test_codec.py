@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+from collections import OrderedDict
+from datetime import datetime, date
+import decimal
+import uuid
+
+from flask_potion import Api, fields
+from flask_potion.codec import JSONCodec, FastJSONCodec
+from flask_potion.contrib.memory import MemoryManager
+from flask_potion.resource import ModelResource
+from flask_potion.routes import Route
+from flask_potion.schema import FieldSet
+from tests import BaseTestCase
+
+CONFORMANCE_VALUES = [
+    None,
+    True,
+    0,
+    -12345678901234567890,
+    1.5,
+    1e-7,
+    1e21,
+    "",
+    "plain",
+    "ünïcødé ☃ \U0001f600",
+    "quotes \" and \\ backslashes \n\t\x00",
+    [],
+    {},
+    [1, [2, [3, []]], {"a": None}],
+    {"b": 1, "a": 2, "c": {"z": [], "y": {}}},
+    OrderedDict([("z", 1), ("a", 2), ("$uri", "/foo/1")]),
+    [OrderedDict([("$uri", "/foo/{}".format(i)), ("name", "item {}".format(i)), ("tags", ["x", "y"])])
+     for i in range(50)],
+    {"date": date(2016, 2, 29), "datetime": datetime(2016, 2, 29, 12, 30, 15)},
+    {"uuid": uuid.UUID("8c1d7c47-3f0e-4d70-a1f1-58e1a7d0f6a5")},
+]
+
+
+class CodecConformanceTestCase(BaseTestCase):
+
+    def assertParity(self, **settings):
+        default, fast = JSONCodec(), FastJSONCodec()
+
+        for value in CONFORMANCE_VALUES:
+            self.assertEqual(default.dumps(value, **dict(settings)),
+                             fast.dumps(value, **dict(settings)),
+                             value)
+
+    def test_dumps_parity(self):
+        self.assertParity()
+
+    def test_dumps_parity_debug_settings(self):
+        self.assertParity(indent=4, sort_keys=True)
+
+    def test_dumps_parity_unsorted(self):
+        self.app.config['JSON_SORT_KEYS'] = False
+        self.assertParity()
+
+    def test_dumps_parity_not_ascii(self):
+        self.app.config['JSON_AS_ASCII'] = False
+        self.assertParity()
+
+    def test_dumps_parity_custom_encoder(self):
+        class Point(object):
+            def __init__(self, x, y):
+                self.x, self.y = x, y
+
+        class Encoder(self.app.json_encoder):
+            def default(self, o):
+                if isinstance(o, Point):
+                    return [o.x, o.y]
+                return super(Encoder, self).default(o)
+
+        self.app.json_encoder = Encoder
+        value = {"point": Point(1, 2)}
+        self.assertEqual(JSONCodec().dumps(value), FastJSONCodec().dumps(value))
+
+    def test_dumps_parity_custom_encoder_overrides(self):
+        class Encoder(self.app.json_encoder):
+            def default(self, o):
+                if isinstance(o, datetime):
+                    return o.isoformat()
+                if isinstance(o, decimal.Decimal):
+                    return str(o)
+                return super(Encoder, self).default(o)
+
+        self.app.json_encoder = Encoder
+        value = {"datetime": datetime(2020, 1, 1), "decimal": decimal.Decimal('1.10000000000000000001')}
+        self.assertEqual('{"datetime": "2020-01-01T00:00:00", "decimal": "1.10000000000000000001"}',
+                         FastJSONCodec().dumps(value))
+        self.assertEqual(JSONCodec().dumps(value), FastJSONCodec().dumps(value))
+
+    def test_loads_parity(self):
+        default, fast = JSONCodec(), FastJSONCodec()
+
+        for value in CONFORMANCE_VALUES[:17]:
+            encoded = default.dumps(value)
+            self.assertEqual(default.loads(encoded), fast.loads(encoded))
+            self.assertEqual(default.loads(encoded.encode('utf-8')), fast.loads(encoded.encode('utf-8')))
+
+        with self.assertRaises(ValueError):
+            fast.loads('{"a": }')
+
+    def test_decimal_and_bytes(self):
+        codec = FastJSONCodec()
+        self.assertEqual('{"a": 1.25, "b": "AAH/"}', codec.dumps({"a": decimal.Decimal('1.25'), "b": b'\x00\x01\xff'}))
+
+        self.assertEqual('{"a": "12345678901234567890.123"}',
+                         codec.dumps({"a": decimal.Decimal('12345678901234567890.123')}))
+
+        with self.assertRaises(TypeError):
+            codec.dumps({"a": object()})
+
+
+class ApiCodecTestCase(BaseTestCase):
+
+    def create_app(self):
+        app = super(ApiCodecTestCase, self).create_app()
+        app.debug = False
+        return app
+
+    def _create_api(self, **kwargs):
+        api = Api(self.app, **kwargs)
+
+        class Book(ModelResource):
+            class Schema:
+                title = fields.String()
+                year = fields.Integer(nullable=True)
+                tags = fields.Array(fields.String)
+
+            class Meta:
+                name = "book"
+                model = name
+                manager = MemoryManager
+
+            @Route.GET('/echo', schema=FieldSet({"value": fields.Any()}), response_schema=fields.Any())
+            def echo(self, value):
+                return value
+
+        api.add_resource(Book)
+        return api
+
+    def _requests(self):
+        responses = []
+
+        for i in range(10):
+            responses.append(self.client.post('/book', data={"title": "Book {} ☃".format(i), "tags": ["a", "b"]}))
+
+        responses.append(self.client.get('/book?per_page=5&sort={"title": true}'))
+        responses.append(self.client.get('/book?where={"title": {"$startswith": "Book 1"}}'))
+        responses.append(self.client.get('/book/1'))
+        responses.append(self.client.patch('/book/1', data={"year": 1999}))
+        responses.append(self.client.get('/book/echo?value={"b": [1, 2], "a": null}'))
+        responses.append(self.client.post('/book', data='{"title": ', content_type='application/json'))
+        responses.append(self.client.get('/book/99'))
+        responses.append(self.client.get('/book?where={"title": '))
+        responses.append(self.client.get('/schema'))
+
+        return [(response.status_code, response.headers.get('Content-Type'), response.data)
+                for response in responses]
+
+    def test_codec_argument(self):
+        api = self._create_api(codec=FastJSONCodec)
+        self.assertIsInstance(api.codec, FastJSONCodec)
+
+    def test_codec_config(self):
+        self.app.config['POTION_JSON_CODEC'] = FastJSONCodec
+        api = self._create_api()
+        self.assertIsInstance(api.codec, FastJSONCodec)
+
+    def test_response_parity(self):
+        self._create_api()
+        expected = self._requests()
+
+        self.app = self.create_app()
+        self._create_api(codec=FastJSONCodec())
+        self.client = self.app.test_client()
+        self.assertEqual(expected, self._requests())
@@ -1,7 +1,12 @@
 import unittest
+from flask import request
 from flask_potion import Api, fields
+from flask_potion.exceptions import InvalidJSON
+from flask_potion.instances import Instances, IterablePagination
 from flask_potion.contrib.memory.manager import MemoryManager
 from flask_potion.resource import ModelResource
+from flask_potion.routes import ItemRoute, Relation
+from flask_potion.schema import FieldSet
 from tests import BaseTestCase
 
 
@@ -48,8 +53,189 @@ class RelationTestCase(BaseTestCase):
                          '</person?page=3&per_page=20>; rel="last"', response.headers['Link'])
         self.assertJSONEqual([{"$uri": "/person/{}".format(i), "name": str(i)} for i in range(41, 51)], response.json)
 
+    def test_pagination_count(self):
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "person"
+                model = name
+                manager = MemoryManager
+                total_count = 'off'
+
+        self.api.add_resource(Person)
+
+        for i in range(1, 51):
+            self.client.post('/person', data={"name": str(i)})
+
+        response = self.client.get('/person?page=2')
+        self.assert200(response)
+        self.assertEqual(None, response.headers.get('X-Total-Count'))
+        self.assertEqual('</person?page=2&per_page=20>; rel="self",'
+                         '</person?page=1&per_page=20>; rel="first",'
+                         '</person?page=1&per_page=20>; rel="prev",'
+                         '</person?page=3&per_page=20>; rel="next"', response.headers['Link'])
+
+        response = self.client.get('/person?page=3')
+        self.assertEqual('</person?page=3&per_page=20>; rel="self",'
+                         '</person?page=1&per_page=20>; rel="first",'
+                         '</person?page=2&per_page=20>; rel="prev"', response.headers['Link'])
+
+        response = self.client.get('/person?page=3&count=exact')
+        self.assertEqual('50', response.headers.get('X-Total-Count'))
+
+        response = self.client.get('/person?count=foo')
+        self.assert400(response)
+
+
+
+    def test_sparse_fieldsets(self):
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+                rank = fields.Integer()
+
+            class Meta:
+                name = "person"
+                model = name
+                manager = MemoryManager
+
+        self.api.add_resource(Person)
+        self.client.post('/person', data={"name": "Jane", "rank": 1})
+
+        response = self.client.get('/person?fields=rank')
+        self.assert200(response)
+        self.assertJSONEqual([{"$uri": "/person/1", "rank": 1}], response.json)
+
+        response = self.client.get('/person/1?fields=name,rank')
+        self.assertJSONEqual({"$uri": "/person/1", "name": "Jane", "rank": 1}, response.json)
 
+        response = self.client.patch('/person/1?fields=name', data={"rank": 2})
+        self.assertJSONEqual({"$uri": "/person/1", "name": "Jane"}, response.json)
 
+        response = self.client.get('/person/1?fields=age')
+        self.assert400(response)
+        self.assertEqual('Unknown fields: age', response.json['message'])
+
+    def test_sparse_fieldsets_custom_route(self):
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+                rank = fields.Integer()
+
+            class Meta:
+                name = "person"
+                model = name
+                manager = MemoryManager
+
+            @ItemRoute.GET(schema=FieldSet({'fields': fields.String()}), response_schema=fields.Inline('self'))
+            def promoted(self, person, fields):
+                return dict(person, rank=person['rank'] + len(fields.split(',')))
+
+        self.api.add_resource(Person)
+        self.client.post('/person', data={"name": "Jane", "rank": 1})
+
+        # the query string of a custom route is not a selection of fields
+        response = self.client.get('/person/1/promoted?fields=a,b')
+        self.assert200(response)
+        self.assertJSONEqual({"$uri": "/person/1", "name": "Jane", "rank": 3}, response.json)
+
+    def test_embed(self):
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+                mother = fields.ToOne('person', nullable=True)
+                friends = fields.ToMany('person')
+
+            class Meta:
+                name = "person"
+                model = name
+                manager = MemoryManager
+
+        self.api.add_resource(Person)
+        self.client.post('/person', data={"name": "Ann", "mother": None})
+        self.client.post('/person', data={"name": "Bob", "mother": {"$ref": "/person/1"}})
+        self.client.post('/person', data={"name": "Cid", "mother": {"$ref": "/person/2"},
+                                          "friends": [{"$ref": "/person/1"}]})
+
+        response = self.client.get('/person/3?embed=mother.mother,friends')
+        self.assert200(response)
+        self.assertJSONEqual({
+            "$uri": "/person/3",
+            "name": "Cid",
+            "mother": {
+                "$uri": "/person/2",
+                "name": "Bob",
+                "mother": {"$uri": "/person/1", "name": "Ann", "mother": None, "friends": []},
+                "friends": []
+            },
+            "friends": [{"$uri": "/person/1", "name": "Ann", "mother": None, "friends": []}]
+        }, response.json)
+
+        response = self.client.get('/person?embed=mother&fields=mother')
+        self.assertJSONEqual([
+            {"$uri": "/person/1", "mother": None},
+            {"$uri": "/person/2", "mother": {"$uri": "/person/1", "name": "Ann", "mother": None, "friends": []}},
+            {"$uri": "/person/3", "mother": {"$uri": "/person/2", "name": "Bob", "mother": {"$ref": "/person/1"},
+                                             "friends": []}}
+        ], response.json)
+
+        self.assert400(self.client.get('/person?embed=name'))
+        self.assert400(self.client.get('/person?embed=mother.mother.mother'))
+
+    def test_keyset_pagination(self):
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+                rank = fields.Integer()
+
+            class Meta:
+                name = "person"
+                model = name
+                manager = MemoryManager
+
+        self.api.add_resource(Person)
+        self.client.post('/person', data=[{"name": str(i), "rank": i % 4} for i in range(1, 24)])
+
+        def links(response):
+            return {rel[5:-1]: uri[1:-1] for uri, rel in (link.split('; ') for link in response.headers['Link'].split(','))}
+
+        expected = sorted(range(1, 24), key=lambda i: (-(i % 4), i))
+
+        response = self.client.get('/person?sort={"rank": true}&per_page=5&after=')
+        self.assert200(response)
+        self.assertIsNone(response.headers.get('X-Total-Count'))
+        self.assertNotIn('prev', links(response))
+
+        names = []
+        while True:
+            names += [int(item['name']) for item in response.json]
+            if 'next' not in links(response):
+                break
+            self.assertIn('sort=', links(response)['next'])
+            response = self.client.get(links(response)['next'])
+
+        self.assertEqual(expected, names)
+
+        response = self.client.get(links(response)['last'])
+        names = []
+        while True:
+            names = [int(item['name']) for item in response.json] + names
+            if 'prev' not in links(response):
+                break
+            response = self.client.get(links(response)['prev'])
+
+        self.assertEqual(expected, names)
+
+        response = self.client.get('/person?after=')
+        self.assertEqual(list(range(1, 21)), [int(item['name']) for item in response.json])
+
+        response = self.client.get('/person?after=foo')
+        self.assert400(response)
+
+        response = self.client.get('/person?after=&before=')
+        self.assert400(response)
 
     def test_where_to_one(self):
         class Person(ModelResource):
@@ -108,3 +294,160 @@ class RelationTestCase(BaseTestCase):
         self.assertJSONEqual([
             {'$uri': '/person/5', 'mother': {'$ref': '/person/2'}, 'name': 'Clare'}
         ], response.json)
+
+    def test_parse_request_cache(self):
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+                mother = fields.ToOne('person', nullable=True)
+
+            class Meta:
+                name = "person"
+                model = name
+                manager = MemoryManager
+
+        self.api.add_resource(Person)
+        self.client.post('/person', data={'name': 'Anna'})
+
+        instances = Instances().bind(Person)
+
+        def parse(query_string):
+            with self.app.test_request_context('/person', query_string=query_string):
+                return instances.parse_request(request)
+
+        first = parse({'where': '{"name": {"$startswith": "A"}}', 'sort': '{"name": true}'})
+        second = parse({'where': '{"name": {"$startswith": "A"}}', 'sort': '{"name": true}', 'fields': 'name'})
+
+        self.assertEqual((1, 1, 500, 1), instances.cache_info())
+        self.assertEqual(first['where'], second['where'])
+        self.assertEqual(None, first['fields'])
+        self.assertEqual(('name',), second['fields'])
+
+        parse({'where': '{"name": {"$startswith": "A"}}', 'page': '2'})
+        self.assertEqual((1, 2, 500, 2), instances.cache_info())
+
+        # conditions that resolve references are not cached
+        parse({'where': '{"mother": {"$ref": "/person/1"}}'})
+        parse({'where': '{"mother": {"$ref": "/person/1"}}'})
+        self.assertEqual((1, 4, 500, 2), instances.cache_info())
+
+        # the same query string is parsed again for an application with other defaults
+        self.app.config['POTION_DEFAULT_PER_PAGE'] = 5
+        self.assertEqual(5, parse({'where': '{"name": {"$startswith": "A"}}', 'page': '2'})['per_page'])
+        self.assertEqual((1, 5, 500, 3), instances.cache_info())
+
+        with self.app.test_request_context('/person', query_string={'where': '{"name": '}):
+            with self.assertRaises(InvalidJSON):
+                instances.parse_request(request)
+
+
+class IterablePaginationTestCase(unittest.TestCase):
+
+    def test_iterable_pagination(self):
+        items = ({'id': i, 'group': i % 3} for i in range(1, 51))
+        pagination = IterablePagination(items, 3, 20)
+        self.assertEqual(list(range(41, 51)), [item['id'] for item in pagination.items])
+        self.assertEqual(50, pagination.total)
+        self.assertEqual(3, pagination.pages)
+        self.assertFalse(pagination.has_next)
+
+        pagination = IterablePagination(iter(range(1, 51)), 2, 20, count=False)
+        self.assertEqual(list(range(21, 41)), pagination.items)
+        self.assertIsNone(pagination.total)
+        self.assertTrue(pagination.has_next)
+
+        items = [{'id': i, 'group': i % 3} for i in range(1, 51)]
+        sort = [(None, 'group', True), (None, 'id', False)]
+        pagination = IterablePagination(iter(items), 2, 5, sort=sort)
+        expected = sorted(sorted(items, key=lambda item: item['id']), key=lambda item: item['group'], reverse=True)
+        self.assertEqual(expected[5:10], pagination.items)
+        self.assertEqual(50, pagination.total)
+        self.assertTrue(pagination.has_next)
+
+
+class StreamingTestCase(BaseTestCase):
+
+    def setUp(self):
+        super(StreamingTestCase, self).setUp()
+        self.api = Api(self.app)
+
+    def _create_resource(self, streaming):
+        class Person(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "person"
+                model = name
+                manager = MemoryManager
+
+            friends = Relation('self')
+
+        Person.meta.streaming = streaming
+        self.api.add_resource(Person)
+
+        for i in range(1, 31):
+            self.client.post('/person', data={"name": str(i)})
+
+        for i in range(2, 5):
+            self.client.post('/person/1/friends', data={"$ref": "/person/{}".format(i)})
+
+    def test_stream_json(self):
+        self._create_resource(streaming=True)
+
+        response = self.client.get('/person?page=2&per_page=5')
+        self.assert200(response)
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual('application/json', response.mimetype)
+        self.assertEqual('30', response.headers['X-Total-Count'])
+        self.assertIn('rel="next"', response.headers['Link'])
+        self.assertJSONEqual([{"$uri": "/person/{}".format(i), "name": str(i)} for i in range(6, 11)], response.json)
+
+        response = self.client.get('/person?where={"name": "foo"}')
+        self.assertEqual(b'[]', response.data)
+
+        response = self.client.get('/person/1/friends')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertJSONEqual([{"$ref": "/person/{}".format(i)} for i in range(2, 5)], response.json)
+
+    def test_stream_json_matches_unstreamed_response(self):
+        self.app.debug = False
+        self._create_resource(streaming=False)
+        expected = self.client.get('/person?per_page=5').data
+
+        self.api.resources['person'].meta.streaming = True
+        response = self.client.get('/person?per_page=5')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(expected, response.data)
+
+    def test_stream_ndjson(self):
+        self._create_resource(streaming=False)
+
+        response = self.client.get('/person?per_page=3', headers={'Accept': 'application/x-ndjson'})
+        self.assert200(response)
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual('application/x-ndjson', response.mimetype)
+        self.assertEqual(b'{"$uri": "/person/1", "name": "1"}\n'
+                         b'{"$uri": "/person/2", "name": "2"}\n'
+                         b'{"$uri": "/person/3", "name": "3"}\n', response.data)
+
+        response = self.client.get('/person?per_page=3', headers={'Accept': 'application/json'})
+        self.assertIn('Content-Length', response.headers)
+        self.assertEqual(3, len(response.json))
+
+    def test_stream_selects_fields_once(self):
+        self._create_resource(streaming=True)
+
+        schema = self.api.resources['person'].schema
+        select, calls = schema.select, []
+        schema.select = lambda *args: calls.append(args) or select(*args)
+
+        selections = []
+        for per_page in (3, 20):
+            del calls[:]
+            response = self.client.get('/person?fields=name&per_page={}'.format(per_page))
+            self.assertEqual(per_page, len(response.json))
+            selections.append(len(calls))
+
+        # the fields are selected for the page, not for each of its items
+        self.assertEqual(selections[0], selections[1])
@@ -102,7 +102,7 @@ class ModelResourceTestCase(BaseTestCase):
             link for link in data['links'] if link['rel'] == 'create']
         [update_link] = [
             link for link in data['links'] if link['rel'] == 'update']
-        self.assertEqual({'$ref': '#'}, create_link['schema'])
+        self.assertEqual({'anyOf': [{'$ref': '#'}, {'type': 'array', 'items': {'$ref': '#'}}]}, create_link['schema'])
         self.assertEqual({
                              "type": "object",
                              "additionalProperties": False,
@@ -114,3 +114,201 @@ class ModelResourceTestCase(BaseTestCase):
                          }, update_link["schema"])
         self.assertEqual(
             ["$uri", "name", "slug"],  sorted(data["properties"].keys()))
+
+    def test_create_many(self):
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+                secret = fields.String(io="c")
+
+            class Meta:
+                name = "foo"
+
+        self.api.add_resource(FooResource)
+
+        response = self.client.post("/foo", data=[
+            {"name": "Foo", "secret": "mystery"},
+            {"name": "Bar", "secret": "riddle"}
+        ])
+
+        self.assert200(response)
+        self.assertEqual([
+            {"$uri": "/foo/1", "name": "Foo"},
+            {"$uri": "/foo/2", "name": "Bar"}
+        ], response.json)
+
+        self.assertEqual({"id": 2, "name": "Bar", "secret": "riddle"}, FooResource.manager.items[2])
+
+        response = self.client.post("/foo", data=[
+            {"name": "Baz", "secret": "enigma"},
+            {"name": 1, "secret": "puzzle"}
+        ])
+
+        self.assert400(response)
+        self.assertEqual([1, 'name'], response.json['errors'][0]['path'])
+        self.assertEqual(2, len(self.client.get("/foo").json))
+
+        response = self.client.post("/foo", data=[])
+        self.assert200(response)
+        self.assertEqual([], response.json)
+
+    def test_update_and_destroy_where(self):
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+                rank = fields.Integer(nullable=True)
+
+            class Meta:
+                name = "foo"
+                bulk_routes = True
+
+        self.api.add_resource(FooResource)
+        self.client.post("/foo", data=[{"name": "Foo", "rank": 1}, {"name": "Bar", "rank": 2}, {"name": "Baz"}])
+
+        response = self.client.patch('/foo?where={"name": {"$startswith": "Ba"}}', data={"rank": 5})
+        self.assert200(response)
+        self.assertEqual(2, response.json)
+        self.assertEqual([1, 5, 5], [item["rank"] for item in self.client.get("/foo").json])
+
+        response = self.client.patch('/foo?where={"name": "Foo"}', data={"rank": "high"})
+        self.assert400(response)
+
+        response = self.client.patch('/foo', data={"rank": 3})
+        self.assert400(response)
+
+        response = self.client.delete('/foo')
+        self.assert400(response)
+
+        response = self.client.delete('/foo?where={"rank": 5}')
+        self.assert200(response)
+        self.assertEqual(2, response.json)
+        self.assertEqual(["Foo"], [item["name"] for item in self.client.get("/foo").json])
+
+        response = self.client.delete('/foo?where={}')
+        self.assertEqual(1, response.json)
+        self.assertEqual([], self.client.get("/foo").json)
+
+    def test_update_and_destroy_where_not_published(self):
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "foo"
+
+        class BarResource(ModelResource):
+            class Schema:
+                name = fields.String()
+                is_archived = fields.Boolean(io="r", default=False)
+
+            class Meta:
+                name = "bar"
+                bulk_routes = True
+                exclude_routes = ['destroy']
+
+            @ModelResource.read.PATCH(rel="update")
+            def update(self, properties, id):
+                return self.manager.update(self.manager.read(id), dict(properties, is_archived=False))
+
+        self.api.add_resource(FooResource)
+        self.api.add_resource(BarResource)
+        self.client.post("/foo", data={"name": "Foo"})
+        self.client.post("/bar", data={"name": "Bar"})
+
+        self.assert405(self.client.delete('/foo?where={}'))
+        self.assert405(self.client.patch('/foo?where={}', data={"name": "Baz"}))
+        self.assertEqual(1, len(self.client.get("/foo").json))
+
+        self.assertNotIn('destroyWhere', BarResource.routes)
+        self.assertNotIn('updateWhere', BarResource.routes)
+        self.assert405(self.client.delete('/bar?where={}'))
+        self.assertEqual(1, len(self.client.get("/bar").json))
+
+    def test_etag(self):
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+
+            class Meta:
+                name = "foo"
+                etag = True
+
+        self.api.add_resource(FooResource)
+
+        self.client.post("/foo", data={"name": "Foo"})
+
+        response = self.client.get("/foo/1")
+        self.assert200(response)
+        etag = response.headers['ETag']
+
+        response = self.client.get("/foo/1", headers={'If-None-Match': etag})
+        self.assertStatus(response, 304)
+        self.assertEqual(b'', response.data)
+
+        response = self.client.get("/foo", headers={'If-None-Match': etag})
+        self.assert200(response)
+
+        response = self.client.get("/foo", headers={'If-None-Match': response.headers['ETag']})
+        self.assertStatus(response, 304)
+
+        self.client.patch("/foo/1", data={"name": "Bar"})
+
+        response = self.client.get("/foo/1", headers={'If-None-Match': etag})
+        self.assert200(response)
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+    def test_etag_attribute(self):
+        from datetime import datetime
+
+        class FooResource(ModelResource):
+            class Schema:
+                name = fields.String()
+                version = fields.Integer(io="r")
+                updated_at = fields.DateTime(io="r")
+
+            class Meta:
+                name = "foo"
+                etag = True
+                etag_attribute = "version"
+                last_modified_attribute = "updated_at"
+
+        self.api.add_resource(FooResource)
+
+        FooResource.manager.items[1] = {"id": 1, "name": "Foo", "version": 3,
+                                        "updated_at": datetime(2016, 1, 1, 12, 0, 0)}
+
+        response = self.client.get("/foo/1")
+        self.assert200(response)
+        self.assertEqual('"1:3"', response.headers['ETag'])
+        self.assertEqual('Fri, 01 Jan 2016 12:00:00 GMT', response.headers['Last-Modified'])
+
+        reads = []
+        read = FooResource.manager.read
+        FooResource.manager.read = lambda id, **kwargs: reads.append(id) or read(id, **kwargs)
+
+        response = self.client.get("/foo/1", headers={'If-None-Match': '"1:3"'})
+        self.assertStatus(response, 304)
+        self.assertEqual('"1:3"', response.headers['ETag'])
+
+        response = self.client.get("/foo/1", headers={'If-Modified-Since': 'Sat, 02 Jan 2016 00:00:00 GMT'})
+        self.assertStatus(response, 304)
+        self.assertEqual([], reads)
+
+        response = self.client.get("/foo/1", headers={'If-None-Match': '"1:2"'})
+        self.assert200(response)
+        self.assertEqual("Foo", response.json["name"])
+        self.assertEqual([1], reads)
+
+        # other representations of the item have other ETags
+        response = self.client.get("/foo/1?fields=name", headers={'If-None-Match': '"1:3"'})
+        self.assert200(response)
+        self.assertEqual({"$uri": "/foo/1", "name": "Foo"}, response.json)
+        etag = response.headers['ETag']
+        self.assertNotEqual('"1:3"', etag)
+
+        response = self.client.get("/foo/1?fields=name", headers={'If-None-Match': etag})
+        self.assertStatus(response, 304)
+
+        response = self.client.get("/foo/2", headers={'If-None-Match': '"1:3"'})
+        self.assert404(response)
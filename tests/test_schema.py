@@ -134,6 +134,30 @@ class SchemaTestCase(TestCase):
             }).format({"number": 42, "constant": "constant", "secret": "secret"})
         )
 
+    def test_fieldset_format_item_types(self):
+        class Item(object):
+            def __init__(self, **kwargs):
+                self.__dict__.update(kwargs)
+
+        fs = FieldSet({
+            "name": fields.String(),
+            "count": fields.Integer(attribute="n", default=0),
+            "tags": fields.Array(fields.String()),
+            "labels": fields.Array(fields.String(), nullable=True),
+            "ratio": fields.Number(nullable=True),
+        })
+
+        expected = {"name": "foo", "count": 1, "tags": ["a"], "labels": [], "ratio": None}
+        self.assertEqual(expected, fs.format({"name": "foo", "n": 1, "tags": ("a",)}))
+        self.assertEqual(expected, fs.format(Item(name="foo", n=1, tags=("a",))))
+
+        self.assertEqual({"name": None, "count": 0, "tags": [], "labels": ["b"], "ratio": 0.5},
+                         fs.format(Item(labels=["b"], ratio="0.5")))
+        self.assertEqual({"name": "foo"}, dict(fs.format({"name": "foo"}, fields=("name",))))
+
+        fs.set("name", fields.Boolean())
+        self.assertEqual(True, fs.format({"name": "foo"})["name"])
+
     def test_fieldset_schema_io(self):
         fs = FieldSet({
             "id": fields.Number(io='r'),
@@ -0,0 +1,101 @@
+from unittest import TestCase
+from flask import Flask
+from jsonschema import Draft4Validator, FormatChecker
+from flask_potion import fields
+from flask_potion.exceptions import ValidationError
+from flask_potion.schema import FieldSet
+from flask_potion.validation import Validator, compile_schema
+
+
+class ValidationTestCase(TestCase):
+
+    def assertAgreesWithDraft4(self, schema, instances):
+        is_valid = compile_schema(schema, FormatChecker())
+        validator = Draft4Validator(schema, format_checker=FormatChecker())
+
+        for instance in instances:
+            self.assertEqual(validator.is_valid(instance), is_valid(instance), (schema, instance))
+
+    def test_compile_field_schemas(self):
+        values = [None, True, False, 0, 1, 2, 1.5, -3, "", "a", "abcdef", "2015-01-01", [], [1, 2], [1, 1],
+                  ["a", "b"], {}, {"a": 1}, {"$date": 1}, {"$ref": "/foo/1"}]
+
+        for field in (fields.Raw({}),
+                      fields.Any(),
+                      fields.String(),
+                      fields.String(min_length=2, max_length=5, nullable=True),
+                      fields.String(pattern="^[a-c]+$"),
+                      fields.String(enum=["a", "b"]),
+                      fields.Integer(minimum=0, maximum=2),
+                      fields.Integer(default=1, nullable=True),
+                      fields.Number(minimum=0, maximum=2, exclusive_minimum=True, exclusive_maximum=True),
+                      fields.Boolean(),
+                      fields.Date(),
+                      fields.DateString(),
+                      fields.Uri(),
+                      fields.Array(fields.Integer, min_items=1, max_items=2, unique=True),
+                      fields.Array(fields.String, nullable=True),
+                      fields.Object(fields.Integer),
+                      fields.Object({"a": fields.Integer(), "b": fields.String()}),
+                      fields.Object(pattern_properties={"^[a-z]$": fields.Integer()}),
+                      fields.Raw({"enum": [0, 1, True]}),
+                      fields.Raw({"type": "array", "items": [{"type": "integer"}], "additionalItems": False}),
+                      fields.Raw({"anyOf": [{"type": "string"}, {"type": "integer"}]}),
+                      fields.Raw({"oneOf": [{"type": "number"}, {"type": "integer"}]}),
+                      fields.Raw({"allOf": [{"minimum": 1}, {"maximum": 1.5}]}),
+                      fields.Raw({"not": {"type": "object"}, "multipleOf": 2})):
+            self.assertAgreesWithDraft4(field.request, values)
+
+    def test_validator_not_compilable(self):
+        schema = {"type": "array", "items": {"$ref": "#/definitions/foo"}, "definitions": {"foo": {"type": "integer"}}}
+        validator = Validator(schema)
+
+        self.assertFalse(validator.compiled)
+        self.assertTrue(validator.is_valid([1, 2]))
+        self.assertFalse(validator.is_valid([1, "2"]))
+        self.assertTrue(Validator({"type": "integer"}).compiled)
+
+    def test_fieldset_convert(self):
+        fs = FieldSet({
+            "id": fields.Integer(io='r'),
+            "name": fields.String(attribute='title'),
+            "date": fields.Date(nullable=True),
+            "rank": fields.Integer(default=5),
+            "tags": fields.Array(fields.String, io='c'),
+        })
+
+        self.assertEqual({"title": "foo", "date": None, "rank": 5, "tags": []}, fs.convert({"name": "foo"}))
+        self.assertEqual({"title": "foo", "date": None, "rank": 1, "tags": ["a"]},
+                         fs.convert({"name": "foo", "rank": 1, "tags": ["a"]}))
+        self.assertEqual({"rank": 2}, fs.convert({"rank": 2}, update=True, patchable=True))
+        self.assertEqual({"name": "bar", "date": None, "rank": 5},
+                         fs.convert({"name": "foo"}, update=True, pre_resolved_properties={"name": "bar"}))
+        self.assertEqual({"title": 1, "date": None, "rank": 5}, fs.convert({"name": 1}, update=True, validate=False))
+
+    def test_fieldset_convert_errors(self):
+        fs = FieldSet({
+            "name": fields.String(min_length=2),
+            "rank": fields.Integer(default=5),
+        })
+
+        validator = Draft4Validator(fs.request)
+
+        with Flask(__name__).app_context():
+            for instance in ({}, {"name": "a"}, {"name": "foo", "rank": "1"}, {"name": "foo", "foo": 1}, []):
+                with self.assertRaises(ValidationError) as cx:
+                    fs.convert(instance)
+
+                self.assertEqual(ValidationError(validator.iter_errors(instance)).as_dict(), cx.exception.as_dict())
+
+            with self.assertRaises(ValidationError) as cx:
+                fs.convert({"name": "a", "rank": None})
+
+            errors = cx.exception.as_dict()
+            self.assertEqual({
+                'errors': [
+                    {'path': ('name',), 'validationOf': {'minLength': 2}},
+                    {'path': ('rank',), 'validationOf': {'type': 'integer'}}
+                ],
+                'message': 'Bad Request',
+                'status': 400
+            }, dict(errors, errors=sorted(errors['errors'], key=lambda error: error['path'])))